@@ -33,7 +33,7 @@ def create_app(config_name=None):
     CORS(app, origins=app.config['CORS_ORIGINS'], supports_credentials=True)
     
     # Import models (this ensures they are registered with SQLAlchemy)
-    from .models import User, EmailAccount, Email
+    from .models import User, EmailAccount, Email, ClassificationJob, AIRateLimit, ClassificationCache, EmailFingerprint
     
     # Health check endpoints (before blueprints)
     @app.route('/api/health')
@@ -98,6 +98,14 @@ def create_app(config_name=None):
     from .routes.auth import auth_callback
     app.add_url_rule('/auth/callback', 'auth_callback', auth_callback, methods=['GET', 'POST'])
     
+    # Drain the classification queue from web processes unless a separate worker does it
+    if app.config.get('CLASSIFICATION_INLINE_WORKER'):
+        from .services.classification_worker import start_background_worker
+        
+        @app.before_request
+        def ensure_classification_worker():
+            start_background_worker(app)
+    
     # Error handlers
     @app.errorhandler(404)
     def not_found(error):
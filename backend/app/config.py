@@ -51,12 +51,96 @@ class Config:
     OPENAI_MODEL = os.environ.get('OPENAI_MODEL', 'gpt-4o-mini')
     OPENAI_MAX_TOKENS = int(os.environ.get('OPENAI_MAX_TOKENS', 1000))
     OPENAI_TEMPERATURE = float(os.environ.get('OPENAI_TEMPERATURE', 0.3))
+    OPENAI_REQUESTS_PER_MINUTE = float(os.environ.get('OPENAI_REQUESTS_PER_MINUTE', 60))
+    OPENAI_TOKENS_PER_MINUTE = float(os.environ.get('OPENAI_TOKENS_PER_MINUTE', 60000))
     
     # Gemini Configuration
     GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY') or 'your-gemini-api-key-here'
     GEMINI_MODEL = os.environ.get('GEMINI_MODEL', 'gemini-1.5-flash')
     GEMINI_MAX_TOKENS = int(os.environ.get('GEMINI_MAX_TOKENS', 1000))
     GEMINI_TEMPERATURE = float(os.environ.get('GEMINI_TEMPERATURE', 0.3))
+    GEMINI_REQUESTS_PER_MINUTE = float(os.environ.get('GEMINI_REQUESTS_PER_MINUTE', 15))
+    GEMINI_TOKENS_PER_MINUTE = float(os.environ.get('GEMINI_TOKENS_PER_MINUTE', 32000))
+    
+    # Concurrent prompts per classify_batch call (paced by the per-minute limits above)
+    AI_MAX_CONCURRENCY = int(os.environ.get('AI_MAX_CONCURRENCY', 4))
+    
+    # Schema-constrained JSON answers, and the output-token cap per classified email (~150 needed)
+    AI_STRUCTURED_OUTPUT = os.environ.get('AI_STRUCTURED_OUTPUT', 'true').lower() == 'true'
+    AI_OUTPUT_TOKENS_PER_EMAIL = int(os.environ.get('AI_OUTPUT_TOKENS_PER_EMAIL', 200))
+    
+    # Rate limits shared by all worker processes: auto (PostgreSQL table, else lock file), database, file or memory
+    AI_RATE_LIMIT_BACKEND = os.environ.get('AI_RATE_LIMIT_BACKEND', 'auto')
+    AI_RATE_LIMIT_FILE = os.environ.get('AI_RATE_LIMIT_FILE')  # Defaults to a file in the temp dir
+    AI_RATE_LIMIT_MAX_RETRIES = int(os.environ.get('AI_RATE_LIMIT_MAX_RETRIES', 3))
+    AI_RATE_LIMIT_MAX_WAIT_SECONDS = float(os.environ.get('AI_RATE_LIMIT_MAX_WAIT_SECONDS', 60))  # Longer Retry-After fails the call
+    AI_REQUEST_TIMEOUT_SECONDS = float(os.environ.get('AI_REQUEST_TIMEOUT_SECONDS', 30))  # OpenAI SDK timeout (Gemini 0.3.2 has none)
+    
+    # Per-provider circuit breakers, shared like the rate limits (backend defaults to AI_RATE_LIMIT_BACKEND)
+    # Opens when errors and slow calls reach the failure threshold of the rolling window; probes again after the cooldown
+    AI_CIRCUIT_BREAKER_BACKEND = os.environ.get('AI_CIRCUIT_BREAKER_BACKEND')
+    AI_CIRCUIT_BREAKER_FILE = os.environ.get('AI_CIRCUIT_BREAKER_FILE')  # Defaults to a file in the temp dir
+    AI_CIRCUIT_BREAKER_WINDOW_SECONDS = float(os.environ.get('AI_CIRCUIT_BREAKER_WINDOW_SECONDS', 60))
+    AI_CIRCUIT_BREAKER_MIN_CALLS = int(os.environ.get('AI_CIRCUIT_BREAKER_MIN_CALLS', 5))
+    AI_CIRCUIT_BREAKER_FAILURE_THRESHOLD = float(os.environ.get('AI_CIRCUIT_BREAKER_FAILURE_THRESHOLD', 0.5))
+    AI_CIRCUIT_BREAKER_SLOW_CALL_SECONDS = float(os.environ.get('AI_CIRCUIT_BREAKER_SLOW_CALL_SECONDS', 20))
+    AI_CIRCUIT_BREAKER_COOLDOWN_SECONDS = float(os.environ.get('AI_CIRCUIT_BREAKER_COOLDOWN_SECONDS', 30))
+    
+    # Hedged single-email classification (/<email_id>/classify): when the healthiest provider has not answered
+    # by this percentile of its recent latencies, the email also goes to the other one and the first answer wins
+    AI_HEDGING_ENABLED = os.environ.get('AI_HEDGING_ENABLED', 'false').lower() == 'true'
+    AI_HEDGE_PERCENTILE = float(os.environ.get('AI_HEDGE_PERCENTILE', 95))
+    AI_HEDGE_DEFAULT_DELAY_SECONDS = float(os.environ.get('AI_HEDGE_DEFAULT_DELAY_SECONDS', 2.0))  # Until 20 latencies are known
+    AI_HEDGE_MAX_RATIO = float(os.environ.get('AI_HEDGE_MAX_RATIO', 0.1))  # Hedges per classified email, at most
+    
+    # Classification cache (repeated / bulk-mailed content skips the AI call)
+    CLASSIFICATION_CACHE_ENABLED = os.environ.get('CLASSIFICATION_CACHE_ENABLED', 'true').lower() == 'true'
+    CLASSIFICATION_CACHE_TTL_HOURS = float(os.environ.get('CLASSIFICATION_CACHE_TTL_HOURS', 72))
+    CLASSIFICATION_CACHE_MAX_ENTRIES = int(os.environ.get('CLASSIFICATION_CACHE_MAX_ENTRIES', 5000))  # LRU eviction above this
+    
+    # Near-duplicate detection (SimHash; 8 LSH bands find every match up to 7 differing bits)
+    NEAR_DUPLICATE_ENABLED = os.environ.get('NEAR_DUPLICATE_ENABLED', 'true').lower() == 'true'
+    NEAR_DUPLICATE_MAX_DISTANCE = int(os.environ.get('NEAR_DUPLICATE_MAX_DISTANCE', 7))
+    NEAR_DUPLICATE_MIN_TOKENS = int(os.environ.get('NEAR_DUPLICATE_MIN_TOKENS', 8))  # Shorter emails are not fingerprinted
+    
+    # Local classifier (hashed n-gram logistic regression, trained with train_local_classifier.py)
+    LOCAL_CLASSIFIER_ENABLED = os.environ.get('LOCAL_CLASSIFIER_ENABLED', 'true').lower() == 'true'
+    LOCAL_CLASSIFIER_PATH = os.environ.get('LOCAL_CLASSIFIER_PATH') or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'local_classifier.npz')
+    LOCAL_CLASSIFIER_THRESHOLD = float(os.environ.get('LOCAL_CLASSIFIER_THRESHOLD', 0.9))  # Less confident emails go to the AI provider
+    LOCAL_CLASSIFIER_HASH_BITS = int(os.environ.get('LOCAL_CLASSIFIER_HASH_BITS', 18))
+    LOCAL_CLASSIFIER_MIN_TRAINING_ROWS = int(os.environ.get('LOCAL_CLASSIFIER_MIN_TRAINING_ROWS', 200))
+    LOCAL_CLASSIFIER_CORRECTION_WEIGHT = float(os.environ.get('LOCAL_CLASSIFIER_CORRECTION_WEIGHT', 2.0))  # /update-urgency labels vs. AI labels
+    LOCAL_CLASSIFIER_KEEP_VERSIONS = int(os.environ.get('LOCAL_CLASSIFIER_KEEP_VERSIONS', 5))  # Saved model versions kept to roll back to
+    
+    # Online learning: the worker feeds new corrections and AI answers to the local classifier between retrainings
+    LOCAL_CLASSIFIER_ONLINE_LEARNING = os.environ.get('LOCAL_CLASSIFIER_ONLINE_LEARNING', 'true').lower() == 'true'
+    LOCAL_CLASSIFIER_ONLINE_INTERVAL_SECONDS = float(os.environ.get('LOCAL_CLASSIFIER_ONLINE_INTERVAL_SECONDS', 300))
+    LOCAL_CLASSIFIER_ONLINE_MIN_EXAMPLES = int(os.environ.get('LOCAL_CLASSIFIER_ONLINE_MIN_EXAMPLES', 20))  # Fewer new labels wait for the next run
+    LOCAL_CLASSIFIER_ONLINE_MAX_EXAMPLES = int(os.environ.get('LOCAL_CLASSIFIER_ONLINE_MAX_EXAMPLES', 5000))  # Per run
+    LOCAL_CLASSIFIER_ONLINE_RESCAN_IDS = int(os.environ.get('LOCAL_CLASSIFIER_ONLINE_RESCAN_IDS', 1000))  # Label ids re-checked below the last learned one, for late commits
+    
+    # Header rules at ingest: bulk mail (List-Unsubscribe, Precedence, known mailers) is classified low and
+    # auto-replies processed straight from internetMessageHeaders, without queueing them for the AI
+    HEADER_RULES_ENABLED = os.environ.get('HEADER_RULES_ENABLED', 'true').lower() == 'true'
+    
+    # Sender reputation priors: a sender (or domain) with enough classifications, nearly all in one category and
+    # rarely corrected, gets that category without an AI call; a sample still goes to the AI to catch drift
+    SENDER_PRIOR_ENABLED = os.environ.get('SENDER_PRIOR_ENABLED', 'true').lower() == 'true'
+    SENDER_PRIOR_MIN_SAMPLES = int(os.environ.get('SENDER_PRIOR_MIN_SAMPLES', 20))
+    SENDER_PRIOR_MIN_SHARE = float(os.environ.get('SENDER_PRIOR_MIN_SHARE', 0.9))  # Of the top category
+    SENDER_PRIOR_MAX_ERROR_RATE = float(os.environ.get('SENDER_PRIOR_MAX_ERROR_RATE', 0.1))  # Corrections, and audits that disagreed
+    SENDER_PRIOR_AUDIT_RATE = float(os.environ.get('SENDER_PRIOR_AUDIT_RATE', 0.05))
+    
+    # Classification cascade in AIService: rules -> sender priors -> local classifier -> lightweight prompt -> full prompt
+    # A stage answers when its confidence reaches the threshold (local uses LOCAL_CLASSIFIER_THRESHOLD)
+    CASCADE_RULES_THRESHOLD = float(os.environ.get('CASCADE_RULES_THRESHOLD', 0.95))  # Rules top out at 0.9 and are uncalibrated, so off by default
+    CASCADE_LIGHTWEIGHT_ENABLED = os.environ.get('CASCADE_LIGHTWEIGHT_ENABLED', 'true').lower() == 'true'
+    CASCADE_LIGHTWEIGHT_THRESHOLD = float(os.environ.get('CASCADE_LIGHTWEIGHT_THRESHOLD', 0.85))
+    
+    # Offline reclassification through the OpenAI Batch API (reclassify_bulk.py); runs are resumable from their directory
+    BULK_RECLASSIFY_DIR = os.environ.get('BULK_RECLASSIFY_DIR') or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bulk_reclassify')
+    BULK_RECLASSIFY_MAX_REQUESTS = int(os.environ.get('BULK_RECLASSIFY_MAX_REQUESTS', 50000))  # Batch API limit per input file
+    BULK_RECLASSIFY_POLL_SECONDS = float(os.environ.get('BULK_RECLASSIFY_POLL_SECONDS', 60))
     
     # Redis Configuration (for Celery)
     REDIS_URL = os.environ.get('REDIS_URL') or 'redis://localhost:6379/0'
@@ -64,9 +148,47 @@ class Config:
     CELERY_RESULT_BACKEND = REDIS_URL
     
     # Email Processing Configuration
-    MAX_EMAILS_PER_SYNC = 100
+    MAX_EMAILS_PER_SYNC = int(os.environ.get('MAX_EMAILS_PER_SYNC', 1000))  # Per /sync call; fetched and committed page by page
+    SYNC_PAGE_SIZE = int(os.environ.get('SYNC_PAGE_SIZE', 50))  # Messages per Graph page
+    SYNC_FETCH_BODIES = os.environ.get('SYNC_FETCH_BODIES', 'false').lower() == 'true'  # Otherwise bodies are fetched when opened
+    SYNC_FOLDERS = os.environ.get('SYNC_FOLDERS', 'inbox')  # Folders of every account synced by sync_mailboxes.py
+    
+    # Async Graph client: folders and accounts fetched concurrently
+    GRAPH_MAX_CONNECTIONS = int(os.environ.get('GRAPH_MAX_CONNECTIONS', 20))  # Pooled connections in total
+    GRAPH_MAILBOX_CONCURRENCY = int(os.environ.get('GRAPH_MAILBOX_CONCURRENCY', 4))  # Requests in flight per mailbox (Graph allows 4)
+    
+    # Graph retries: throttling (429/503) waits for Retry-After, other transient errors back off with jitter
+    GRAPH_MAX_RETRIES = int(os.environ.get('GRAPH_MAX_RETRIES', 4))
+    GRAPH_RETRY_BASE_SECONDS = float(os.environ.get('GRAPH_RETRY_BASE_SECONDS', 1.0))
+    GRAPH_RETRY_MAX_BACKOFF_SECONDS = float(os.environ.get('GRAPH_RETRY_MAX_BACKOFF_SECONDS', 30))
+    GRAPH_RETRY_MAX_WAIT_SECONDS = float(os.environ.get('GRAPH_RETRY_MAX_WAIT_SECONDS', 60))  # Longer Retry-After: fail and let the caller reschedule
+    
+    # Body prefetch: full bodies of recent urgent mail fetched before anyone opens it
+    BODY_PREFETCH_ENABLED = os.environ.get('BODY_PREFETCH_ENABLED', 'true').lower() == 'true'
+    BODY_PREFETCH_URGENCIES = os.environ.get('BODY_PREFETCH_URGENCIES', 'urgent,high')
+    BODY_PREFETCH_INTERVAL_SECONDS = float(os.environ.get('BODY_PREFETCH_INTERVAL_SECONDS', 60))
+    BODY_PREFETCH_BATCH = int(os.environ.get('BODY_PREFETCH_BATCH', 20))
+    BODY_PREFETCH_MAX_AGE_DAYS = int(os.environ.get('BODY_PREFETCH_MAX_AGE_DAYS', 14))
+    
+    # Mailbox backfill: history imported in receivedDateTime windows, checkpointed per page
+    BACKFILL_DEFAULT_YEARS = int(os.environ.get('BACKFILL_DEFAULT_YEARS', 3))
+    BACKFILL_WINDOW_DAYS = int(os.environ.get('BACKFILL_WINDOW_DAYS', 30))
+    BACKFILL_CONCURRENCY = int(os.environ.get('BACKFILL_CONCURRENCY', 4))  # Windows fetched at once per mailbox (Graph allows 4 concurrent requests)
+    BACKFILL_PAGE_SIZE = int(os.environ.get('BACKFILL_PAGE_SIZE', 100))
+    BACKFILL_LEASE_SECONDS = int(os.environ.get('BACKFILL_LEASE_SECONDS', 120))  # A job not renewed for this long is resumable
+    BACKFILL_MAX_ATTEMPTS = int(os.environ.get('BACKFILL_MAX_ATTEMPTS', 5))  # Per window, before it is marked failed
+    BACKFILL_CLASSIFICATION_PRIORITY = int(os.environ.get('BACKFILL_CLASSIFICATION_PRIORITY', 5))  # Behind regular syncs (3)
     SYNC_INTERVAL_MINUTES = 15
     AI_CLASSIFICATION_BATCH_SIZE = 10
+    DELTA_SYNC_INITIAL_DAYS = int(os.environ.get('DELTA_SYNC_INITIAL_DAYS', 30))  # First delta round window
+    
+    # Classification Job Queue Configuration
+    CLASSIFICATION_INLINE_WORKER = os.environ.get('CLASSIFICATION_INLINE_WORKER', 'true').lower() == 'true'  # Worker thread per web process
+    CLASSIFICATION_WORKER_BATCH_SIZE = int(os.environ.get('CLASSIFICATION_WORKER_BATCH_SIZE', 5))
+    CLASSIFICATION_WORKER_IDLE_SECONDS = float(os.environ.get('CLASSIFICATION_WORKER_IDLE_SECONDS', 5))
+    CLASSIFICATION_LEASE_SECONDS = int(os.environ.get('CLASSIFICATION_LEASE_SECONDS', 300))
+    CLASSIFICATION_MAX_ATTEMPTS = int(os.environ.get('CLASSIFICATION_MAX_ATTEMPTS', 5))
+    CLASSIFICATION_RETRY_BASE_SECONDS = int(os.environ.get('CLASSIFICATION_RETRY_BASE_SECONDS', 30))
     
     # CORS Configuration
     CORS_ORIGINS = [
@@ -113,6 +235,8 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     JWT_ACCESS_TOKEN_EXPIRES = 1  # 1 second for testing
+    CLASSIFICATION_INLINE_WORKER = False
+    AI_RATE_LIMIT_BACKEND = 'memory'
 
 # Configuration dictionary
 config = {
@@ -1,5 +1,14 @@
 from .user import User
 from .email_account import EmailAccount
 from .email import Email
+from .classification_job import ClassificationJob
+from .ai_rate_limit import AIRateLimit
+from .classification_cache import ClassificationCache
+from .email_fingerprint import EmailFingerprint
+from .ai_provider_health import AIProviderHealth
+from .sender_reputation import SenderReputation
+from .classification_label import ClassificationLabel
+from .backfill_job import BackfillJob
+from .backfill_window import BackfillWindow
 
-__all__ = ['User', 'EmailAccount', 'Email']
\ No newline at end of file
+__all__ = ['User', 'EmailAccount', 'Email', 'ClassificationJob', 'AIRateLimit', 'ClassificationCache', 'EmailFingerprint', 'AIProviderHealth', 'SenderReputation', 'ClassificationLabel', 'BackfillJob', 'BackfillWindow']
\ No newline at end of file
@@ -0,0 +1,19 @@
+from datetime import datetime, timezone
+from sqlalchemy import Column, String, DateTime, JSON
+from app import db
+
+class AIProviderHealth(db.Model):
+    """Circuit breaker state of one AI provider, shared by every worker process."""
+    
+    __tablename__ = 'ai_provider_health'
+    
+    # One row per provider ('openai', 'gemini')
+    provider = Column(String(50), primary_key=True)
+    
+    # Breaker state (closed / open / half_open) and rolling outcome buckets, see services/circuit_breaker.py
+    state = Column(JSON, nullable=False, default=dict)
+    
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
+    
+    def __repr__(self):
+        return f'<AIProviderHealth {self.provider}>'
@@ -0,0 +1,32 @@
+from datetime import datetime, timezone
+from sqlalchemy import Column, String, DateTime, Float
+from app import db
+
+class AIRateLimit(db.Model):
+    """Requests/tokens budget of one AI provider, shared by every worker process."""
+    
+    __tablename__ = 'ai_rate_limits'
+    
+    # One row per provider ('openai', 'gemini')
+    provider = Column(String(50), primary_key=True)
+    
+    # Budget left in the current minute (may go negative while callers queue up)
+    requests_available = Column(Float, nullable=False, default=0.0)
+    tokens_available = Column(Float, nullable=False, default=0.0)
+    
+    # Last refill, and Retry-After block from the latest 429 response
+    refilled_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
+    blocked_until = Column(DateTime(timezone=True), nullable=True)
+    
+    def __repr__(self):
+        return f'<AIRateLimit {self.provider}>'
+    
+    def to_dict(self):
+        """Convert rate limit state to dictionary for JSON serialization."""
+        return {
+            'provider': self.provider,
+            'requests_available': self.requests_available,
+            'tokens_available': self.tokens_available,
+            'refilled_at': self.refilled_at.isoformat() if self.refilled_at else None,
+            'blocked_until': self.blocked_until.isoformat() if self.blocked_until else None
+        }
@@ -0,0 +1,85 @@
+import uuid
+from datetime import datetime, timezone
+from sqlalchemy import Column, String, DateTime, Text, ForeignKey, Integer, Float
+from sqlalchemy.orm import relationship
+from app import db
+
+class BackfillJob(db.Model):
+    """Import of a mailbox folder's history, split into receivedDateTime windows."""
+    
+    __tablename__ = 'backfill_jobs'
+    
+    # Primary key using string (for SQLite compatibility)
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    
+    email_account_id = Column(String(36), ForeignKey('email_accounts.id', ondelete='CASCADE'), nullable=False, index=True)
+    folder = Column(String(50), default='inbox', nullable=False)
+    
+    # Time range to import and the window size it is split into
+    range_start = Column(DateTime(timezone=True), nullable=False)
+    range_end = Column(DateTime(timezone=True), nullable=False)
+    window_days = Column(Integer, default=30, nullable=False)
+    
+    state = Column(String(20), default='pending', nullable=False, index=True)  # pending, running, completed, failed
+    last_error = Column(Text, nullable=True)
+    
+    # Lease held by the process running the job; an expired lease means it crashed
+    lease_owner = Column(String(100), nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    
+    # Progress
+    windows_total = Column(Integer, default=0, nullable=False)
+    windows_done = Column(Integer, default=0, nullable=False)
+    windows_failed = Column(Integer, default=0, nullable=False)
+    messages_fetched = Column(Integer, default=0, nullable=False)
+    messages_inserted = Column(Integer, default=0, nullable=False)
+    header_classified = Column(Integer, default=0, nullable=False)
+    classification_queued = Column(Integer, default=0, nullable=False)
+    active_seconds = Column(Float, default=0.0, nullable=False)  # Time spent running, over every resume
+    
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc),
+                       onupdate=lambda: datetime.now(timezone.utc), nullable=False)
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+    
+    windows = relationship('BackfillWindow', back_populates='job', cascade='all, delete-orphan')
+    
+    ACTIVE_STATES = ('pending', 'running')
+    
+    def __repr__(self):
+        return f'<BackfillJob {self.id} {self.state}>'
+    
+    @property
+    def progress(self):
+        return round(self.windows_done / self.windows_total, 3) if self.windows_total else 0.0
+    
+    @property
+    def messages_per_second(self):
+        return round(self.messages_fetched / self.active_seconds, 1) if self.active_seconds else 0.0
+    
+    def to_dict(self):
+        """Convert backfill job object to dictionary for JSON serialization."""
+        return {
+            'id': str(self.id),
+            'email_account_id': str(self.email_account_id),
+            'folder': self.folder,
+            'range_start': self.range_start.isoformat() if self.range_start else None,
+            'range_end': self.range_end.isoformat() if self.range_end else None,
+            'window_days': self.window_days,
+            'state': self.state,
+            'last_error': self.last_error,
+            'windows_total': self.windows_total,
+            'windows_done': self.windows_done,
+            'windows_failed': self.windows_failed,
+            'progress': self.progress,
+            'messages_fetched': self.messages_fetched,
+            'messages_inserted': self.messages_inserted,
+            'header_classified': self.header_classified,
+            'classification_queued': self.classification_queued,
+            'messages_per_second': self.messages_per_second,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+        }
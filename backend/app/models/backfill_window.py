@@ -0,0 +1,44 @@
+from datetime import datetime, timezone
+from sqlalchemy import Column, String, DateTime, Text, ForeignKey, Integer
+from sqlalchemy.orm import relationship
+from app import db
+
+class BackfillWindow(db.Model):
+    """One receivedDateTime window of a backfill job, checkpointed after every page."""
+    
+    __tablename__ = 'backfill_windows'
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    job_id = Column(String(36), ForeignKey('backfill_jobs.id', ondelete='CASCADE'), nullable=False, index=True)
+    
+    # [window_start, window_end)
+    window_start = Column(DateTime(timezone=True), nullable=False)
+    window_end = Column(DateTime(timezone=True), nullable=False)
+    
+    state = Column(String(20), default='pending', nullable=False)  # pending, running, done, failed
+    next_link = Column(Text, nullable=True)  # @odata.nextLink after the last stored page: where a resume starts
+    messages_fetched = Column(Integer, default=0, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    last_error = Column(Text, nullable=True)
+    
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc),
+                       onupdate=lambda: datetime.now(timezone.utc), nullable=False)
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+    
+    job = relationship('BackfillJob', back_populates='windows')
+    
+    def __repr__(self):
+        return f'<BackfillWindow {self.job_id} {self.window_start.date()}..{self.window_end.date()} {self.state}>'
+    
+    def to_dict(self):
+        """Convert window object to dictionary for JSON serialization."""
+        return {
+            'id': self.id,
+            'window_start': self.window_start.isoformat() if self.window_start else None,
+            'window_end': self.window_end.isoformat() if self.window_end else None,
+            'state': self.state,
+            'messages_fetched': self.messages_fetched,
+            'attempts': self.attempts,
+            'last_error': self.last_error,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+        }
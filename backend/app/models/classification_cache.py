@@ -0,0 +1,148 @@
+import re
+import hashlib
+import unicodedata
+from datetime import datetime, timezone, timedelta
+from sqlalchemy import Column, String, DateTime, Integer, JSON, select, delete, func
+from app import db
+
+class ClassificationCache(db.Model):
+    """Classification result cached by normalized email content, model and prompt version."""
+    
+    __tablename__ = 'classification_cache'
+    
+    # sha256 of prompt version, model, sender, subject, body and account prompt
+    cache_key = Column(String(64), primary_key=True)
+    
+    model = Column(String(50), nullable=False)
+    prompt_version = Column(String(20), nullable=False)
+    classification = Column(JSON, nullable=False)
+    hit_count = Column(Integer, default=0, nullable=False)
+    
+    # Timestamps (last_used_at drives LRU eviction, expires_at the TTL)
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
+    last_used_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False, index=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    
+    # Reply/forward prefixes don't change what an email is about
+    SUBJECT_PREFIX_PATTERN = re.compile(r'^((re|rv|fw|fwd)\s*:\s*)+', re.IGNORECASE)
+    
+    def __repr__(self):
+        return f'<ClassificationCache {self.cache_key[:12]} {self.model}>'
+    
+    @staticmethod
+    def _normalize(text):
+        """Lowercase, unify unicode forms and collapse whitespace."""
+        text = unicodedata.normalize('NFKC', text or '').lower()
+        text = text.replace('\u200b', '').replace('\xa0', ' ')
+        return re.sub(r'\s+', ' ', text).strip()
+    
+    @classmethod
+    def make_key(cls, email_data, model_name, prompt_version):
+        """Build the cache key of an email payload for a model and prompt version."""
+        subject = cls.SUBJECT_PREFIX_PATTERN.sub('', cls._normalize(email_data.get('subject')))
+        parts = [
+            prompt_version,
+            model_name,
+            cls._normalize(email_data.get('sender_email')),
+            subject,
+            cls._normalize(email_data.get('body_preview'))
+        ]
+        # Accounts with their own classification instructions get their own entries
+        if email_data.get('account_prompt'):
+            parts.append(cls._normalize(email_data['account_prompt']))
+        return hashlib.sha256('\x1f'.join(parts).encode('utf-8')).hexdigest()
+    
+    @classmethod
+    def lookup(cls, keys):
+        """
+        Get unexpired cached classifications as {cache_key: classification}.
+        
+        Runs in its own transaction so it never commits or rolls back the
+        caller's session; hits get their hit_count and last_used_at bumped.
+        """
+        keys = list(keys)
+        if not keys:
+            return {}
+        
+        table = cls.__table__
+        now = datetime.now(timezone.utc)
+        found = {}
+        
+        with db.engine.begin() as conn:
+            for i in range(0, len(keys), 500):
+                rows = conn.execute(
+                    select(table.c.cache_key, table.c.classification)
+                    .where(table.c.cache_key.in_(keys[i:i + 500]), table.c.expires_at > now)
+                )
+                for cache_key, classification in rows:
+                    found[cache_key] = classification
+            
+            if found:
+                conn.execute(
+                    table.update()
+                    .where(table.c.cache_key.in_(list(found)))
+                    .values(hit_count=table.c.hit_count + 1, last_used_at=now)
+                )
+        
+        return found
+    
+    @classmethod
+    def store(cls, entries, model_name, prompt_version, ttl_hours=72, max_entries=5000):
+        """Save {cache_key: classification} and evict expired and least recently used entries."""
+        if not entries:
+            return
+        
+        table = cls.__table__
+        now = datetime.now(timezone.utc)
+        rows = [{
+            'cache_key': cache_key,
+            'model': model_name,
+            'prompt_version': prompt_version,
+            'classification': classification,
+            'hit_count': 0,
+            'created_at': now,
+            'last_used_at': now,
+            'expires_at': now + timedelta(hours=ttl_hours)
+        } for cache_key, classification in entries.items()]
+        
+        with db.engine.begin() as conn:
+            dialect = conn.dialect.name
+            if dialect == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert
+            elif dialect == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert
+            else:
+                insert = None
+            
+            if insert is not None:
+                stmt = insert(table)
+                conn.execute(stmt.on_conflict_do_update(
+                    index_elements=['cache_key'],
+                    set_={
+                        'classification': stmt.excluded.classification,
+                        'last_used_at': stmt.excluded.last_used_at,
+                        'expires_at': stmt.excluded.expires_at
+                    }
+                ), rows)
+            else:
+                conn.execute(delete(table).where(table.c.cache_key.in_(list(entries))))
+                conn.execute(table.insert(), rows)
+            
+            cls._evict(conn, now, max_entries)
+    
+    @classmethod
+    def _evict(cls, conn, now, max_entries):
+        """Delete expired entries, then the least recently used ones above `max_entries`."""
+        table = cls.__table__
+        conn.execute(delete(table).where(table.c.expires_at <= now))
+        
+        total = conn.execute(select(func.count()).select_from(table)).scalar()
+        if total > max_entries:
+            oldest = select(table.c.cache_key).order_by(table.c.last_used_at).limit(total - max_entries)
+            conn.execute(delete(table).where(table.c.cache_key.in_(oldest.scalar_subquery())))
+    
+    @classmethod
+    def get_stats(cls):
+        """Count cached entries and the hits they served."""
+        entries, hits = db.session.query(func.count(cls.cache_key), func.coalesce(func.sum(cls.hit_count), 0)).one()
+        return {'entries': entries, 'hits': int(hits)}
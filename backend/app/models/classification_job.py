@@ -0,0 +1,181 @@
+import uuid
+import random
+from datetime import datetime, timezone, timedelta
+from sqlalchemy import Column, String, DateTime, Text, ForeignKey, Integer, or_, and_
+from app import db
+
+class ClassificationJob(db.Model):
+    """Persistent queue entry for classifying one email outside the HTTP request."""
+    
+    __tablename__ = 'classification_jobs'
+    
+    # Primary key using string (for SQLite compatibility)
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    
+    # Email to classify and its account (for per-user queries)
+    email_id = Column(String(36), ForeignKey('emails.id', ondelete='CASCADE'), nullable=False, index=True)
+    email_account_id = Column(String(36), ForeignKey('email_accounts.id', ondelete='CASCADE'), nullable=False, index=True)
+    
+    # Queue state
+    state = Column(String(20), default='queued', nullable=False, index=True)  # queued, leased, done, failed
+    priority = Column(Integer, default=3, nullable=False)  # Lower runs first, same scale as priority_level
+    attempts = Column(Integer, default=0, nullable=False)
+    max_attempts = Column(Integer, default=5, nullable=False)
+    not_before = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False, index=True)
+    last_error = Column(Text, nullable=True)
+    
+    # Lease held by the worker currently processing the job
+    lease_owner = Column(String(100), nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc),
+                       onupdate=lambda: datetime.now(timezone.utc), nullable=False)
+    completed_at = Column(DateTime(timezone=True), nullable=True)
+    
+    ACTIVE_STATES = ('queued', 'leased')
+    
+    def __repr__(self):
+        return f'<ClassificationJob {self.id} {self.state}>'
+    
+    def to_dict(self):
+        """Convert job object to dictionary for JSON serialization."""
+        return {
+            'id': str(self.id),
+            'email_id': str(self.email_id),
+            'state': self.state,
+            'priority': self.priority,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'not_before': self.not_before.isoformat() if self.not_before else None,
+            'last_error': self.last_error,
+            'lease_expires_at': self.lease_expires_at.isoformat() if self.lease_expires_at else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+        }
+    
+    def complete(self):
+        """Mark job as done and release its lease (caller commits)."""
+        self.state = 'done'
+        self.last_error = None
+        self.lease_owner = None
+        self.lease_expires_at = None
+        self.completed_at = datetime.now(timezone.utc)
+    
+    def retry_later(self, error, base_delay=30, max_delay=3600):
+        """Requeue job with exponential backoff, or fail it when out of attempts (caller commits)."""
+        self.last_error = error
+        self.lease_owner = None
+        self.lease_expires_at = None
+        
+        if self.attempts >= self.max_attempts:
+            self.state = 'failed'
+            self.completed_at = datetime.now(timezone.utc)
+            return
+        
+        delay = min(base_delay * (2 ** max(self.attempts - 1, 0)), max_delay)
+        delay += random.uniform(0, delay * 0.1)  # Jitter so retries don't line up
+        self.state = 'queued'
+        self.not_before = datetime.now(timezone.utc) + timedelta(seconds=delay)
+    
+    @classmethod
+    def enqueue(cls, emails, priority=3, max_attempts=5):
+        """
+        Queue classification jobs for emails (caller commits).
+        
+        Emails that already have an active job keep it. Returns the active job of
+        every given email.
+        """
+        emails = list(emails)
+        email_ids = [email.id for email in emails]
+        
+        active_jobs = {}
+        for i in range(0, len(email_ids), 500):
+            for job in cls.query.filter(
+                cls.email_id.in_(email_ids[i:i + 500]),
+                cls.state.in_(cls.ACTIVE_STATES)
+            ):
+                active_jobs[job.email_id] = job
+        
+        jobs = []
+        for email in emails:
+            job = active_jobs.get(email.id)
+            if not job:
+                job = cls(
+                    id=str(uuid.uuid4()),
+                    email_id=email.id,
+                    email_account_id=email.email_account_id,
+                    priority=priority,
+                    max_attempts=max_attempts,
+                    not_before=datetime.now(timezone.utc)
+                )
+                db.session.add(job)
+                active_jobs[email.id] = job
+            jobs.append(job)
+        
+        return jobs
+    
+    @classmethod
+    def _claimable(cls, now):
+        """Filter for jobs that are due, or whose lease expired (crashed worker)."""
+        return or_(
+            and_(cls.state == 'queued', cls.not_before <= now),
+            and_(cls.state == 'leased', cls.lease_expires_at < now)
+        )
+    
+    @classmethod
+    def claim(cls, worker_id, limit=5, lease_seconds=300):
+        """
+        Lease up to `limit` due jobs for a worker and commit the lease.
+        
+        PostgreSQL uses SELECT ... FOR UPDATE SKIP LOCKED so concurrent workers
+        never block on or double-claim the same rows. Other databases (SQLite)
+        fall back to a compare-and-set UPDATE per candidate row.
+        """
+        now = datetime.now(timezone.utc)
+        lease = {
+            'state': 'leased',
+            'lease_owner': worker_id,
+            'lease_expires_at': now + timedelta(seconds=lease_seconds)
+        }
+        query = cls.query.filter(cls._claimable(now)).order_by(cls.priority, cls.not_before)
+        
+        if db.session.get_bind().dialect.name == 'postgresql':
+            jobs = query.limit(limit).with_for_update(skip_locked=True).all()
+            for job in jobs:
+                job.state = lease['state']
+                job.lease_owner = lease['lease_owner']
+                job.lease_expires_at = lease['lease_expires_at']
+                job.attempts += 1
+            db.session.commit()
+            return jobs
+        
+        candidate_ids = [row.id for row in query.with_entities(cls.id).limit(limit * 2)]
+        claimed_ids = []
+        for job_id in candidate_ids:
+            updated = cls.query.filter(cls.id == job_id, cls._claimable(now)).update(
+                dict(lease, attempts=cls.attempts + 1),
+                synchronize_session=False
+            )
+            if updated:
+                claimed_ids.append(job_id)
+                if len(claimed_ids) >= limit:
+                    break
+        db.session.commit()
+        
+        if not claimed_ids:
+            return []
+        return cls.query.filter(cls.id.in_(claimed_ids)).order_by(cls.priority, cls.not_before).all()
+    
+    @classmethod
+    def get_queue_stats(cls, account_ids=None):
+        """Count jobs by state, optionally for some email accounts only."""
+        query = db.session.query(cls.state, db.func.count(cls.id))
+        if account_ids is not None:
+            query = query.filter(cls.email_account_id.in_(account_ids))
+        
+        stats = {'queued': 0, 'leased': 0, 'done': 0, 'failed': 0}
+        for state, count in query.group_by(cls.state).all():
+            stats[state] = count
+        return stats
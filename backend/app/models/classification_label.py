@@ -0,0 +1,49 @@
+from datetime import datetime, timezone
+from sqlalchemy import Column, String, DateTime, ForeignKey, Integer, Float
+from app import db
+
+class ClassificationLabel(db.Model):
+    """Labelled example for the local classifier: a user correction or an AI answer, in arrival order."""
+    
+    __tablename__ = 'classification_labels'
+    
+    SOURCES = ('user', 'ai')
+    
+    # Increasing id: the online learner resumes after the last id it learned from, re-checking recent ids for late commits
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    
+    email_id = Column(String(36), ForeignKey('emails.id', ondelete='CASCADE'), nullable=False, index=True)
+    email_account_id = Column(String(36), ForeignKey('email_accounts.id', ondelete='CASCADE'), nullable=False, index=True)
+    
+    source = Column(String(10), nullable=False)  # 'user' (/update-urgency) or 'ai' (provider answer)
+    label = Column(String(20), nullable=False)
+    weight = Column(Float, default=1.0, nullable=False)
+    
+    # What the email was labelled before a correction
+    previous_label = Column(String(20), nullable=True)
+    previous_model = Column(String(50), nullable=True)
+    
+    # Local model's prediction when the label arrived (agreement metrics), and that model's version
+    local_prediction = Column(String(20), nullable=True)
+    local_confidence = Column(Float, nullable=True)
+    model_version = Column(Integer, nullable=True)
+    
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False, index=True)
+    
+    def __repr__(self):
+        return f'<ClassificationLabel {self.id} {self.source}:{self.label}>'
+    
+    def to_dict(self):
+        """Convert label object to dictionary for JSON serialization."""
+        return {
+            'id': self.id,
+            'email_id': str(self.email_id),
+            'source': self.source,
+            'label': self.label,
+            'previous_label': self.previous_label,
+            'previous_model': self.previous_model,
+            'local_prediction': self.local_prediction,
+            'local_confidence': self.local_confidence,
+            'model_version': self.model_version,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
@@ -1,8 +1,16 @@
 import uuid
+import logging
 from datetime import datetime, timezone
 from sqlalchemy import Column, String, DateTime, Boolean, Text, ForeignKey, Integer, Float, JSON
 from sqlalchemy.orm import relationship
 from app import db
+from app.utils.helpers import extract_email_preview, get_priority_from_urgency
+from app.utils.email_text import compact_email_text
+
+logger = logging.getLogger(__name__)
+
+# classification_model of urgencies set by the user through /update-urgency
+USER_CORRECTION_MODEL = 'user'
 
 class Email(db.Model):
     """Email model for storing email data and AI classifications."""
@@ -26,7 +34,7 @@ class Email(db.Model):
     
     # Email content
     body_preview = Column(Text, nullable=True)  # First 500 chars for preview
-    body_content = Column(Text, nullable=True)  # Full email body
+    body_content = Column(Text, nullable=True)  # Full email body; NULL until fetched when synced metadata-first
     has_attachments = Column(Boolean, default=False, nullable=False)
     attachment_count = Column(Integer, default=0, nullable=False)
     
@@ -134,11 +142,226 @@ class Email(db.Model):
         self.processing_status = 'completed'
         db.session.commit()
     
+    @property
+    def has_body(self):
+        """Whether the full body is stored; metadata-first syncs leave it to be fetched."""
+        return self.body_content is not None
+    
+    def apply_graph_body(self, message):
+        """Store the full body of a Graph message and take the preview from it (caller commits)."""
+        self.body_content = (message.get('body') or {}).get('content', '')
+        preview = extract_email_preview(compact_email_text(self.body_content, source='ingest'), max_length=500)
+        if preview:
+            self.body_preview = preview
+    
+    def apply_classification(self, classification, model_name, status='classified'):
+        """
+        Copy a classification result onto the email (caller commits).
+        
+        `model_name` is recorded unless the result names its own source
+        (e.g. 'cache:gemini-pro' or 'rules').
+        """
+        for column, value in self.classification_values(classification, model_name, status).items():
+            setattr(self, column, value)
+    
+    @staticmethod
+    def classification_values(classification, model_name, status='classified'):
+        """Column values apply_classification sets, for set-based updates of many emails."""
+        urgency_category = classification.get('urgency_category', 'medium')
+        return {
+            'urgency_category': urgency_category,
+            'priority_level': get_priority_from_urgency(urgency_category),
+            'ai_confidence': classification.get('confidence_score', 0.0),
+            'ai_reasoning': classification.get('reasoning', ''),
+            'processing_status': status,
+            'is_classified': True,
+            'classified_at': datetime.now(timezone.utc),
+            'classification_model': classification.get('classification_model') or model_name
+        }
+    
+    def to_classification_payload(self):
+        """Get the fields the AI services classify on."""
+        payload = {
+            'email_id': str(self.id),
+            'email_account_id': self.email_account_id,
+            'subject': self.subject,
+            'sender_name': self.sender_name,
+            'sender_email': self.sender_email,
+            'body_preview': self.body_preview,
+            'received_at': self.received_at.isoformat()
+        }
+        if self.email_account is not None and self.email_account.classification_prompt:
+            payload['account_prompt'] = self.email_account.classification_prompt
+        return payload
+    
     @classmethod
     def find_by_microsoft_id(cls, microsoft_email_id):
         """Find email by Microsoft email ID."""
         return cls.query.filter_by(microsoft_email_id=microsoft_email_id).first()
     
+    @staticmethod
+    def _graph_state_changes(current, message):
+        """Get read/importance/flag values of a Graph message that differ from `current`."""
+        changes = {}
+        
+        # Delta payloads may omit unchanged properties, so only compare what was sent
+        if 'isRead' in message and current['is_read'] != message['isRead']:
+            changes['is_read'] = message['isRead']
+        
+        if 'importance' in message:
+            is_important = message.get('importance', 'normal') == 'high'
+            if current['is_important'] != is_important:
+                changes['is_important'] = is_important
+        
+        if 'flag' in message:
+            flag_status = message.get('flag') or {}
+            is_starred = flag_status.get('flagStatus', 'notFlagged') != 'notFlagged'
+            if current['is_starred'] != is_starred:
+                changes['is_starred'] = is_starred
+        
+        return changes
+    
+    @classmethod
+    def row_from_graph_message(cls, email_account, message):
+        """Build an `emails` table row from a Microsoft Graph message."""
+        now = datetime.now(timezone.utc)
+        sender = message.get('from', {}).get('emailAddress', {})
+        if 'body' in message:
+            body_content = message['body'].get('content', '')
+            preview_source = body_content
+        else:
+            # Metadata-first sync: Graph's bodyPreview now, the body when the email is opened
+            body_content = None
+            preview_source = message.get('bodyPreview', '')
+        
+        return {
+            'id': str(uuid.uuid4()),
+            'email_account_id': email_account.id,
+            'microsoft_email_id': message['id'],
+            'subject': message.get('subject') or '',
+            'sender_name': sender.get('name', ''),
+            'sender_email': sender.get('address', ''),
+            'recipient_emails': email_account.email_address,
+            'body_preview': extract_email_preview(compact_email_text(preview_source, source='ingest'), max_length=500),
+            'body_content': body_content,
+            'has_attachments': message.get('hasAttachments', False),
+            'attachment_count': 0,
+            'received_at': datetime.fromisoformat(message['receivedDateTime'].replace('Z', '+00:00')),
+            'is_read': message.get('isRead', False),
+            'is_starred': (message.get('flag') or {}).get('flagStatus', 'notFlagged') != 'notFlagged',
+            'is_important': message.get('importance', 'normal') == 'high',
+            'is_archived': False,
+            'priority_level': 3,
+            'urgency_category': 'medium',  # Default, will be updated by AI
+            'ai_confidence': 0.0,
+            'is_classified': False,
+            'processing_status': 'pending',
+            'created_at': now,
+            'updated_at': now
+        }
+    
+    @classmethod
+    def bulk_upsert_from_graph(cls, email_account, messages, insert_new=True, chunk_size=500):
+        """
+        Store a batch of Microsoft Graph messages with set-based statements.
+        
+        Existing rows are resolved with one IN query per chunk, new rows go out as a
+        multi-row INSERT ... ON CONFLICT (microsoft_email_id) DO NOTHING and read,
+        importance and flag changes as one executemany UPDATE. The caller commits.
+        
+        Returns a dict with 'inserted', 'updated', 'unchanged' and 'skipped' counts
+        plus 'inserted_rows', the row dicts that were actually inserted.
+        """
+        result = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'skipped': 0, 'inserted_rows': []}
+        
+        # Keep the last occurrence of each message id
+        messages_by_id = {}
+        for message in messages:
+            if message.get('id'):
+                messages_by_id[message['id']] = message
+            else:
+                result['skipped'] += 1
+        
+        message_ids = list(messages_by_id.keys())
+        existing = {}
+        for i in range(0, len(message_ids), chunk_size):
+            rows = db.session.query(
+                cls.id, cls.microsoft_email_id, cls.is_read, cls.is_important, cls.is_starred
+            ).filter(cls.microsoft_email_id.in_(message_ids[i:i + chunk_size])).all()
+            for row in rows:
+                existing[row.microsoft_email_id] = {
+                    'id': row.id,
+                    'is_read': row.is_read,
+                    'is_important': row.is_important,
+                    'is_starred': row.is_starred
+                }
+        
+        now = datetime.now(timezone.utc)
+        new_rows = []
+        update_mappings = []
+        for message_id, message in messages_by_id.items():
+            current = existing.get(message_id)
+            if current:
+                changes = cls._graph_state_changes(current, message)
+                if changes:
+                    changes.update({'id': current['id'], 'updated_at': now})
+                    update_mappings.append(changes)
+                else:
+                    result['unchanged'] += 1
+                continue
+            
+            if not insert_new:
+                continue
+            
+            try:
+                new_rows.append(cls.row_from_graph_message(email_account, message))
+            except (KeyError, ValueError, TypeError) as e:
+                logger.warning(f"Skipping email {message_id} due to error: {str(e)}")
+                result['skipped'] += 1
+        
+        if update_mappings:
+            db.session.bulk_update_mappings(cls, update_mappings)
+            result['updated'] = len(update_mappings)
+        
+        if new_rows:
+            insert = cls._insert_ignoring_duplicates()
+            inserted = 0
+            for i in range(0, len(new_rows), chunk_size):
+                statement = insert(cls.__table__).values(new_rows[i:i + chunk_size])
+                if hasattr(statement, 'on_conflict_do_nothing'):
+                    statement = statement.on_conflict_do_nothing(index_elements=['microsoft_email_id'])
+                inserted += db.session.execute(statement).rowcount
+            result['inserted'] = inserted
+            
+            if inserted == len(new_rows):
+                result['inserted_rows'] = new_rows
+            else:
+                # A concurrent sync stored some of them first - keep only our rows
+                generated_ids = [row['id'] for row in new_rows]
+                stored_ids = set()
+                for i in range(0, len(generated_ids), chunk_size):
+                    stored_ids.update(
+                        row.id for row in db.session.query(cls.id).filter(
+                            cls.id.in_(generated_ids[i:i + chunk_size])
+                        )
+                    )
+                result['inserted_rows'] = [row for row in new_rows if row['id'] in stored_ids]
+                result['unchanged'] += len(new_rows) - len(result['inserted_rows'])
+        
+        return result
+    
+    @staticmethod
+    def _insert_ignoring_duplicates():
+        """Get the dialect-specific insert construct that supports ON CONFLICT."""
+        dialect = db.session.get_bind().dialect.name
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        elif dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy import insert
+        return insert
+    
     @classmethod
     def get_unclassified_emails(cls, limit=10):
         """Get emails that need AI classification."""
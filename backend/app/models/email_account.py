@@ -1,6 +1,6 @@
 import uuid
 from datetime import datetime, timezone
-from sqlalchemy import Column, String, DateTime, Boolean, Text, ForeignKey
+from sqlalchemy import Column, String, DateTime, Boolean, Text, ForeignKey, JSON
 from sqlalchemy.orm import relationship
 from app import db
 
@@ -41,6 +41,7 @@ class EmailAccount(db.Model):
     # Sync metadata
     total_emails_synced = Column(String(20), default='0', nullable=False)
     last_email_date = Column(DateTime(timezone=True), nullable=True)
+    delta_links = Column(JSON, nullable=True)  # Graph deltaLink watermark per mail folder
     
     # Timestamps
     created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
@@ -70,6 +71,7 @@ class EmailAccount(db.Model):
             'auto_classify_enabled': self.auto_classify_enabled,
             'total_emails_synced': self.total_emails_synced,
             'last_email_date': self.last_email_date.isoformat() if self.last_email_date else None,
+            'delta_sync_folders': sorted((self.delta_links or {}).keys()),
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None
         }
@@ -97,6 +99,20 @@ class EmailAccount(db.Model):
             self.last_sync_at = datetime.now(timezone.utc)
         db.session.commit()
     
+    def get_delta_link(self, folder):
+        """Get the stored Graph delta watermark for a mail folder."""
+        return (self.delta_links or {}).get(folder)
+    
+    def set_delta_link(self, folder, delta_link):
+        """Store the Graph delta watermark for a mail folder (caller commits)."""
+        # Reassign the dict so SQLAlchemy detects the JSON change
+        delta_links = dict(self.delta_links or {})
+        if delta_link:
+            delta_links[folder] = delta_link
+        else:
+            delta_links.pop(folder, None)
+        self.delta_links = delta_links
+    
     @classmethod
     def find_by_email_address(cls, email_address):
         """Find email account by email address."""
@@ -0,0 +1,60 @@
+from datetime import datetime, timezone
+from sqlalchemy import Column, String, DateTime, ForeignKey, Integer, Index
+from app import db
+
+class EmailFingerprint(db.Model):
+    """SimHash of an email's content, indexed in LSH bands for near-duplicate lookups."""
+    
+    __tablename__ = 'email_fingerprints'
+    __table_args__ = (
+        Index('ix_email_fingerprints_account_sender', 'email_account_id', 'sender_email'),
+    )
+    
+    BANDS = 8  # 8-bit bands: any two emails within 7 differing bits share at least one band
+    
+    email_id = Column(String(36), ForeignKey('emails.id', ondelete='CASCADE'), primary_key=True)
+    email_account_id = Column(String(36), ForeignKey('email_accounts.id', ondelete='CASCADE'), nullable=False)
+    sender_email = Column(String(255), nullable=False)
+    
+    # 64-bit SimHash as hex, and its eight 8-bit LSH bands
+    simhash = Column(String(16), nullable=False)
+    band_0 = Column(Integer, nullable=False)
+    band_1 = Column(Integer, nullable=False)
+    band_2 = Column(Integer, nullable=False)
+    band_3 = Column(Integer, nullable=False)
+    band_4 = Column(Integer, nullable=False)
+    band_5 = Column(Integer, nullable=False)
+    band_6 = Column(Integer, nullable=False)
+    band_7 = Column(Integer, nullable=False)
+    
+    # Audit link: the email this one inherited its classification from
+    duplicate_of_id = Column(String(36), ForeignKey('emails.id', ondelete='SET NULL'), nullable=True, index=True)
+    hamming_distance = Column(Integer, nullable=True)
+    
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
+    
+    def __repr__(self):
+        return f'<EmailFingerprint {self.email_id} {self.simhash}>'
+    
+    @property
+    def value(self):
+        """SimHash as an integer."""
+        return int(self.simhash, 16)
+    
+    @property
+    def bands(self):
+        return [getattr(self, f'band_{i}') for i in range(self.BANDS)]
+    
+    @classmethod
+    def band_columns(cls):
+        return [getattr(cls, f'band_{i}') for i in range(cls.BANDS)]
+    
+    def to_dict(self):
+        """Convert fingerprint object to dictionary for JSON serialization."""
+        return {
+            'email_id': str(self.email_id),
+            'simhash': self.simhash,
+            'duplicate_of_id': str(self.duplicate_of_id) if self.duplicate_of_id else None,
+            'hamming_distance': self.hamming_distance,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
@@ -0,0 +1,81 @@
+from datetime import datetime, timezone
+from sqlalchemy import Column, String, DateTime, ForeignKey, Integer
+from app import db
+
+class SenderReputation(db.Model):
+    """Urgency distribution of one sender (or sender domain) in an email account, updated on every classification."""
+    
+    __tablename__ = 'sender_reputation'
+    
+    CATEGORIES = ('urgent', 'high', 'medium', 'low')
+    
+    email_account_id = Column(String(36), ForeignKey('email_accounts.id', ondelete='CASCADE'), primary_key=True)
+    kind = Column(String(10), primary_key=True)  # 'sender' (normalized address) or 'domain'
+    key = Column(String(255), primary_key=True)
+    
+    # Classifications seen per urgency category
+    urgent_count = Column(Integer, default=0, nullable=False)
+    high_count = Column(Integer, default=0, nullable=False)
+    medium_count = Column(Integer, default=0, nullable=False)
+    low_count = Column(Integer, default=0, nullable=False)
+    
+    # Urgencies changed by the user through /update-urgency
+    correction_count = Column(Integer, default=0, nullable=False)
+    
+    # AI answers given while the distribution was settled, and how many disagreed with its top category
+    audit_count = Column(Integer, default=0, nullable=False)
+    audit_mismatch_count = Column(Integer, default=0, nullable=False)
+    
+    last_seen_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
+    
+    def __repr__(self):
+        return f'<SenderReputation {self.kind}:{self.key}>'
+    
+    @property
+    def counts(self):
+        return {category: getattr(self, f'{category}_count') or 0 for category in self.CATEGORIES}
+    
+    @property
+    def total(self):
+        return sum(self.counts.values())
+    
+    @property
+    def top_category(self):
+        """(category, share of all classifications), or (None, 0.0) without any."""
+        counts = self.counts
+        total = sum(counts.values())
+        if not total:
+            return None, 0.0
+        category = max(counts, key=counts.get)
+        return category, counts[category] / total
+    
+    @property
+    def correction_rate(self):
+        return self.correction_count / self.total if self.total else 0.0
+    
+    @property
+    def audit_mismatch_rate(self):
+        return self.audit_mismatch_count / self.audit_count if self.audit_count else 0.0
+    
+    def add(self, category, amount=1):
+        """Add to (or, with a negative amount, take from) a category count."""
+        column = f'{category}_count'
+        setattr(self, column, max(0, (getattr(self, column) or 0) + amount))
+    
+    def to_dict(self):
+        """Convert sender statistics to dictionary for JSON serialization."""
+        category, share = self.top_category
+        return {
+            'kind': self.kind,
+            'key': self.key,
+            'counts': self.counts,
+            'total': self.total,
+            'top_category': category,
+            'top_share': round(share, 3),
+            'correction_count': self.correction_count,
+            'correction_rate': round(self.correction_rate, 3),
+            'audit_count': self.audit_count,
+            'audit_mismatch_rate': round(self.audit_mismatch_rate, 3),
+            'last_seen_at': self.last_seen_at.isoformat() if self.last_seen_at else None
+        }
@@ -1,15 +1,34 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.services.microsoft_graph import MicrosoftGraphService
+from app.services.microsoft_graph import MicrosoftGraphService, GraphRequestError
 from app.services.gemini_only_service import GeminiOnlyService
+from app.services.ai_service import AIService
 from app.services.email_processor import EmailProcessor
+from app.services.near_duplicates import NearDuplicateIndex
+from app.services.sender_reputation import SenderReputationIndex, get_sender_prior_stats
+from app.services.header_rules import get_header_rule_stats
+from app.services.email_ingest import ingest_messages, remove_messages
+from app.services.backfill import active_backfill_job, create_backfill_job, start_backfill
+from app.services.body_hydration import hydrate_body, get_body_hydration_stats
+from app.services.graph_http import get_graph_http_stats
+from app.services.classification_cascade import get_cascade_stats
+from app.services.prompts import VALID_URGENCIES, get_parse_stats
+from app.services.prompt_usage import get_prompt_usage_stats
+from app.services.circuit_breaker import get_circuit_breaker
+from app.services.hedging import get_hedge_stats
+from app.services.online_learning import record_ai_labels, record_correction, get_learning_metrics
 from app.models.user import User
-from app.models.email import Email
+from app.models.email import Email, USER_CORRECTION_MODEL
 from app.models.email_account import EmailAccount
+from app.models.classification_job import ClassificationJob
+from app.models.classification_cache import ClassificationCache
+from app.models.backfill_job import BackfillJob
 from app.utils.helpers import extract_email_preview, get_priority_from_urgency
+from app.utils.email_text import get_compaction_stats
 from app import db
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import logging
+import requests
 
 logger = logging.getLogger(__name__)
 emails_bp = Blueprint('emails', __name__)
@@ -22,6 +41,158 @@ def emails_status():
         'message': 'Email management system is running'
     })
 
+def _delta_pages(service, email_account, folder, page_size):
+    """Pages of folder changes since the stored delta watermark, restarting the round if it expired."""
+    delta_link = email_account.get_delta_link(folder)
+    initial_days = current_app.config.get('DELTA_SYNC_INITIAL_DAYS', 30)
+    since = None if delta_link else datetime.now(timezone.utc) - timedelta(days=initial_days)
+    
+    pages = service.iter_delta_pages(
+        email_account.access_token, folder=folder, delta_link=delta_link, since=since, page_size=page_size
+    )
+    try:
+        first_page = next(pages, None)
+    except GraphRequestError as e:
+        if e.status_code != 410 or not delta_link:
+            raise
+        # Watermark expired on Graph's side - start a new delta round
+        logger.warning(f"Delta watermark expired for folder {folder}, full resync required")
+        email_account.set_delta_link(folder, None)
+        pages = service.iter_delta_pages(
+            email_account.access_token,
+            folder=folder,
+            since=datetime.now(timezone.utc) - timedelta(days=initial_days),
+            page_size=page_size
+        )
+        first_page = next(pages, None)
+    
+    if first_page is not None:
+        yield first_page
+        yield from pages
+
+def _enqueue_classification(emails, priority=3):
+    """Queue emails for the classification worker and commit."""
+    if not emails:
+        return []
+    
+    jobs = ClassificationJob.enqueue(
+        emails,
+        priority=priority,
+        max_attempts=current_app.config.get('CLASSIFICATION_MAX_ATTEMPTS', 5)
+    )
+    db.session.commit()
+    return jobs
+
+def _index_near_duplicates(emails, inherit=True):
+    """Fingerprint new emails and, if `inherit`, let near-duplicates reuse a classification; commits.
+    
+    Returns (inherited, remaining) where only remaining emails need the AI classifier.
+    """
+    if not emails:
+        return [], []
+    
+    try:
+        index = NearDuplicateIndex()
+        if inherit:
+            inherited, remaining = index.inherit_classifications(emails)
+        else:
+            index.index_emails(emails)
+            inherited, remaining = [], list(emails)
+        db.session.commit()
+        return inherited, remaining
+    except Exception as e:
+        logger.error(f"Near-duplicate indexing failed: {str(e)}")
+        db.session.rollback()
+        return [], list(emails)
+
+def _graph_error_response(e, user_id, action='fetch emails'):
+    """Response for a failed Graph request: 503 while throttled, 401 when the token is rejected, 502 otherwise."""
+    if isinstance(e, GraphRequestError) and e.kind == 'throttled':
+        # Still throttled after the retries: ask the client to come back later
+        logger.warning(f"Failed to {action} - throttled by Microsoft for user {user_id}: {str(e)}")
+        response = jsonify({
+            'success': False,
+            'error': 'Microsoft is throttling requests for this mailbox. Please try again later.',
+            'retry_after': e.retry_after
+        })
+        if e.retry_after:
+            response.headers['Retry-After'] = str(int(e.retry_after))
+        return response, 503
+    if isinstance(e, GraphRequestError) and e.is_auth_error:
+        logger.error(f"Failed to {action} - token expired or revoked for user {user_id}: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': f'Failed to {action} from Microsoft. Token may have expired. Please reconnect your account.'
+        }), 401
+    logger.error(f"Failed to {action} from Microsoft for user {user_id}: {str(e)}")
+    return jsonify({
+        'success': False,
+        'error': f'Failed to {action} from Microsoft. Please try again later.'
+    }), 502
+
+def _sync_pages(email_account, pages, folder, top, delta=True, classify=True):
+    """Store sync pages one at a time until `top` messages were fetched.
+    
+    Each page is stored, its delta watermark saved and its new emails queued
+    and committed before the next is fetched - memory stays at one page and
+    synced emails show up before the sync ends. A failure fetching the first
+    page is raised; a later one keeps the committed pages and marks the sync
+    incomplete. Returns (totals, job_ids, page_count, complete).
+    """
+    totals = {'synced': 0, 'updated': 0, 'skipped': 0, 'removed': 0, 'fetched': 0, 'inherited': 0, 'header_classified': 0}
+    job_ids = []
+    page_count = 0
+    complete = True
+    
+    while totals['fetched'] < top:
+        try:
+            page = next(pages, None)
+        except Exception as e:
+            if not page_count:
+                raise
+            # Pages already committed stay; a delta sync resumes after the last of them
+            logger.error(f"Email sync stopped after {page_count} pages: {str(e)}")
+            complete = False
+            break
+        if page is None:
+            break
+        
+        page_count += 1
+        messages = page.get('value', [])
+        if not delta:
+            messages = messages[:top - totals['fetched']]  # Delta pages are kept whole, their watermark covers all of them
+        
+        synced_count, updated_count, skipped_count, new_emails, header_classified = ingest_messages(
+            email_account, messages, classify_headers=classify
+        )
+        totals['removed'] += remove_messages(email_account, page.get('removed', []))
+        
+        if delta:
+            # Store the watermark together with the changes it covers
+            email_account.set_delta_link(folder, page.get('@odata.deltaLink') or page.get('@odata.nextLink'))
+        
+        # Commit emails first
+        db.session.commit()
+        
+        # Fingerprint new emails; near-duplicates of classified ones inherit their classification
+        new_email_objects = Email.query.filter(Email.id.in_([email['email_id'] for email in new_emails])).all() if new_emails else []
+        inherited, remaining = _index_near_duplicates(new_email_objects, inherit=classify)
+        
+        # Queue the rest for background classification
+        if classify and remaining:
+            jobs = _enqueue_classification(remaining)
+            job_ids.extend(job.id for job in jobs)
+        
+        totals['synced'] += synced_count
+        totals['updated'] += updated_count
+        totals['skipped'] += skipped_count
+        totals['fetched'] += len(messages) + len(page.get('removed', []))
+        totals['inherited'] += len(inherited)
+        totals['header_classified'] += header_classified
+        logger.info(f"Synced page {page_count}: {synced_count} new, {totals['fetched']} fetched so far")
+    
+    return totals, job_ids, page_count, complete
+
 @emails_bp.route('/sync', methods=['POST'])
 @jwt_required()
 def sync_emails():
@@ -48,9 +219,10 @@ def sync_emails():
         
         # Get sync parameters
         data = request.get_json() or {}
-        top = min(data.get('count', 50), 200)  # Max 200 emails per sync
+        top = min(data.get('count', 50), current_app.config.get('MAX_EMAILS_PER_SYNC', 1000))
         folder = data.get('folder', 'inbox')
         classify_immediately = data.get('classify', True)  # Auto-classify by default
+        mode = data.get('mode', 'delta')  # 'delta' (changes only) or 'full' (newest N messages)
         
         service = MicrosoftGraphService()
         
@@ -61,180 +233,48 @@ def sync_emails():
                 'error': 'No access token available. Please reconnect your Microsoft account.'
             }), 401
         
-        logger.info(f"Attempting to sync {top} emails from {folder} folder for user {user_id}")
-        
-        # Fetch emails from Microsoft Graph
-        emails_data = service.get_user_emails(
-            email_account.access_token,
-            top=top,
-            folder=folder
-        )
-        
-        if not emails_data:
-            logger.error(f"Failed to fetch emails - likely token expired for user {user_id}")
-            return jsonify({
-                'success': False,
-                'error': 'Failed to fetch emails from Microsoft. Token may have expired. Please reconnect your account.'
-            }), 401
-            
-        if 'value' not in emails_data:
-            logger.error(f"Unexpected response format from Microsoft Graph: {emails_data}")
-            return jsonify({
-                'success': False,
-                'error': 'Unexpected response format from Microsoft Graph'
-            }), 400
-        
-        synced_count = 0
-        skipped_count = 0
-        classified_count = 0
-        new_emails = []
+        logger.info(f"Attempting to sync {top} emails from {folder} folder for user {user_id} (mode: {mode})")
         
-        for email_data in emails_data['value']:
-            try:
-                # Check if email already exists
-                existing_email = Email.query.filter_by(
-                    microsoft_email_id=email_data['id']
-                ).first()
-                
-                if existing_email:
-                    # Update existing email's read status and other properties
-                    updated = False
-                    
-                    # Check if isRead status changed
-                    current_is_read = email_data.get('isRead', False)
-                    if existing_email.is_read != current_is_read:
-                        existing_email.is_read = current_is_read
-                        updated = True
-                        logger.info(f"Updated isRead status for email {existing_email.id}: {current_is_read}")
-                    
-                    # Check if importance changed
-                    current_importance = email_data.get('importance', 'normal') == 'high'
-                    if existing_email.is_important != current_importance:
-                        existing_email.is_important = current_importance
-                        updated = True
-                    
-                    # Check if flag status changed (starred)
-                    flag_status = email_data.get('flag', {})
-                    current_starred = flag_status.get('flagStatus', 'notFlagged') != 'notFlagged'
-                    if existing_email.is_starred != current_starred:
-                        existing_email.is_starred = current_starred
-                        updated = True
-                    
-                    if updated:
-                        existing_email.updated_at = datetime.now()
-                        db.session.add(existing_email)
-                        logger.info(f"Updated existing email {existing_email.id}")
-                    
-                    skipped_count += 1
-                    continue
-                
-                # Extract email preview
-                body_preview = extract_email_preview(
-                    email_data.get('body', {}).get('content', ''),
-                    max_length=500
-                )
-                
-                # Create new email record
-                email = Email(
-                    email_account_id=email_account.id,
-                    microsoft_email_id=email_data['id'],
-                    subject=email_data.get('subject', ''),
-                    sender_email=email_data.get('from', {}).get('emailAddress', {}).get('address', ''),
-                    sender_name=email_data.get('from', {}).get('emailAddress', {}).get('name', ''),
-                    recipient_emails=email_account.email_address,
-                    body_content=email_data.get('body', {}).get('content', ''),
-                    body_preview=body_preview,
-                    received_at=datetime.fromisoformat(
-                        email_data['receivedDateTime'].replace('Z', '+00:00')
-                    ),
-                    is_read=email_data.get('isRead', False),
-                    has_attachments=email_data.get('hasAttachments', False),
-                    urgency_category='medium',  # Default, will be updated by AI
-                    priority_level=3,
-                    ai_confidence=0.0,
-                    processing_status='pending'
-                )
-                
-                db.session.add(email)
-                db.session.flush()  # Get email ID
-                
-                new_emails.append({
-                    'email_id': str(email.id),
-                    'subject': email.subject,
-                    'sender_name': email.sender_name,
-                    'sender_email': email.sender_email,
-                    'body_preview': body_preview,
-                    'received_at': email.received_at.isoformat()
-                })
-                
-                synced_count += 1
-                
-            except Exception as e:
-                logger.warning(f"Skipping email {email_data['id']} due to error: {str(e)}")
-                skipped_count += 1
-                continue
+        page_size = min(current_app.config.get('SYNC_PAGE_SIZE', 50), top)
+        if mode == 'delta':
+            pages = _delta_pages(service, email_account, folder, page_size)
+        else:
+            pages = service.iter_email_pages(email_account.access_token, folder=folder, page_size=page_size)
         
-        # Commit emails first
-        db.session.commit()
+        try:
+            totals, job_ids, page_count, complete = _sync_pages(
+                email_account, pages, folder, top, delta=mode == 'delta', classify=classify_immediately
+            )
+        except (GraphRequestError, requests.RequestException) as e:
+            return _graph_error_response(e, user_id)
         
-        # Classify emails with OpenAI if requested and we have new emails
-        classification_results = {}
-        if classify_immediately and new_emails:
-            try:
-                gemini_service = GeminiOnlyService()
-                logger.info(f"Starting AI classification of {len(new_emails)} new emails")
-                
-                # Classify in batches
-                classifications = gemini_service.classify_batch(new_emails, batch_size=3)
-                
-                # Update emails with classification results
-                for i, email_data in enumerate(new_emails):
-                    if i < len(classifications):
-                        classification = classifications[i]
-                        
-                        # Find and update the email
-                        email = Email.query.get(email_data['email_id'])
-                        if email:
-                            email.urgency_category = classification.get('urgency_category', 'medium')
-                            email.priority_level = get_priority_from_urgency(email.urgency_category)
-                            email.ai_confidence = classification.get('confidence_score', 0.0)
-                            email.ai_reasoning = classification.get('reasoning', '')
-                            email.processing_status = 'completed'
-                            email.is_classified = True
-                            email.classified_at = datetime.now()
-                            email.classification_model = gemini_service.model
-                            classified_count += 1
-                
-                # Commit classification updates
-                db.session.commit()
-                
-                # Generate classification stats
-                classification_results = gemini_service.get_classification_stats(classifications)
-                
-                logger.info(f"Successfully classified {classified_count} emails")
-                
-            except Exception as e:
-                logger.error(f"Error during email classification: {str(e)}")
-                # Continue without classification - emails are still synced
+        if job_ids:
+            logger.info(f"Queued {len(job_ids)} new emails for classification")
         
         response_data = {
             'success': True,
-            'message': f'Successfully synced {synced_count} new emails',
-            'synced': synced_count,
-            'skipped': skipped_count,
-            'total_fetched': len(emails_data['value']),
-            'classified': classified_count,
+            'message': f"Successfully synced {totals['synced']} new emails",
+            'synced': totals['synced'],
+            'updated': totals['updated'],
+            'skipped': totals['skipped'],
+            'removed': totals['removed'],
+            'total_fetched': totals['fetched'],
+            'pages': page_count,
+            'complete': complete,
+            'mode': mode,
+            'classified': totals['inherited'] + totals['header_classified'],
+            'inherited': totals['inherited'],
+            'header_classified': totals['header_classified'],
+            'queued': len(job_ids),
+            'job_ids': job_ids,
             'classification_enabled': classify_immediately
         }
         
-        # Add classification stats if available
-        if classification_results:
-            response_data['classification_stats'] = classification_results
-        
         return jsonify(response_data)
     
     except Exception as e:
         logger.error(f"Error syncing emails: {str(e)}")
+        db.session.rollback()
         return jsonify({
             'success': False,
             'error': 'Email synchronization failed'
@@ -368,6 +408,10 @@ def get_email_detail(email_id):
                 'error': 'Email not found'
             }), 404
         
+        # Synced without its body: fetch it now that it is opened
+        if not email.has_body and hydrate_body(email):
+            db.session.commit()
+        
         return jsonify({
             'success': True,
             'email': {
@@ -379,6 +423,7 @@ def get_email_detail(email_id):
                 },
                 'recipient': email.recipient_emails,
                 'body_content': email.body_content,
+                'body_available': email.has_body,
                 'body_preview': email.body_preview,
                 'received_at': email.received_at.isoformat(),
                 'is_read': email.is_read,
@@ -497,39 +542,51 @@ def sync_email_statuses():
         
         service = MicrosoftGraphService()
         
+        if email_account.get_delta_link('inbox'):
+            # Delta watermark available: only read changes since the last sync.
+            # New messages in the round are stored too, otherwise advancing the
+            # watermark here would hide them from the next /sync.
+            max_messages = current_app.config.get('MAX_EMAILS_PER_SYNC', 1000)
+            page_size = min(current_app.config.get('SYNC_PAGE_SIZE', 50), max_messages)
+            pages = _delta_pages(service, email_account, 'inbox', page_size)
+            try:
+                totals, job_ids, _, complete = _sync_pages(email_account, pages, 'inbox', max_messages)
+            except (GraphRequestError, requests.RequestException) as e:
+                return _graph_error_response(e, user_id, 'fetch email changes')
+            
+            return jsonify({
+                'success': True,
+                'message': f"Synchronized {totals['updated']} email statuses",
+                'updated_count': totals['updated'],
+                'processed_count': totals['fetched'],
+                'new_count': totals['synced'],
+                'removed_count': totals['removed'],
+                'header_classified': totals['header_classified'],
+                'queued': len(job_ids),
+                'complete': complete,
+                'mode': 'delta'
+            })
+        
         # Fetch recent emails from Microsoft to sync status
-        emails_data = service.get_user_emails(
-            email_account.access_token,
-            top=limit,
-            folder='inbox'
-        )
+        try:
+            emails_data = service.get_user_emails(
+                email_account.access_token,
+                top=limit,
+                folder='inbox'
+            )
+        except (GraphRequestError, requests.RequestException) as e:
+            return _graph_error_response(e, user_id)
         
-        if not emails_data or 'value' not in emails_data:
+        if 'value' not in emails_data:
             return jsonify({
                 'success': False,
                 'error': 'Failed to fetch emails from Microsoft'
             }), 400
         
-        updated_count = 0
-        processed_count = 0
-        
-        for email_data in emails_data['value']:
-            processed_count += 1
-            microsoft_id = email_data['id']
-            current_is_read = email_data.get('isRead', False)
-            
-            # Find local email
-            local_email = Email.query.filter_by(
-                microsoft_email_id=microsoft_id,
-                email_account_id=email_account.id
-            ).first()
-            
-            if local_email and local_email.is_read != current_is_read:
-                local_email.is_read = current_is_read
-                local_email.updated_at = datetime.now()
-                db.session.add(local_email)
-                updated_count += 1
-                logger.info(f"Synced read status for email {local_email.id}: {current_is_read}")
+        # Only refresh read/importance/flag state of emails we already store
+        result = Email.bulk_upsert_from_graph(email_account, emails_data['value'], insert_new=False)
+        updated_count = result['updated']
+        processed_count = len(emails_data['value'])
         
         db.session.commit()
         
@@ -542,6 +599,7 @@ def sync_email_statuses():
     
     except Exception as e:
         logger.error(f"Error syncing email statuses: {str(e)}")
+        db.session.rollback()
         return jsonify({
             'success': False,
             'error': 'Failed to sync email statuses'
@@ -585,6 +643,19 @@ def update_email_urgency(email_id):
                 'error': 'Email not found'
             }), 404
         
+        # Record real corrections as user labels, so the local classifier and sender priors learn from them
+        if urgency_category in VALID_URGENCIES and (urgency_category != email.urgency_category or not email.is_classified):
+            SenderReputationIndex().record_correction(
+                email,
+                email.urgency_category if email.is_classified else None,
+                email.classification_model if email.is_classified else None,
+                urgency_category
+            )
+            record_correction(email, urgency_category)
+            email.classification_model = USER_CORRECTION_MODEL
+            email.is_classified = True
+            email.classified_at = datetime.now(timezone.utc)
+        
         # Update urgency
         email.urgency_category = urgency_category
         email.priority_level = get_priority_from_urgency(urgency_category)
@@ -971,7 +1042,7 @@ def search_emails():
 @emails_bp.route('/classify', methods=['POST'])
 @jwt_required()
 def classify_emails():
-    """Classify specific emails or all pending emails using OpenAI."""
+    """Queue specific emails or all pending emails for classification."""
     try:
         user_id = get_jwt_identity()
         data = request.get_json() or {}
@@ -1020,53 +1091,18 @@ def classify_emails():
                 'classified': 0
             })
         
-        # Prepare email data for OpenAI
-        emails_data = []
-        for email in emails:
-            emails_data.append({
-                'email_id': str(email.id),
-                'subject': email.subject,
-                'sender_name': email.sender_name,
-                'sender_email': email.sender_email,
-                'body_preview': email.body_preview,
-                'received_at': email.received_at.isoformat()
-            })
-        
-        # Classify with OpenAI
-        gemini_service = GeminiOnlyService()
-        logger.info(f"Classifying {len(emails)} emails with OpenAI")
-        
-        classifications = gemini_service.classify_batch(emails_data, batch_size=5)
-        
-        # Update emails with classification results
-        classified_count = 0
-        for i, email in enumerate(emails):
-            if i < len(classifications):
-                classification = classifications[i]
-                
-                email.urgency_category = classification.get('urgency_category', 'medium')
-                email.priority_level = get_priority_from_urgency(email.urgency_category)
-                email.ai_confidence = classification.get('confidence_score', 0.0)
-                email.ai_reasoning = classification.get('reasoning', '')
-                email.processing_status = 'classified'
-                email.is_classified = True
-                email.classified_at = datetime.now()
-                email.classification_model = gemini_service.model
-                
-                classified_count += 1
-        
-        db.session.commit()
-        
-        # Generate classification stats
-        classification_stats = gemini_service.get_classification_stats(classifications)
+        # Queue for the classification worker instead of blocking the request
+        jobs = _enqueue_classification(emails)
+        logger.info(f"Queued {len(jobs)} emails for classification")
         
         return jsonify({
             'success': True,
-            'message': f'Successfully classified {classified_count} emails',
-            'classified': classified_count,
-            'total_processed': len(emails),
-            'classification_stats': classification_stats
-        })
+            'message': f'Queued {len(jobs)} emails for classification',
+            'classified': 0,
+            'queued': len(jobs),
+            'job_ids': [job.id for job in jobs],
+            'total_processed': len(emails)
+        }), 202
     
     except Exception as e:
         logger.error(f"Error classifying emails: {str(e)}")
@@ -1085,9 +1121,42 @@ def get_ai_status():
         gemini_service = GeminiOnlyService()
         status = gemini_service.get_status()
         
+        # Cache hit rate: emails answered from the classification cache vs. all classified emails
+        user_id = get_jwt_identity()
+        account_ids = [account.id for account in EmailAccount.query.filter_by(user_id=user_id).all()]
+        classified_count = Email.query.filter(
+            Email.email_account_id.in_(account_ids),
+            Email.is_classified == True
+        ).count() if account_ids else 0
+        cached_count = Email.query.filter(
+            Email.email_account_id.in_(account_ids),
+            Email.classification_model.like('cache:%')
+        ).count() if account_ids else 0
+        
         return jsonify({
             'success': True,
             'ai_service': status,
+            'classification_cache': dict(
+                ClassificationCache.get_stats(),
+                classified_emails=classified_count,
+                cached_classifications=cached_count,
+                hit_rate=round(cached_count / classified_count, 3) if classified_count else 0.0
+            ),
+            'classification_cascade': get_cascade_stats().snapshot(),
+            'sender_priors': get_sender_prior_stats().snapshot(),
+            'header_rules': get_header_rule_stats().snapshot(),
+            'body_hydration': dict(
+                get_body_hydration_stats().snapshot(),
+                fetch_bodies_at_sync=current_app.config.get('SYNC_FETCH_BODIES', False)
+            ),
+            'prompt_compaction': get_compaction_stats().snapshot(),
+            'prompt_usage': get_prompt_usage_stats().snapshot(),
+            'response_parsing': get_parse_stats().snapshot(),
+            'circuit_breakers': {
+                provider: get_circuit_breaker(provider, current_app.config).snapshot() for provider in ('openai', 'gemini')
+            },
+            'hedging': dict(get_hedge_stats().snapshot(), enabled=current_app.config.get('AI_HEDGING_ENABLED', False)),
+            'graph_http': get_graph_http_stats().snapshot(),
             'message': 'AI service status retrieved successfully'
         })
     
@@ -1098,6 +1167,30 @@ def get_ai_status():
             'error': 'Failed to get AI service status'
         }), 500
 
+@emails_bp.route('/local-model-metrics', methods=['GET'])
+@jwt_required()
+def get_local_model_metrics():
+    """Weekly agreement of the local classifier with AI answers, and AI call volume, for the user's accounts."""
+    try:
+        user_id = get_jwt_identity()
+        weeks = min(max(request.args.get('weeks', 8, type=int), 1), 52)
+        account_ids = [account.id for account in EmailAccount.query.filter_by(user_id=user_id).all()]
+        
+        return jsonify({
+            'success': True,
+            'weeks': weeks,
+            'online_learning': current_app.config.get('LOCAL_CLASSIFIER_ONLINE_LEARNING', True),
+            **get_learning_metrics(account_ids, weeks),
+            'message': 'Local model metrics retrieved successfully'
+        })
+    
+    except Exception as e:
+        logger.error(f"Error getting local model metrics: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to get local model metrics'
+        }), 500
+
 @emails_bp.route('/<email_id>/classify', methods=['POST'])
 @jwt_required()
 def classify_single_email(email_id):
@@ -1120,33 +1213,24 @@ def classify_single_email(email_id):
                 'error': 'Email not found'
             }), 404
         
-        # Prepare email data
-        email_data = {
-            'subject': email.subject,
-            'sender_name': email.sender_name,
-            'sender_email': email.sender_email,
-            'body_preview': email.body_preview,
-            'received_at': email.received_at.isoformat()
-        }
-        
-        # Classify with OpenAI
-        gemini_service = GeminiOnlyService()
-        classification = gemini_service.classify_email(email_data)
+        # Cascade first; with AI_HEDGING_ENABLED a stalled provider is raced against the other one
+        ai_service = AIService()
+        classification = ai_service.classify_email(email.to_classification_payload())
+        if classification.get('rate_limit_retry'):
+            return jsonify({
+                'success': False,
+                'error': 'AI classification is rate limited or unavailable. Please try again later.'
+            }), 503
         
         # Update email
-        email.urgency_category = classification.get('urgency_category', 'medium')
-        email.priority_level = get_priority_from_urgency(email.urgency_category)
-        email.ai_confidence = classification.get('confidence_score', 0.0)
-        email.ai_reasoning = classification.get('reasoning', '')
-        email.processing_status = 'classified'
-        email.is_classified = True
-        email.classified_at = datetime.now()
-        email.classification_model = gemini_service.model
+        email.apply_classification(classification, ai_service.model)
+        SenderReputationIndex().record_classifications([email])
+        record_ai_labels([email])
         
         db.session.commit()
         
         # Get response priority suggestion
-        priority_suggestion = gemini_service.suggest_response_priority(classification)
+        priority_suggestion = ai_service.suggest_response_priority(classification)
         
         return jsonify({
             'success': True,
@@ -1317,7 +1401,7 @@ def check_openai_rate_limit():
 @emails_bp.route('/classify-retry', methods=['POST'])
 @jwt_required()
 def retry_classification():
-    """Retry classification for emails that hit rate limit."""
+    """Retry classification jobs that are backing off or failed (e.g. rate limits)."""
     try:
         user_id = get_jwt_identity()
         
@@ -1332,67 +1416,36 @@ def retry_classification():
                 'classified': 0
             })
         
-        # Get emails that need retry (those with rate_limit_retry flag)
-        retry_emails = Email.query.filter(
-            Email.email_account_id.in_(account_ids),
-            Email.processing_status == 'pending',
-            Email.ai_reasoning.like('%Rate limit reached%')
-        ).order_by(Email.received_at.desc()).limit(3).all()  # Only 3 at a time
-        
-        if not retry_emails:
-            return jsonify({
-                'success': True,
-                'message': 'No emails need retry classification',
-                'classified': 0
-            })
-        
-        # Prepare email data for OpenAI
-        emails_data = []
-        for email in retry_emails:
-            emails_data.append({
-                'email_id': str(email.id),
-                'subject': email.subject,
-                'sender_name': email.sender_name,
-                'sender_email': email.sender_email,
-                'body_preview': email.body_preview,
-                'received_at': email.received_at.isoformat()
-            })
-        
-        # Classify with OpenAI (very conservative)
-        gemini_service = GeminiOnlyService()
-        logger.info(f"Retrying classification for {len(emails_data)} emails")
-        
-        classifications = gemini_service.classify_batch(emails_data, batch_size=1)  # One at a time
-        
-        # Update emails with classification results
-        classified_count = 0
-        for i, email in enumerate(retry_emails):
-            if i < len(classifications):
-                classification = classifications[i]
-                
-                # Skip if still rate limited
-                if classification.get('rate_limit_retry'):
-                    continue
-                
-                email.urgency_category = classification.get('urgency_category', 'medium')
-                email.priority_level = get_priority_from_urgency(email.urgency_category)
-                email.ai_confidence = classification.get('confidence_score', 0.0)
-                email.ai_reasoning = classification.get('reasoning', '')
-                email.processing_status = 'classified'
-                email.is_classified = True
-                email.classified_at = datetime.now()
-                email.classification_model = gemini_service.model
-                
-                classified_count += 1
-                logger.info(f"Retry classified email {email.id} as {email.urgency_category}")
+        now = datetime.now(timezone.utc)
+        
+        # Jobs waiting out a backoff become due right away
+        backing_off = ClassificationJob.query.filter(
+            ClassificationJob.email_account_id.in_(account_ids),
+            ClassificationJob.state == 'queued',
+            ClassificationJob.not_before > now
+        ).update({'not_before': now}, synchronize_session=False)
+        
+        # Failed jobs get a fresh set of attempts
+        failed = ClassificationJob.query.filter(
+            ClassificationJob.email_account_id.in_(account_ids),
+            ClassificationJob.state == 'failed'
+        ).update({
+            'state': 'queued',
+            'attempts': 0,
+            'not_before': now,
+            'completed_at': None
+        }, synchronize_session=False)
         
         db.session.commit()
         
+        logger.info(f"Retrying {backing_off} backed-off and {failed} failed classification jobs")
+        
         return jsonify({
             'success': True,
-            'message': f'Retry classified {classified_count} emails',
-            'classified': classified_count,
-            'total_retry': len(retry_emails)
+            'message': f'Requeued {backing_off + failed} classification jobs',
+            'classified': 0,
+            'total_retry': backing_off + failed,
+            'queue': ClassificationJob.get_queue_stats(account_ids)
         })
     
     except Exception as e:
@@ -1405,7 +1458,7 @@ def retry_classification():
 @emails_bp.route('/auto-classify', methods=['POST'])
 @jwt_required()
 def auto_classify_emails():
-    """Automatically classify all pending emails when app opens."""
+    """Queue all pending emails for classification when app opens."""
     try:
         user_id = get_jwt_identity()
         logger.info(f"Starting auto-classification for user {user_id}")
@@ -1421,16 +1474,11 @@ def auto_classify_emails():
                 'classified': 0
             })
         
-        # Get pending emails (not classified yet) - Different limits for dev vs prod
-        from flask import current_app
-        is_production = current_app.config.get('FLASK_ENV') == 'production'
-        
-        # Emergency mode: ultra conservative limits
-        limit = 1 if is_production else 2  # Ultra conservative - 1 email at a time
+        # The worker paces provider calls, so every pending email can be queued
         pending_emails = Email.query.filter(
             Email.email_account_id.in_(account_ids),
             Email.processing_status == 'pending'
-        ).order_by(Email.received_at.desc()).limit(limit).all()
+        ).order_by(Email.received_at.desc()).all()
         
         if not pending_emails:
             logger.info(f"No pending emails to classify for user {user_id}")
@@ -1440,66 +1488,199 @@ def auto_classify_emails():
                 'classified': 0
             })
         
-        logger.info(f"Found {len(pending_emails)} pending emails to classify")
+        jobs = _enqueue_classification(pending_emails)
+        logger.info(f"Auto-classification queued {len(jobs)} emails")
         
-        # Prepare email data for OpenAI
-        emails_data = []
-        for email in pending_emails:
-            emails_data.append({
-                'email_id': str(email.id),
-                'subject': email.subject,
-                'sender_name': email.sender_name,
-                'sender_email': email.sender_email,
-                'body_preview': email.body_preview,
-                'received_at': email.received_at.isoformat()
-            })
+        return jsonify({
+            'success': True,
+            'message': f'Queued {len(jobs)} emails for classification',
+            'classified': 0,
+            'queued': len(jobs),
+            'job_ids': [job.id for job in jobs],
+            'total_pending': len(pending_emails)
+        }), 202
+    
+    except Exception as e:
+        logger.error(f"Error in auto-classification: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Auto-classification failed'
+        }), 500
+
+@emails_bp.route('/jobs', methods=['GET'])
+@jwt_required()
+def get_classification_jobs():
+    """Get classification queue counts for the user's accounts."""
+    try:
+        user_id = get_jwt_identity()
         
-        # Classify with OpenAI
-        gemini_service = GeminiOnlyService()
-        logger.info(f"Classifying {len(emails_data)} emails with OpenAI")
-        
-        # Different batch sizes for dev vs prod - ultra conservative
-        batch_size = 1  # Always 1 at a time to avoid rate limits
-        classifications = gemini_service.classify_batch(emails_data, batch_size=batch_size)
-        
-        # Update emails with classification results
-        classified_count = 0
-        for i, email in enumerate(pending_emails):
-            if i < len(classifications):
-                classification = classifications[i]
-                
-                email.urgency_category = classification.get('urgency_category', 'medium')
-                email.priority_level = get_priority_from_urgency(email.urgency_category)
-                email.ai_confidence = classification.get('confidence_score', 0.0)
-                email.ai_reasoning = classification.get('reasoning', '')
-                email.processing_status = 'classified'
-                email.is_classified = True
-                email.classified_at = datetime.now()
-                email.classification_model = gemini_service.model
-                
-                classified_count += 1
-                logger.info(f"Classified email {email.id} as {email.urgency_category}")
+        # Get user's email accounts first
+        user_email_accounts = EmailAccount.query.filter_by(user_id=user_id).all()
+        account_ids = [account.id for account in user_email_accounts]
         
-        db.session.commit()
+        return jsonify({
+            'success': True,
+            'queue': ClassificationJob.get_queue_stats(account_ids)
+        })
+    
+    except Exception as e:
+        logger.error(f"Error getting classification jobs: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to get classification jobs'
+        }), 500
+
+@emails_bp.route('/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_classification_job(job_id):
+    """Get the state of one classification job."""
+    try:
+        user_id = get_jwt_identity()
         
-        # Generate classification stats
-        classification_stats = gemini_service.get_classification_stats(classifications)
+        # Get user's email accounts first
+        user_email_accounts = EmailAccount.query.filter_by(user_id=user_id).all()
+        account_ids = [account.id for account in user_email_accounts]
+        
+        job = ClassificationJob.query.filter(
+            ClassificationJob.id == job_id,
+            ClassificationJob.email_account_id.in_(account_ids)
+        ).first()
         
-        logger.info(f"Auto-classification completed: {classified_count} emails classified")
+        if not job:
+            return jsonify({
+                'success': False,
+                'error': 'Job not found'
+            }), 404
         
         return jsonify({
             'success': True,
-            'message': f'Auto-classified {classified_count} emails',
-            'classified': classified_count,
-            'total_pending': len(pending_emails),
-            'classification_stats': classification_stats
+            'job': job.to_dict()
         })
     
     except Exception as e:
-        logger.error(f"Error in auto-classification: {str(e)}")
+        logger.error(f"Error getting classification job {job_id}: {str(e)}")
         return jsonify({
             'success': False,
-            'error': 'Auto-classification failed'
+            'error': 'Failed to get classification job'
+        }), 500
+
+@emails_bp.route('/backfill', methods=['POST'])
+@jwt_required()
+def start_email_backfill():
+    """Import the mailbox history in the background, or resume the unfinished import."""
+    try:
+        user_id = get_jwt_identity()
+        
+        email_account = EmailAccount.query.filter_by(
+            user_id=user_id,
+            provider='microsoft',
+            is_active=True
+        ).first()
+        
+        if not email_account or not email_account.access_token:
+            return jsonify({
+                'success': False,
+                'error': 'Microsoft account not connected'
+            }), 400
+        
+        data = request.get_json() or {}
+        folder = data.get('folder', 'inbox')
+        
+        job = active_backfill_job(email_account.id, folder)
+        if job is None:
+            if data.get('since'):
+                try:
+                    since = datetime.fromisoformat(data['since'])
+                except ValueError:
+                    return jsonify({
+                        'success': False,
+                        'error': 'Invalid since date, expected ISO format (YYYY-MM-DD)'
+                    }), 400
+                if since.tzinfo is None:
+                    since = since.replace(tzinfo=timezone.utc)
+            else:
+                years = data.get('years', current_app.config.get('BACKFILL_DEFAULT_YEARS', 3))
+                since = datetime.now(timezone.utc) - timedelta(days=365 * years)
+            
+            job = create_backfill_job(
+                email_account,
+                since=since,
+                window_days=max(1, int(data.get('window_days', current_app.config.get('BACKFILL_WINDOW_DAYS', 30)))),
+                folder=folder
+            )
+            db.session.commit()
+            logger.info(f"Created backfill {job.id} for user {user_id}: {job.windows_total} windows since {since.date()}")
+        
+        # A job whose lease is still held is already running; start_backfill then returns without work
+        start_backfill(current_app._get_current_object(), job.id)
+        
+        return jsonify({
+            'success': True,
+            'message': 'Backfill started',
+            'job': job.to_dict()
+        }), 202
+    
+    except Exception as e:
+        logger.error(f"Error starting backfill: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to start backfill'
+        }), 500
+
+@emails_bp.route('/backfill', methods=['GET'])
+@jwt_required()
+def get_email_backfills():
+    """Get the progress of the user's backfill jobs, newest first."""
+    try:
+        user_id = get_jwt_identity()
+        account_ids = [account.id for account in EmailAccount.query.filter_by(user_id=user_id).all()]
+        
+        jobs = BackfillJob.query.filter(
+            BackfillJob.email_account_id.in_(account_ids)
+        ).order_by(BackfillJob.created_at.desc()).limit(20).all() if account_ids else []
+        
+        return jsonify({
+            'success': True,
+            'jobs': [job.to_dict() for job in jobs]
+        })
+    
+    except Exception as e:
+        logger.error(f"Error getting backfills: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to get backfills'
+        }), 500
+
+@emails_bp.route('/backfill/<job_id>', methods=['GET'])
+@jwt_required()
+def get_email_backfill(job_id):
+    """Get the progress of one backfill job and its windows."""
+    try:
+        user_id = get_jwt_identity()
+        account_ids = [account.id for account in EmailAccount.query.filter_by(user_id=user_id).all()]
+        
+        job = BackfillJob.query.filter(
+            BackfillJob.id == job_id,
+            BackfillJob.email_account_id.in_(account_ids)
+        ).first()
+        
+        if not job:
+            return jsonify({
+                'success': False,
+                'error': 'Backfill not found'
+            }), 404
+        
+        return jsonify({
+            'success': True,
+            'job': job.to_dict(),
+            'windows': [window.to_dict() for window in sorted(job.windows, key=lambda window: window.window_end, reverse=True)]
+        })
+    
+    except Exception as e:
+        logger.error(f"Error getting backfill {job_id}: {str(e)}")
+        return jsonify({
+            'success': False,
+            'error': 'Failed to get backfill'
         }), 500
 
 @emails_bp.route('/sent', methods=['GET'])
@@ -1536,18 +1717,14 @@ def get_sent_emails():
         service = MicrosoftGraphService()
 
         # Fetch sent emails from Microsoft Graph SentItems folder
-        emails_data = service.get_user_emails(
-            email_account.access_token,
-            top=per_page,
-            folder='sentitems'  # This is the SentItems folder
-        )
-
-        if not emails_data:
-            logger.error(f"Failed to fetch sent emails - likely token expired for user {user_id}")
-            return jsonify({
-                'success': False,
-                'error': 'Failed to fetch sent emails from Microsoft. Token may have expired. Please reconnect your account.'
-            }), 401
+        try:
+            emails_data = service.get_user_emails(
+                email_account.access_token,
+                top=per_page,
+                folder='sentitems'  # This is the SentItems folder
+            )
+        except (GraphRequestError, requests.RequestException) as e:
+            return _graph_error_response(e, user_id, 'fetch sent emails')
 
         if 'value' not in emails_data:
             logger.error(f"Unexpected response format from Microsoft Graph: {emails_data}")
@@ -4,5 +4,6 @@ from .gemini_service import GeminiService
 from .ai_service import AIService
 from .gemini_only_service import GeminiOnlyService
 from .email_processor import EmailProcessor
+from .classification_worker import ClassificationWorker
 
-__all__ = ['MicrosoftGraphService', 'OpenAIService', 'GeminiService', 'AIService', 'GeminiOnlyService', 'EmailProcessor']
\ No newline at end of file
+__all__ = ['MicrosoftGraphService', 'OpenAIService', 'GeminiService', 'AIService', 'GeminiOnlyService', 'EmailProcessor', 'ClassificationWorker']
\ No newline at end of file
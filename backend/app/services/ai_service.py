@@ -6,6 +6,10 @@ Provides fallback between OpenAI and Gemini for email classification.
 import logging
 from typing import Dict, List
 from flask import current_app
+from .classification_cascade import ClassificationCascade, get_cascade_stats
+from .classification_cache import classify_with_cache
+from .hedging import RequestHedger, get_hedge_stats, model_name
+from .prompts import retry_later_classification
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +20,7 @@ class AIService:
         self.openai_service = None
         self.gemini_service = None
         self.model = "hybrid"  # Add model attribute
+        self.hedger = RequestHedger(current_app.config) if current_app.config.get('AI_HEDGING_ENABLED') else None
         self._initialize_services()
     
     def _initialize_services(self):
@@ -58,26 +63,68 @@ class AIService:
         else:
             status['primary_service'] = 'fallback'
         
+        status['cascade'] = get_cascade_stats().snapshot()
+        status['circuit_breakers'] = {
+            name: service.breaker.snapshot()
+            for name, service in (('openai', self.openai_service), ('gemini', self.gemini_service)) if service
+        }
+        status['hedging'] = dict(get_hedge_stats().snapshot(), enabled=self.hedger is not None)
         return status
     
+    def _providers(self) -> List:
+        """
+        Configured providers whose circuit breaker lets calls through, healthiest first.
+        
+        Ties keep OpenAI first. A provider with an open breaker is skipped, so
+        an outage costs one fast check instead of an SDK timeout per email.
+        """
+        providers = [service for service in (self.openai_service, self.gemini_service) if service and service.client]
+        scored = [(service.breaker.health_score(), service) for service in providers]
+        return [service for score, service in sorted(scored, key=lambda pair: -pair[0]) if score > 0]
+    
+    def _get_cascade(self) -> ClassificationCascade:
+        """Cascade whose lightweight stage uses the healthiest available provider."""
+        providers = self._providers()
+        return ClassificationCascade(current_app.config, providers[0] if providers else None)
+    
     def classify_email(self, email_data: Dict) -> Dict:
-        """Classify email using available AI service."""
+        """Classify email through the cascade: rules, local model, lightweight prompt, full prompt."""
+        return self._get_cascade().classify(
+            [email_data], lambda remaining: [self._classify_email_remote(remaining[0])]
+        )[0]
+    
+    def _classify_email_remote(self, email_data: Dict) -> Dict:
+        """Classify email using the healthiest available AI service, hedged on the next one when enabled."""
         
-        # Try OpenAI first
-        if self.openai_service and self.openai_service.client:
+        providers = self._providers()
+        if self.hedger and len(providers) > 1:
+            primary, secondary = providers[:2]
             try:
-                logger.info("Using OpenAI for classification")
-                return self.openai_service.classify_email(email_data)
+                return classify_with_cache(
+                    [email_data], model_name(primary),
+                    lambda misses: [self.hedger.classify(primary, secondary, misses[0])], current_app.config
+                )[0]
             except Exception as e:
-                logger.warning(f"OpenAI classification failed: {e}")
+                logger.warning(f"Hedged classification failed: {e}")
         
-        # Try Gemini as fallback
-        if self.gemini_service and self.gemini_service.client:
+        unavailable = False
+        for service in providers:
             try:
-                logger.info("Using Gemini for classification")
-                return self.gemini_service.classify_email(email_data)
+                logger.info(f"Using {type(service).__name__} for classification")
+                classification = service.classify_email(email_data)
             except Exception as e:
-                logger.warning(f"Gemini classification failed: {e}")
+                logger.warning(f"{type(service).__name__} classification failed: {e}")
+                continue
+            if not classification.get('rate_limit_retry'):
+                return classification
+            # Throttled or unavailable: fail over to the next provider
+            logger.warning(f"{type(service).__name__} unavailable, trying the next AI service")
+            unavailable = True
+        
+        # Providers are configured but throttled or down: classify again later instead of storing rules
+        if unavailable or (not providers and any(service and service.client for service in (self.openai_service, self.gemini_service))):
+            logger.warning("All AI services unavailable, will retry later")
+            return retry_later_classification('AI services unavailable - will retry later')
         
         # Use rule-based fallback
         logger.warning("All AI services failed, using rule-based classification")
@@ -94,54 +141,46 @@ class AIService:
                 'sender_type': 'externo',
                 'email_type': 'academico',
                 'requires_immediate_action': False,
-                'suggested_deadline': None
+                'suggested_deadline': None,
+                'classification_model': 'rules'
             }
     
     def classify_batch(self, emails_data: List[Dict], batch_size: int = 5) -> List[Dict]:
-        """Classify multiple emails in batches."""
+        """Classify multiple emails, sending only those the rules and local model are unsure about to an AI service."""
+        return self._get_cascade().classify(
+            emails_data, lambda remaining: self._classify_batch_remote(remaining, batch_size), lightweight=False
+        )
+    
+    def _classify_batch_remote(self, emails_data: List[Dict], batch_size: int = 5) -> List[Dict]:
+        """Classify multiple emails, `batch_size` emails per prompt, with the healthiest available AI service."""
         
-        results = []
+        results = [None] * len(emails_data)
+        pending = list(range(len(emails_data)))
+        answered = False
+        for service in self._providers():
+            try:
+                classifications = service.classify_batch([emails_data[i] for i in pending], batch_size=batch_size)
+            except Exception as e:
+                logger.warning(f"{type(service).__name__} batch classification failed: {e}")
+                continue
+            for i, classification in zip(pending, classifications):
+                results[i] = classification
+            answered = True
+            # Emails the provider was throttled or unavailable for fail over to the next one
+            pending = [i for i in pending if results[i].get('rate_limit_retry')]
+            if not pending:
+                return results
+            logger.warning(f"{type(service).__name__} unavailable for {len(pending)} emails, trying the next AI service")
         
-        for i in range(0, len(emails_data), batch_size):
-            batch = emails_data[i:i + batch_size]
-            
-            logger.info(f"Processing batch {i//batch_size + 1}, emails {i+1}-{min(i+batch_size, len(emails_data))}")
-            
-            batch_results = []
-            for email_data in batch:
-                try:
-                    classification = self.classify_email(email_data)
-                    batch_results.append(classification)
-                    
-                    # Delay between requests
-                    import time
-                    time.sleep(2)  # 2 seconds between requests
-                    
-                except Exception as e:
-                    logger.error(f"Error classifying email: {str(e)}")
-                    # Use fallback for this email
-                    if self.openai_service:
-                        batch_results.append(self.openai_service._fallback_classification(email_data))
-                    else:
-                        batch_results.append({
-                            'urgency_category': 'medium',
-                            'confidence_score': 0.5,
-                            'reasoning': 'Classification failed',
-                            'sender_type': 'externo',
-                            'email_type': 'academico',
-                            'requires_immediate_action': False,
-                            'suggested_deadline': None
-                        })
-            
-            results.extend(batch_results)
-            
-            # Delay between batches
-            if i + batch_size < len(emails_data):
-                import time
-                time.sleep(5)  # 5 seconds between batches
+        if answered:
+            return results  # Every provider was unavailable for the pending emails: they carry retry-later markers
         
-        logger.info(f"Completed batch classification of {len(emails_data)} emails")
-        return results
+        # Use rule-based fallback
+        return [self._classify_email_remote(email_data) for email_data in emails_data]
+    
+    def suggest_response_priority(self, classification: Dict) -> Dict:
+        """Suggest response timeframe based on classification."""
+        return self.openai_service.suggest_response_priority(classification) if self.openai_service else None
     
     def get_classification_stats(self, classifications: List[Dict]) -> Dict:
         """Generate statistics from classification results."""
@@ -0,0 +1,180 @@
+"""
+Async Microsoft Graph Client
+Fetches the folders of several mailboxes concurrently over one bounded connection pool.
+
+MicrosoftGraphService makes one blocking request at a time, so fetching two
+folders, or every account, waits for each call in turn. AsyncGraphClient
+runs the same requests with httpx on a process-wide event loop: at most
+GRAPH_MAX_CONNECTIONS connections in total (kept alive between fetches) and
+GRAPH_MAILBOX_CONCURRENCY requests in flight per mailbox, since Graph
+throttles more than four concurrent requests to one mailbox. Fetching
+several folders or accounts then takes about as long as the slowest of them.
+MailboxSync submits one delta round per account and folder through it.
+Throttling and transient failures are retried with the same policy as the
+blocking client (see graph_http).
+"""
+
+import asyncio
+import os
+import threading
+import logging
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Dict
+import httpx
+from .graph_http import GraphRetryPolicy, get_graph_http_stats, parse_retry_after
+from .microsoft_graph import MicrosoftGraphService, GraphRequestError, split_delta_page
+
+logger = logging.getLogger(__name__)
+
+GRAPH_BASE_URL = 'https://graph.microsoft.com/v1.0'
+
+_loop = None
+_loop_pid = None
+_loop_lock = threading.Lock()
+
+def _get_event_loop():
+    """
+    Get the process-wide event loop running in a background thread.
+    
+    The httpx connection pool binds to the loop it was first used on, so every
+    fetch runs on this one loop instead of a fresh asyncio.run.
+    """
+    global _loop, _loop_pid
+    
+    with _loop_lock:
+        if _loop is None or _loop_pid != os.getpid():
+            _loop = asyncio.new_event_loop()
+            _loop_pid = os.getpid()
+            thread = threading.Thread(target=_loop.run_forever, name='graph-event-loop', daemon=True)
+            thread.start()
+        return _loop
+
+class AsyncGraphClient:
+    """Concurrent Graph reads with a bounded connection pool and per-mailbox request limits."""
+    
+    def __init__(self, config):
+        self.config = config
+        self.max_connections = max(1, int(config.get('GRAPH_MAX_CONNECTIONS', 20)))
+        self.mailbox_concurrency = max(1, int(config.get('GRAPH_MAILBOX_CONCURRENCY', 4)))
+        self.fields = MicrosoftGraphService(config)  # Same $select lists as the blocking client
+        self.retry_policy = GraphRetryPolicy(config)
+        self._client = None
+        self._mailbox_limits = {}
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """Create the pooled HTTP client on first use (on the event loop)."""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+                headers={'Accept-Encoding': 'gzip, deflate'},
+                timeout=15
+            )
+        return self._client
+    
+    def _mailbox_limit(self, mailbox: str) -> asyncio.Semaphore:
+        if mailbox not in self._mailbox_limits:
+            self._mailbox_limits[mailbox] = asyncio.Semaphore(self.mailbox_concurrency)
+        return self._mailbox_limits[mailbox]
+    
+    async def get_json(self, mailbox: str, access_token: str, url: str, params: Dict = None, headers: Dict = None) -> Dict:
+        """
+        GET a Graph resource as one of the mailbox's concurrent requests.
+        
+        Throttling and transient failures are retried without holding a slot
+        of the mailbox; raises GraphRequestError on a final non-200 response.
+        """
+        request_headers = {'Authorization': f'Bearer {access_token}'}
+        request_headers.update(headers or {})
+        stats = get_graph_http_stats()
+        
+        attempt = 0
+        while True:
+            try:
+                async with self._mailbox_limit(mailbox):
+                    response = await self._get_client().get(url, params=params, headers=request_headers)
+            except httpx.TransportError as e:
+                stats.record_attempt()
+                if not self.retry_policy.should_retry(attempt):
+                    raise
+                wait = self.retry_policy.delay(attempt)
+                logger.warning(f"Graph connection error ({str(e)[:200]}), retrying in {wait:.1f}s")
+            else:
+                stats.record_attempt(response.status_code)
+                if response.status_code == 200:
+                    return response.json()
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                wait = self.retry_policy.delay(attempt, retry_after)
+                if wait is None or not self.retry_policy.should_retry(attempt, response.status_code):
+                    logger.error(f"Graph API error: {response.status_code} - {response.text}")
+                    raise GraphRequestError(response.status_code, response.text, retry_after=retry_after)
+                logger.warning(f"Graph returned {response.status_code}, retrying in {wait:.1f}s")
+            
+            stats.record_retry(wait)
+            await asyncio.sleep(wait)
+            attempt += 1
+    
+    async def iter_pages(self, mailbox: str, access_token: str, url: str, params: Dict = None, page_size: int = None):
+        """Async version of MicrosoftGraphService.iter_pages: pages of a collection, following @odata.nextLink."""
+        headers = {'Prefer': f'odata.maxpagesize={page_size}'} if page_size else None
+        while url:
+            page = await self.get_json(mailbox, access_token, url, params, headers)
+            params = None  # nextLink already carries the query
+            yield page
+            url = page.get('@odata.nextLink')
+    
+    async def fetch_delta(self, mailbox: str, access_token: str, folder: str = 'inbox', delta_link: str = None,
+                          since: datetime = None, page_size: int = 50, max_messages: int = None) -> Dict:
+        """
+        Async version of MicrosoftGraphService.get_delta_emails.
+        
+        Returns 'value', 'removed' and the watermark to store; when `max_messages`
+        is reached first that is the pending '@odata.nextLink'. If the stored
+        watermark expired, the result has 'resync_required' set and the caller
+        starts a new round. Raises GraphRequestError on other errors.
+        """
+        if delta_link:
+            url = delta_link
+            params = None
+        else:
+            url = f'{GRAPH_BASE_URL}/me/mailFolders/{folder}/messages/delta'
+            params = {'$select': self.fields._message_select_fields(folder)}
+            if since:
+                params['$filter'] = f"receivedDateTime ge {since.strftime('%Y-%m-%dT%H:%M:%SZ')}"
+        
+        messages = []
+        removed = []
+        try:
+            async for raw_page in self.iter_pages(mailbox, access_token, url, params, page_size=page_size):
+                page = split_delta_page(raw_page)
+                messages.extend(page['value'])
+                removed.extend(page['removed'])
+                
+                if '@odata.deltaLink' in page:
+                    return {'value': messages, 'removed': removed, '@odata.deltaLink': page['@odata.deltaLink']}
+                if max_messages and len(messages) + len(removed) >= max_messages:
+                    return {'value': messages, 'removed': removed, '@odata.nextLink': page['@odata.nextLink']}
+        except GraphRequestError as e:
+            if e.status_code == 410 and delta_link:
+                logger.warning(f"Delta watermark expired for folder {folder}, full resync required")
+                return {'resync_required': True}
+            raise
+        raise GraphRequestError(200, 'Delta response ended without deltaLink or nextLink')
+    
+    def submit(self, coroutine) -> Future:
+        """Schedule a coroutine of this client on the Graph event loop; the Future is usable from any thread."""
+        return asyncio.run_coroutine_threadsafe(coroutine, _get_event_loop())
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+def get_async_graph_client(config) -> AsyncGraphClient:
+    """Get the process-wide client, so every fan-out shares one connection pool and the per-mailbox limits."""
+    global _client, _client_pid
+    
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = AsyncGraphClient(config)
+            _client_pid = os.getpid()
+        return _client
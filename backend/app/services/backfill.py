@@ -0,0 +1,270 @@
+"""
+Mailbox Backfill
+Imports the history of a mailbox folder in receivedDateTime windows, fetched in parallel.
+
+A BackfillJob splits its time range into windows of BACKFILL_WINDOW_DAYS,
+newest first. Up to BACKFILL_CONCURRENCY windows of the mailbox are fetched
+at a time (Graph throttles more than four concurrent requests per mailbox),
+and every page goes through the same ingest as /sync. Each stored page
+checkpoints its window with the @odata.nextLink to continue from, in the
+same transaction, so a job whose process died resumes after the last stored
+page of every window. New emails are queued for classification at
+BACKFILL_CLASSIFICATION_PRIORITY, behind the emails of regular syncs.
+"""
+
+import os
+import socket
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+from flask import current_app
+from sqlalchemy import func, or_
+from app import db
+from app.models.email import Email
+from app.models.email_account import EmailAccount
+from app.models.classification_job import ClassificationJob
+from app.models.backfill_job import BackfillJob
+from app.models.backfill_window import BackfillWindow
+from .email_ingest import ingest_messages
+from .microsoft_graph import MicrosoftGraphService, GraphRequestError
+from .near_duplicates import NearDuplicateIndex
+
+logger = logging.getLogger(__name__)
+
+def active_backfill_job(email_account_id: str, folder: str = 'inbox') -> Optional[BackfillJob]:
+    """The unfinished backfill of an account's folder, if any."""
+    return BackfillJob.query.filter(
+        BackfillJob.email_account_id == email_account_id,
+        BackfillJob.folder == folder,
+        BackfillJob.state.in_(BackfillJob.ACTIVE_STATES)
+    ).first()
+
+def create_backfill_job(email_account, since: datetime, until: datetime = None,
+                        window_days: int = 30, folder: str = 'inbox') -> BackfillJob:
+    """New job importing [since, until) of a folder, split into windows (caller commits)."""
+    until = until or datetime.now(timezone.utc)
+    job = BackfillJob(
+        email_account_id=email_account.id,
+        folder=folder,
+        range_start=since,
+        range_end=until,
+        window_days=window_days,
+        state='pending'
+    )
+    db.session.add(job)
+    
+    window_end = until
+    while window_end > since:
+        window_start = max(since, window_end - timedelta(days=window_days))
+        job.windows.append(BackfillWindow(window_start=window_start, window_end=window_end, state='pending'))
+        window_end = window_start
+    job.windows_total = len(job.windows)
+    return job
+
+class BackfillRunner:
+    """Runs one backfill job: a lease on the job, a thread pool over its pending windows."""
+    
+    def __init__(self, app=None, runner_id=None):
+        self.app = app or current_app._get_current_object()
+        config = self.app.config
+        self.runner_id = runner_id or f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+        self.concurrency = max(1, int(config.get('BACKFILL_CONCURRENCY', 4)))
+        self.page_size = int(config.get('BACKFILL_PAGE_SIZE', 100))
+        self.lease_seconds = int(config.get('BACKFILL_LEASE_SECONDS', 120))
+        self.max_attempts = int(config.get('BACKFILL_MAX_ATTEMPTS', 5))
+        self.priority = int(config.get('BACKFILL_CLASSIFICATION_PRIORITY', 5))
+        self.max_classification_attempts = config.get('CLASSIFICATION_MAX_ATTEMPTS', 5)
+        self.service = MicrosoftGraphService(config)
+    
+    def claim(self, job_id: str) -> bool:
+        """Take the job's lease and commit: a new or failed job, or one whose runner stopped renewing it."""
+        now = datetime.now(timezone.utc)
+        claimed = BackfillJob.query.filter(
+            BackfillJob.id == job_id,
+            BackfillJob.state.in_(('pending', 'running', 'failed')),
+            or_(
+                BackfillJob.lease_expires_at.is_(None),
+                BackfillJob.lease_expires_at < now,
+                BackfillJob.lease_owner == self.runner_id
+            )
+        ).update({
+            'state': 'running',
+            'lease_owner': self.runner_id,
+            'lease_expires_at': now + timedelta(seconds=self.lease_seconds),
+            'started_at': func.coalesce(BackfillJob.started_at, now),
+            'completed_at': None
+        }, synchronize_session=False)
+        db.session.commit()
+        return claimed == 1
+    
+    def _add(self, job_id: str, **counts):
+        """Add to the job's progress counters in SQL, so concurrent windows never lose an update (caller commits)."""
+        BackfillJob.query.filter(BackfillJob.id == job_id).update(
+            {getattr(BackfillJob, name): getattr(BackfillJob, name) + value for name, value in counts.items()},
+            synchronize_session=False
+        )
+    
+    def _heartbeat(self, job_id: str, active_seconds: float):
+        """Renew the lease and add the running time since the last heartbeat."""
+        BackfillJob.query.filter(BackfillJob.id == job_id, BackfillJob.lease_owner == self.runner_id).update({
+            'lease_expires_at': datetime.now(timezone.utc) + timedelta(seconds=self.lease_seconds),
+            'active_seconds': BackfillJob.active_seconds + active_seconds
+        }, synchronize_session=False)
+        db.session.commit()
+    
+    def run(self, job_id: str) -> Optional[Dict]:
+        """
+        Fetch every pending window of a job and return its final progress.
+        
+        Returns None when another process holds the job's lease.
+        """
+        if not self.claim(job_id):
+            logger.info(f"Backfill {job_id} is already running elsewhere or finished")
+            return None
+        
+        # Windows cut short by a crash, and failed ones on a retry, continue from their checkpoint
+        reset = BackfillWindow.query.filter(
+            BackfillWindow.job_id == job_id,
+            BackfillWindow.state.in_(('running', 'failed'))
+        ).update({'state': 'pending', 'attempts': 0}, synchronize_session=False)
+        BackfillJob.query.filter(BackfillJob.id == job_id).update(
+            {'windows_failed': 0, 'last_error': None}, synchronize_session=False
+        )
+        db.session.commit()
+        
+        window_ids = [
+            row.id for row in BackfillWindow.query.with_entities(BackfillWindow.id).filter(
+                BackfillWindow.job_id == job_id, BackfillWindow.state == 'pending'
+            ).order_by(BackfillWindow.window_end.desc())
+        ]
+        logger.info(f"📥 Backfill {job_id}: {len(window_ids)} windows to fetch ({reset} resumed), {self.concurrency} at a time")
+        
+        last_beat = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='backfill') as pool:
+            pending = {pool.submit(self._run_window_in_context, window_id) for window_id in window_ids}
+            while pending:
+                _, pending = wait(pending, timeout=max(1.0, self.lease_seconds / 3))
+                now = time.monotonic()
+                self._heartbeat(job_id, now - last_beat)
+                last_beat = now
+        
+        job = db.session.get(BackfillJob, job_id)
+        db.session.refresh(job)
+        job.state = 'failed' if job.windows_failed else 'completed'
+        job.completed_at = datetime.now(timezone.utc)
+        job.lease_owner = None
+        job.lease_expires_at = None
+        db.session.commit()
+        
+        logger.info(
+            f"📥 Backfill {job_id} {job.state}: {job.messages_fetched} messages "
+            f"({job.messages_inserted} new) at {job.messages_per_second}/s, {job.windows_failed} windows failed"
+        )
+        return job.to_dict()
+    
+    def _run_window_in_context(self, window_id: int):
+        with self.app.app_context():
+            try:
+                self._run_window(window_id)
+            except Exception as e:
+                logger.error(f"Backfill window {window_id} crashed: {str(e)}")
+                db.session.rollback()
+            finally:
+                db.session.remove()
+    
+    def _run_window(self, window_id: int):
+        """Fetch one window to the end, retrying from its checkpoint after errors and throttling."""
+        window = db.session.get(BackfillWindow, window_id)
+        window.state = 'running'
+        db.session.commit()
+        
+        while True:
+            try:
+                self._fetch_window(window)
+                window.state = 'done'
+                window.next_link = None
+                window.last_error = None
+                window.completed_at = datetime.now(timezone.utc)
+                self._add(window.job_id, windows_done=1)
+                db.session.commit()
+                return
+            except Exception as e:
+                db.session.rollback()
+                window.attempts += 1
+                window.last_error = str(e)[:1000]
+                # Throttling was already retried by the Graph HTTP layer; a rejected token will not recover by waiting
+                if window.attempts >= self.max_attempts or (isinstance(e, GraphRequestError) and e.is_auth_error):
+                    window.state = 'failed'
+                    self._add(window.job_id, windows_failed=1)
+                    BackfillJob.query.filter(BackfillJob.id == window.job_id).update(
+                        {'last_error': window.last_error}, synchronize_session=False
+                    )
+                    db.session.commit()
+                    logger.error(f"Backfill window {window} failed after {window.attempts} attempts: {window.last_error}")
+                    return
+                db.session.commit()
+                
+                if isinstance(e, GraphRequestError) and e.retry_after:
+                    delay = e.retry_after
+                else:
+                    delay = min(60, 2 ** window.attempts)
+                logger.warning(f"Backfill window {window} error ({str(e)[:200]}), retrying in {delay:.0f}s")
+                time.sleep(delay)
+    
+    def _fetch_window(self, window: BackfillWindow):
+        job = window.job
+        email_account = db.session.get(EmailAccount, job.email_account_id)
+        
+        if window.next_link:
+            pages = self.service.iter_pages(email_account.access_token, window.next_link)
+        else:
+            pages = self.service.iter_email_pages(
+                email_account.access_token,
+                folder=job.folder,
+                page_size=self.page_size,
+                received_after=window.window_start,
+                received_before=window.window_end
+            )
+        
+        for page in pages:
+            messages = page.get('value', [])
+            inserted, _, _, new_emails, header_classified = ingest_messages(email_account, messages)
+            
+            # Near-duplicates of classified emails inherit their classification; the rest waits behind regular syncs
+            queued = 0
+            if new_emails:
+                emails = Email.query.filter(Email.id.in_([email['email_id'] for email in new_emails])).all()
+                _, remaining = NearDuplicateIndex().inherit_classifications(emails)
+                queued = len(ClassificationJob.enqueue(
+                    remaining, priority=self.priority, max_attempts=self.max_classification_attempts
+                ))
+            
+            # Checkpoint in the same transaction as the page
+            window.next_link = page.get('@odata.nextLink')
+            window.messages_fetched += len(messages)
+            self._add(
+                job.id,
+                messages_fetched=len(messages),
+                messages_inserted=inserted,
+                header_classified=header_classified,
+                classification_queued=queued
+            )
+            db.session.commit()
+
+def start_backfill(app, job_id: str):
+    """Run a backfill job on a daemon thread of this process."""
+    def run():
+        with app.app_context():
+            try:
+                BackfillRunner(app).run(job_id)
+            except Exception as e:
+                logger.error(f"Backfill {job_id} failed: {str(e)}")
+            finally:
+                db.session.remove()
+    
+    thread = threading.Thread(target=run, name=f'backfill-{job_id[:8]}', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,120 @@
+"""
+Body Hydration
+Fetches the full bodies of emails synced metadata-first.
+
+Syncs store Graph's bodyPreview and leave body_content empty (NULL). The
+body is fetched when someone opens the email, or ahead of time by the
+BodyPrefetcher for recent mail classified as BODY_PREFETCH_URGENCIES, which
+is the mail most likely to be opened and answered.
+"""
+
+import threading
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict
+from flask import current_app
+from app import db
+from app.models.email import Email
+from app.models.email_account import EmailAccount
+from .microsoft_graph import MicrosoftGraphService
+
+logger = logging.getLogger(__name__)
+
+BODY_FIELDS = 'id,body'
+
+class BodyHydrationStats:
+    """Bodies fetched on demand and by the prefetcher, and fetch failures, for this process."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.on_demand = 0
+        self.prefetched = 0
+        self.failed = 0
+        self.bytes = 0
+    
+    def record(self, prefetch: bool, size: int = None):
+        with self._lock:
+            if size is None:
+                self.failed += 1
+                return
+            if prefetch:
+                self.prefetched += 1
+            else:
+                self.on_demand += 1
+            self.bytes += size
+    
+    def snapshot(self) -> Dict:
+        with self._lock:
+            fetched = self.on_demand + self.prefetched
+            return {
+                'on_demand': self.on_demand,
+                'prefetched': self.prefetched,
+                'failed': self.failed,
+                'avg_body_bytes': round(self.bytes / fetched) if fetched else 0
+            }
+
+_stats = BodyHydrationStats()
+
+def get_body_hydration_stats() -> BodyHydrationStats:
+    return _stats
+
+def hydrate_body(email: Email, service: MicrosoftGraphService = None, prefetch: bool = False) -> bool:
+    """Fetch and store the full body of an email (caller commits). Returns whether it is stored."""
+    if email.has_body:
+        return True
+    
+    access_token = email.email_account.access_token if email.email_account else None
+    if not access_token:
+        return False
+    
+    service = service or MicrosoftGraphService()
+    message = service.get_email_by_id(access_token, email.microsoft_email_id, select=BODY_FIELDS)
+    if not message:
+        _stats.record(prefetch)
+        return False
+    
+    email.apply_graph_body(message)
+    _stats.record(prefetch, len(email.body_content))
+    return True
+
+class BodyPrefetcher:
+    """Fetches the bodies of recent urgent mail before anyone opens it."""
+    
+    def __init__(self, config=None):
+        self.config = config or current_app.config
+        self.enabled = self.config.get('BODY_PREFETCH_ENABLED', True)
+        self.urgencies = [
+            urgency.strip() for urgency in self.config.get('BODY_PREFETCH_URGENCIES', 'urgent,high').split(',') if urgency.strip()
+        ]
+        self.batch_size = int(self.config.get('BODY_PREFETCH_BATCH', 20))
+        self.max_age_days = int(self.config.get('BODY_PREFETCH_MAX_AGE_DAYS', 14))
+        self.service = MicrosoftGraphService(self.config)
+        self._failed = set()  # Not retried by this prefetcher, so they cannot hold up the rest
+    
+    def prefetch(self) -> int:
+        """Fetch one batch of missing bodies, newest first, and commit. Returns how many were stored."""
+        if not self.enabled or not self.urgencies:
+            return 0
+        
+        query = Email.query.join(EmailAccount, EmailAccount.id == Email.email_account_id).filter(
+            Email.body_content.is_(None),
+            Email.is_classified == True,
+            Email.urgency_category.in_(self.urgencies),
+            Email.received_at >= datetime.now(timezone.utc) - timedelta(days=self.max_age_days),
+            EmailAccount.is_active == True
+        )
+        if self._failed:
+            query = query.filter(Email.id.notin_(self._failed))
+        emails = query.order_by(Email.received_at.desc()).limit(self.batch_size).all()
+        
+        stored = 0
+        for email in emails:
+            if hydrate_body(email, self.service, prefetch=True):
+                stored += 1
+            else:
+                self._failed.add(email.id)
+        db.session.commit()
+        
+        if stored:
+            logger.info(f"📄 Prefetched {stored} of {len(emails)} bodies of urgent emails")
+        return stored
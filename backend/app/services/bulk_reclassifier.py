@@ -0,0 +1,377 @@
+"""
+Bulk Reclassifier
+Offline reclassification of stored emails through the OpenAI Batch API.
+
+A run lives in its own directory:
+    state.json            checkpoint: parts, batch ids and what has been applied
+    requests-NNN.jsonl    one chat completion request per email
+    results-NNN.jsonl     provider output, downloaded when a part completes
+                          (a batch that expires half answered gets a new part
+                          with the requests it left unanswered)
+    changes-NNN.jsonl     emails whose urgency changed (dry run or applied)
+
+Every step saves the checkpoint, so an interrupted run resumes where it
+stopped. Batch requests have their own quota, so the interactive rate
+limits of the classification worker are not touched.
+"""
+
+import os
+import re
+import json
+import uuid
+import time
+import logging
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import or_
+from sqlalchemy.orm import joinedload
+
+from app import db
+from app.models.email import Email, USER_CORRECTION_MODEL
+from .keyword_rules import get_rules_engine
+from .prompts import (
+    build_classification_prompt, parse_classification_response, validate_classification,
+    CLASSIFICATION_SCHEMA, PROMPT_VERSION
+)
+
+logger = logging.getLogger(__name__)
+
+RUN_STATE_FILE = 'state.json'
+CHAT_COMPLETIONS_ENDPOINT = '/v1/chat/completions'
+
+# Batch statuses after which no output will arrive
+FAILED_BATCH_STATUSES = ('failed', 'expired', 'cancelled')
+
+class OpenAIBatchBackend:
+    """Submits request files to the OpenAI Batch API (24h completion window)."""
+    
+    name = 'openai'
+    
+    def __init__(self, client):
+        self.client = client
+    
+    def submit(self, request_path: str) -> str:
+        with open(request_path, 'rb') as f:
+            batch_file = self.client.files.create(file=f, purpose='batch')
+        batch = self.client.batches.create(
+            input_file_id=batch_file.id, endpoint=CHAT_COMPLETIONS_ENDPOINT, completion_window='24h'
+        )
+        return batch.id
+    
+    def poll(self, batch_id: str) -> Tuple[str, Optional[str]]:
+        """(status, output JSONL once the batch is done); expired batches return what finished."""
+        batch = self.client.batches.retrieve(batch_id)
+        if batch.status not in ('completed', 'expired'):
+            return batch.status, None
+        output = self.client.files.content(batch.output_file_id).text if batch.output_file_id else ''
+        return batch.status, output
+
+class LocalBatchBackend:
+    """
+    File-based stand-in for the Batch API, to run the whole flow without a provider.
+    
+    Answers every request with the keyword rules engine, in the Batch API's
+    output format, the first time it is polled.
+    """
+    
+    name = 'local'
+    
+    SENDER_PATTERN = re.compile(r'Remitente:.*<([^>]*)>')
+    SUBJECT_PATTERN = re.compile(r'Asunto: (.*)')
+    
+    def __init__(self, jobs_dir: str):
+        self.jobs_dir = jobs_dir
+        os.makedirs(jobs_dir, exist_ok=True)
+    
+    def submit(self, request_path: str) -> str:
+        batch_id = f"local-{uuid.uuid4().hex[:12]}"
+        with open(request_path, encoding='utf-8') as src, \
+                open(os.path.join(self.jobs_dir, f'{batch_id}.jsonl'), 'w', encoding='utf-8') as dst:
+            dst.write(src.read())
+        return batch_id
+    
+    def _answer(self, request: Dict) -> Dict:
+        prompt = request['body']['messages'][-1]['content']
+        sender = self.SENDER_PATTERN.search(prompt)
+        subject = self.SUBJECT_PATTERN.search(prompt)
+        classification = get_rules_engine().classify({
+            'subject': subject.group(1) if subject else '',
+            'body_preview': prompt,
+            'sender_email': sender.group(1) if sender else ''
+        })
+        classification.pop('classification_model', None)
+        return {
+            'id': f"batch_req_{uuid.uuid4().hex[:12]}",
+            'custom_id': request['custom_id'],
+            'response': {
+                'status_code': 200,
+                'body': {'choices': [{'message': {'role': 'assistant', 'content': json.dumps(classification)}}]}
+            },
+            'error': None
+        }
+    
+    def poll(self, batch_id: str) -> Tuple[str, Optional[str]]:
+        with open(os.path.join(self.jobs_dir, f'{batch_id}.jsonl'), encoding='utf-8') as f:
+            lines = [json.dumps(self._answer(json.loads(line)), ensure_ascii=False) for line in f if line.strip()]
+        return 'completed', '\n'.join(lines) + '\n'
+
+def _empty_report() -> Dict:
+    return {'emails': 0, 'answered': 0, 'unparsed': 0, 'missing': 0, 'skipped': 0, 'changed': 0, 'transitions': {}}
+
+class BulkReclassifier:
+    """Checkpointed prepare -> submit -> poll -> apply over one run directory."""
+    
+    def __init__(self, config, backend, run_dir: str, service=None):
+        from .openai_service import OpenAIService
+        
+        self.config = config
+        self.backend = backend
+        self.run_dir = run_dir
+        self.service = service or OpenAIService(config)
+        self.max_requests = int(config.get('BULK_RECLASSIFY_MAX_REQUESTS', 50000))
+        self.state: Dict = {}
+        
+        if os.path.exists(self._path(RUN_STATE_FILE)):
+            with open(self._path(RUN_STATE_FILE), encoding='utf-8') as f:
+                self.state = json.load(f)
+            if self.state.get('prompt_version') != PROMPT_VERSION:
+                logger.warning(
+                    f"Run {run_dir} was prepared with prompt version {self.state.get('prompt_version')}, "
+                    f"current is {PROMPT_VERSION} - its request files are kept as they are"
+                )
+    
+    def _path(self, name: str) -> str:
+        return os.path.join(self.run_dir, name)
+    
+    def _save_state(self):
+        """Write the checkpoint atomically, so a crash never leaves half a state file."""
+        tmp_path = self._path(f'{RUN_STATE_FILE}.{os.getpid()}.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self._path(RUN_STATE_FILE))
+    
+    @property
+    def prepared(self) -> bool:
+        return bool(self.state.get('parts'))
+    
+    def prepare(self, limit: int = None, account_id: str = None) -> int:
+        """Write one request per classified email (user corrections excluded); returns the count."""
+        os.makedirs(self.run_dir, exist_ok=True)
+        
+        query = Email.query.options(joinedload(Email.email_account)).filter(
+            Email.is_classified == True,
+            or_(Email.classification_model.is_(None), Email.classification_model != USER_CORRECTION_MODEL)
+        )
+        if account_id:
+            query = query.filter(Email.email_account_id == account_id)
+        query = query.order_by(Email.id)
+        if limit:
+            query = query.limit(limit)
+        
+        parts, f, total = [], None, 0
+        for email in query.yield_per(1000):
+            if total % self.max_requests == 0:
+                if f:
+                    f.close()
+                parts.append({'index': len(parts), 'requests': f'requests-{len(parts):03d}.jsonl',
+                              'count': 0, 'batch_id': None, 'status': 'prepared'})
+                f = open(self._path(parts[-1]['requests']), 'w', encoding='utf-8')
+            
+            system_prompt, prompt = build_classification_prompt(email.to_classification_payload())
+            f.write(json.dumps({
+                'custom_id': str(email.id),
+                'method': 'POST',
+                'url': CHAT_COMPLETIONS_ENDPOINT,
+                'body': self.service._completion_request(
+                    system_prompt, prompt, self.service.output_tokens, CLASSIFICATION_SCHEMA
+                )
+            }, ensure_ascii=False) + '\n')
+            parts[-1]['count'] += 1
+            total += 1
+        if f:
+            f.close()
+        
+        self.state = {
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'backend': self.backend.name,
+            'model': self.service.model,
+            'prompt_version': PROMPT_VERSION,
+            'total': total,
+            'parts': parts
+        }
+        self._save_state()
+        logger.info(f"Prepared {total} requests in {len(parts)} file(s) under {self.run_dir}")
+        return total
+    
+    def submit_pending(self):
+        """Submit parts not yet submitted, and resubmit parts whose batch failed."""
+        for part in self.state['parts']:
+            if part['status'] not in ('prepared', 'failed'):
+                continue
+            part['batch_id'] = self.backend.submit(self._path(part['requests']))
+            part['status'] = 'submitted'
+            part['submitted_at'] = datetime.now(timezone.utc).isoformat()
+            self._save_state()
+            logger.info(f"Submitted part {part['index']} ({part['count']} requests) as batch {part['batch_id']}")
+    
+    def _resubmit_unanswered(self, part: Dict, output: str) -> Optional[Dict]:
+        """Write the requests of `part` missing from `output` to a new 'prepared' part; returns it, if any."""
+        answered = {json.loads(line)['custom_id'] for line in output.splitlines() if line.strip()}
+        with open(self._path(part['requests']), encoding='utf-8') as f:
+            unanswered = [line for line in f if line.strip() and json.loads(line)['custom_id'] not in answered]
+        if not unanswered:
+            return None
+        
+        index = len(self.state['parts'])
+        retry = {'index': index, 'requests': f'requests-{index:03d}.jsonl', 'count': len(unanswered),
+                 'batch_id': None, 'status': 'prepared', 'retry_of': part['index']}
+        with open(self._path(retry['requests']), 'w', encoding='utf-8') as f:
+            f.writelines(unanswered)
+        self.state['parts'].append(retry)
+        part['retry_part'] = index
+        return retry
+    
+    def poll(self) -> int:
+        """Download the output of finished batches; returns the number of parts still running or to resubmit."""
+        running = 0
+        for part in list(self.state['parts']):
+            if part['status'] != 'submitted':
+                continue
+            
+            status, output = self.backend.poll(part['batch_id'])
+            if output is not None:
+                part['results'] = f"results-{part['index']:03d}.jsonl"
+                with open(self._path(part['results']), 'w', encoding='utf-8') as f:
+                    f.write(output)
+                retry = self._resubmit_unanswered(part, output) if status == 'expired' else None
+                part['status'] = 'completed'
+                self._save_state()
+                logger.info(f"Batch {part['batch_id']} {status}, results saved to {part['results']}")
+                if retry:
+                    running += 1
+                    logger.warning(f"{retry['count']} unanswered requests of batch {part['batch_id']} go to part {retry['index']}")
+            elif status in FAILED_BATCH_STATUSES:
+                part['status'] = 'failed'
+                self._save_state()
+                logger.warning(f"Batch {part['batch_id']} {status} - it is resubmitted on the next resume")
+            else:
+                running += 1
+        return running
+    
+    def _read_results(self, part: Dict) -> Dict[str, Optional[Dict]]:
+        """{email_id: validated classification, or None if the answer was an error or unparseable}."""
+        results = {}
+        with open(self._path(part['results']), encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                item = json.loads(line)
+                try:
+                    content = item['response']['body']['choices'][0]['message']['content']
+                    results[item['custom_id']] = validate_classification(parse_classification_response(content))
+                except (KeyError, IndexError, TypeError, ValueError):
+                    results[item['custom_id']] = None
+        return results
+    
+    def _apply_part(self, part: Dict, dry_run: bool) -> Dict:
+        """Diff one part's results against the stored urgencies and, unless `dry_run`, apply them."""
+        report = _empty_report()
+        with open(self._path(part['requests']), encoding='utf-8') as f:
+            email_ids = [json.loads(line)['custom_id'] for line in f if line.strip()]
+        results = self._read_results(part)
+        if part.get('retry_part') is not None:
+            # Unanswered requests of an expired batch are reported with the part they were resubmitted in
+            email_ids = [email_id for email_id in email_ids if email_id in results]
+        transitions = Counter()
+        
+        with open(self._path(f"changes-{part['index']:03d}.jsonl"), 'w', encoding='utf-8') as changes:
+            for start in range(0, len(email_ids), 500):
+                chunk = email_ids[start:start + 500]
+                emails = {str(email.id): email for email in Email.query.filter(Email.id.in_(chunk))}
+                
+                for email_id in chunk:
+                    report['emails'] += 1
+                    email = emails.get(email_id)
+                    if email_id not in results:
+                        report['missing'] += 1
+                        continue
+                    if results[email_id] is None:
+                        report['unparsed'] += 1
+                        continue
+                    # Deleted since prepare, or corrected by a user in the meantime
+                    if email is None or email.classification_model == USER_CORRECTION_MODEL:
+                        report['skipped'] += 1
+                        continue
+                    
+                    classification = results[email_id]
+                    report['answered'] += 1
+                    old_urgency, new_urgency = email.urgency_category, classification['urgency_category']
+                    transitions[f"{old_urgency}->{new_urgency}"] += 1
+                    if old_urgency != new_urgency:
+                        report['changed'] += 1
+                        changes.write(json.dumps({
+                            'email_id': email_id,
+                            'subject': (email.subject or '')[:120],
+                            'old_urgency': old_urgency,
+                            'new_urgency': new_urgency,
+                            'old_confidence': email.ai_confidence,
+                            'new_confidence': classification['confidence_score'],
+                            'reasoning': classification.get('reasoning')
+                        }, ensure_ascii=False) + '\n')
+                    
+                    if not dry_run:
+                        email.apply_classification(classification, self.state['model'])
+                
+                if not dry_run:
+                    db.session.commit()
+        
+        report['transitions'] = dict(transitions)
+        return report
+    
+    def apply_completed(self, dry_run: bool = False):
+        """
+        Apply (or with `dry_run`, only diff) every completed part.
+        
+        A dry-run part stays 'completed', so resuming the run without
+        --dry-run applies the same results without resubmitting them.
+        """
+        for part in self.state['parts']:
+            if part['status'] != 'completed' or (dry_run and 'report' in part):
+                continue
+            part['report'] = self._apply_part(part, dry_run)
+            if not dry_run:
+                part['status'] = 'applied'
+                part['applied_at'] = datetime.now(timezone.utc).isoformat()
+            self._save_state()
+            logger.info(f"{'Diffed' if dry_run else 'Applied'} part {part['index']}: {part['report']['changed']} urgency changes")
+    
+    def report(self) -> Dict:
+        """Diff report over every part with results: counts and old->new urgency transitions."""
+        report = _empty_report()
+        transitions = Counter()
+        for part in self.state.get('parts', []):
+            part_report = part.get('report')
+            if not part_report:
+                continue
+            for key in ('emails', 'answered', 'unparsed', 'missing', 'skipped', 'changed'):
+                report[key] += part_report[key]
+            transitions.update(part_report['transitions'])
+        report['transitions'] = dict(transitions.most_common())
+        report['change_rate'] = round(report['changed'] / report['answered'], 3) if report['answered'] else 0.0
+        report['parts'] = Counter(part['status'] for part in self.state.get('parts', []))
+        return report
+    
+    def run(self, poll_interval: float = 60, dry_run: bool = False, wait: bool = True) -> Dict:
+        """Submit, poll and apply until every part is done (or once, if not `wait`); returns the report."""
+        self.submit_pending()
+        while True:
+            running = self.poll()
+            self.submit_pending()
+            self.apply_completed(dry_run)
+            if not running or not wait:
+                break
+            logger.info(f"{running} batch(es) still running, checking again in {poll_interval:.0f}s")
+            time.sleep(poll_interval)
+        return self.report()
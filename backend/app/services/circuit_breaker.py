@@ -0,0 +1,272 @@
+"""
+Circuit Breaker
+Per-provider health from a rolling window of call outcomes, shared across worker processes.
+
+closed     calls go through; opens when the window's failure rate (errors and
+           calls slower than the slow-call threshold) reaches the threshold
+open       calls fail fast with CircuitOpenError until the cooldown ends
+half_open  one probe call is let through; success closes the breaker,
+           failure opens it again
+
+State lives in the same kind of shared backend as the rate limiter
+(PostgreSQL row, lock file or process memory), so every worker sees a
+provider go down as soon as one of them does.
+"""
+
+import os
+import tempfile
+import threading
+import time
+import logging
+from datetime import datetime, timezone
+from typing import Callable, Dict
+
+from .rate_limiter import FileBackend, MemoryBackend, fcntl, is_rate_limit_error
+
+logger = logging.getLogger(__name__)
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+# Rolling window is kept as this many fixed buckets
+WINDOW_BUCKETS = 6
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose breaker is open."""
+
+class DatabaseBackend:
+    """Breaker state as JSON in the ai_provider_health table, locked with SELECT ... FOR UPDATE."""
+    
+    name = 'database'
+    
+    def __init__(self, engine):
+        from app.models.ai_provider_health import AIProviderHealth
+        self.engine = engine
+        self.table = AIProviderHealth.__table__
+    
+    def update(self, provider: str, fn: Callable[[Dict], object]):
+        table = self.table
+        
+        # Own short transaction, independent of the request's db.session
+        with self.engine.begin() as conn:
+            select_row = table.select().where(table.c.provider == provider).with_for_update()
+            row = conn.execute(select_row).mappings().first()
+            if row is None:
+                from sqlalchemy.dialects.postgresql import insert
+                conn.execute(insert(table).values(
+                    provider=provider, state={}, updated_at=datetime.now(timezone.utc)
+                ).on_conflict_do_nothing(index_elements=['provider']))
+                row = conn.execute(select_row).mappings().first()
+            
+            state = dict(row['state'] or {})
+            result = fn(state)
+            
+            conn.execute(table.update().where(table.c.provider == provider).values(
+                state=state, updated_at=datetime.now(timezone.utc)
+            ))
+            return result
+
+def _window_totals(state: Dict, now: float, window: float) -> Dict:
+    """Drop buckets older than the window and sum the rest."""
+    state['buckets'] = [bucket for bucket in state.get('buckets', []) if bucket[0] > now - window]
+    calls = sum(bucket[1] for bucket in state['buckets'])
+    failures = sum(bucket[2] for bucket in state['buckets'])
+    latency = sum(bucket[3] for bucket in state['buckets'])
+    return {
+        'calls': calls,
+        'failures': failures,
+        'failure_rate': failures / calls if calls else 0.0,
+        'avg_latency': latency / calls if calls else 0.0
+    }
+
+class CircuitBreaker:
+    """Circuit breaker of one provider over a shared state backend."""
+    
+    def __init__(self, provider: str, backend=None, window_seconds: float = 60.0, min_calls: int = 5,
+                 failure_threshold: float = 0.5, slow_call_seconds: float = 20.0,
+                 cooldown_seconds: float = 30.0, probe_timeout: float = 60.0):
+        self.provider = provider
+        self.backend = backend or MemoryBackend()
+        self.window_seconds = float(window_seconds)
+        self.min_calls = int(min_calls)
+        self.failure_threshold = float(failure_threshold)
+        self.slow_call_seconds = float(slow_call_seconds)
+        self.cooldown_seconds = float(cooldown_seconds)
+        self.probe_timeout = float(probe_timeout)
+    
+    def _open(self, state: Dict, now: float):
+        if state.get('state') != OPEN:
+            logger.warning(f"⚠️  {self.provider} circuit opened - failing fast for {self.cooldown_seconds:.0f}s")
+        state.update(state=OPEN, opened_at=now, probe_started_at=None)
+    
+    def _allow(self, state: Dict, now: float, claim: bool) -> bool:
+        current = state.get('state', CLOSED)
+        if current == CLOSED:
+            return True
+        if current == OPEN and now - (state.get('opened_at') or 0.0) < self.cooldown_seconds:
+            return False
+        # Cooldown over (or half-open): one probe at a time; a stuck probe is given up on
+        probe_started_at = state.get('probe_started_at')
+        if current == HALF_OPEN and probe_started_at and now - probe_started_at < self.probe_timeout:
+            return False
+        if claim:
+            state.update(state=HALF_OPEN, probe_started_at=now)
+        return True
+    
+    def allow_request(self) -> bool:
+        """Whether to make a call now; in half-open state this claims the single probe."""
+        now = time.time()
+        return self.backend.update(self.provider, lambda state: self._allow(state, now, claim=True))
+    
+    def available(self) -> bool:
+        """Whether a call would currently be allowed, without claiming the probe."""
+        now = time.time()
+        return self.backend.update(self.provider, lambda state: self._allow(state, now, claim=False))
+    
+    def record(self, success: bool, seconds: float):
+        """Record a call outcome; calls slower than slow_call_seconds count as failures."""
+        now = time.time()
+        failed = not success or seconds >= self.slow_call_seconds
+        bucket_width = self.window_seconds / WINDOW_BUCKETS
+        
+        def update(state):
+            totals_before = _window_totals(state, now, self.window_seconds)
+            buckets = state['buckets']
+            start = now - now % bucket_width
+            if not buckets or buckets[-1][0] != start:
+                buckets.append([start, 0, 0, 0.0])
+            buckets[-1][1] += 1
+            buckets[-1][2] += int(failed)
+            buckets[-1][3] += seconds
+            
+            current = state.get('state', CLOSED)
+            if current == HALF_OPEN:
+                if failed:
+                    self._open(state, now)
+                else:
+                    # Recovered: start over with a clean window
+                    logger.info(f"✅ {self.provider} circuit closed after a successful probe")
+                    state.update(state=CLOSED, opened_at=None, probe_started_at=None, buckets=[])
+            elif current == CLOSED:
+                calls = totals_before['calls'] + 1
+                failures = totals_before['failures'] + int(failed)
+                if calls >= self.min_calls and failures / calls >= self.failure_threshold:
+                    self._open(state, now)
+        
+        self.backend.update(self.provider, update)
+    
+    def guard(self):
+        """Raise CircuitOpenError unless a call is allowed now (claims the half-open probe)."""
+        if not self.allow_request():
+            raise CircuitOpenError(f"{self.provider} circuit is open - not calling the provider")
+    
+    def call(self, fn: Callable):
+        """
+        Run a provider call and record its outcome and latency.
+        
+        429s are left to the rate limiter, which already holds calls for
+        Retry-After, and do not count against the provider's health.
+        """
+        started = time.perf_counter()
+        try:
+            result = fn()
+        except Exception as e:
+            if not is_rate_limit_error(e):
+                self.record(False, time.perf_counter() - started)
+            raise
+        self.record(True, time.perf_counter() - started)
+        return result
+    
+    async def call_async(self, fn: Callable):
+        """Async version of call; `fn` returns an awaitable."""
+        started = time.perf_counter()
+        try:
+            result = await fn()
+        except Exception as e:
+            if not is_rate_limit_error(e):
+                self.record(False, time.perf_counter() - started)
+            raise
+        self.record(True, time.perf_counter() - started)
+        return result
+    
+    def _score(self, state: Dict, now: float) -> float:
+        if not self._allow(state, now, claim=False):
+            return 0.0
+        totals = _window_totals(state, now, self.window_seconds)
+        score = (1.0 - totals['failure_rate']) / (1.0 + totals['avg_latency'] / self.slow_call_seconds)
+        if state.get('state', CLOSED) != CLOSED:
+            score *= 0.5
+        return max(0.01, score)  # Only a breaker that refuses calls scores 0
+    
+    def health_score(self) -> float:
+        """0 when calls are refused, else up to 1 (no failures, instant answers); for routing between providers."""
+        now = time.time()
+        return self.backend.update(self.provider, lambda state: self._score(state, now))
+    
+    def snapshot(self) -> Dict:
+        now = time.time()
+        
+        def read(state):
+            totals = _window_totals(state, now, self.window_seconds)
+            opened_at = state.get('opened_at')
+            return {
+                'state': state.get('state', CLOSED),
+                'health_score': round(self._score(state, now), 3),
+                'window_calls': totals['calls'],
+                'window_failures': totals['failures'],
+                'failure_rate': round(totals['failure_rate'], 3),
+                'avg_latency_ms': round(1000 * totals['avg_latency'], 1),
+                'opened_at': datetime.fromtimestamp(opened_at, timezone.utc).isoformat() if opened_at else None,
+                'retry_in_seconds': round(max(0.0, opened_at + self.cooldown_seconds - now), 1)
+                                    if opened_at and state.get('state') == OPEN else 0.0
+            }
+        
+        return self.backend.update(self.provider, read)
+
+_backend = None
+_backend_pid = None
+_backend_lock = threading.Lock()
+
+def _get_backend(config):
+    """Pick the shared backend once per process, from AI_CIRCUIT_BREAKER_BACKEND."""
+    global _backend, _backend_pid
+    
+    with _backend_lock:
+        if _backend is not None and _backend_pid == os.getpid():
+            return _backend
+        
+        kind = config.get('AI_CIRCUIT_BREAKER_BACKEND') or config.get('AI_RATE_LIMIT_BACKEND', 'auto')
+        backend = None
+        
+        if kind in ('auto', 'database'):
+            try:
+                from app import db
+                if db.engine.dialect.name == 'postgresql':
+                    backend = DatabaseBackend(db.engine)
+                elif kind == 'database':
+                    logger.warning("AI circuit breaker database backend needs PostgreSQL - using file backend")
+            except Exception as e:
+                logger.warning(f"AI circuit breaker database backend unavailable: {e}")
+        
+        if backend is None and kind != 'memory':
+            if fcntl is not None:
+                path = config.get('AI_CIRCUIT_BREAKER_FILE') or os.path.join(tempfile.gettempdir(), 'emailmanager_ai_health.json')
+                backend = FileBackend(path)
+            else:
+                logger.warning("File locking not available - AI circuit breakers apply per process only")
+        
+        _backend = backend or MemoryBackend()
+        _backend_pid = os.getpid()
+        logger.info(f"AI circuit breakers using {_backend.name} backend")
+        return _backend
+
+def get_circuit_breaker(provider: str, config) -> CircuitBreaker:
+    """Get the circuit breaker for a provider, backed by the process-wide shared backend."""
+    return CircuitBreaker(
+        provider,
+        backend=_get_backend(config),
+        window_seconds=float(config.get('AI_CIRCUIT_BREAKER_WINDOW_SECONDS', 60)),
+        min_calls=int(config.get('AI_CIRCUIT_BREAKER_MIN_CALLS', 5)),
+        failure_threshold=float(config.get('AI_CIRCUIT_BREAKER_FAILURE_THRESHOLD', 0.5)),
+        slow_call_seconds=float(config.get('AI_CIRCUIT_BREAKER_SLOW_CALL_SECONDS', 20)),
+        cooldown_seconds=float(config.get('AI_CIRCUIT_BREAKER_COOLDOWN_SECONDS', 30))
+    )
@@ -0,0 +1,75 @@
+"""
+Classification Cache
+Answers repeated and bulk-mailed emails from cached classifications instead of the AI provider.
+"""
+
+import logging
+from typing import Callable, Dict, List
+from app.models.classification_cache import ClassificationCache
+from .prompts import PROMPT_VERSION
+
+logger = logging.getLogger(__name__)
+
+CACHE_MODEL_PREFIX = 'cache:'
+
+def is_cacheable(classification: Dict) -> bool:
+    """Only provider answers are cached - not rule-based fallbacks, earlier hits or rate-limit markers."""
+    return not classification.get('rate_limit_retry') and not classification.get('classification_model')
+
+def classify_with_cache(emails_data: List[Dict], model_name: str,
+                        classify_fn: Callable[[List[Dict]], List[Dict]], config) -> List[Dict]:
+    """
+    Classify emails, calling `classify_fn` only for content that is not cached.
+    
+    Identical emails within the same call are also classified once. Answers
+    that did not come from the provider carry `classification_model`
+    ('cache:<model>') so hit rates can be measured on the emails table.
+    """
+    if not emails_data or not config.get('CLASSIFICATION_CACHE_ENABLED', True):
+        return classify_fn(emails_data)
+    
+    keys = [ClassificationCache.make_key(email_data, model_name, PROMPT_VERSION) for email_data in emails_data]
+    
+    try:
+        cached = ClassificationCache.lookup(set(keys))
+    except Exception as e:
+        logger.warning(f"Classification cache unavailable: {str(e)}")
+        return classify_fn(emails_data)
+    
+    # One provider classification per distinct uncached content
+    misses = {}
+    for key, email_data in zip(keys, emails_data):
+        if key not in cached and key not in misses:
+            misses[key] = email_data
+    
+    fresh = {}
+    if misses:
+        fresh = dict(zip(misses, classify_fn(list(misses.values()))))
+        
+        try:
+            ClassificationCache.store(
+                {key: classification for key, classification in fresh.items() if is_cacheable(classification)},
+                model_name,
+                PROMPT_VERSION,
+                ttl_hours=float(config.get('CLASSIFICATION_CACHE_TTL_HOURS', 72)),
+                max_entries=int(config.get('CLASSIFICATION_CACHE_MAX_ENTRIES', 5000))
+            )
+        except Exception as e:
+            logger.warning(f"Could not store classifications in cache: {str(e)}")
+    
+    results = []
+    answered = set()
+    for key in keys:
+        if key in cached:
+            results.append(dict(cached[key], classification_model=f"{CACHE_MODEL_PREFIX}{model_name}"))
+        elif key in answered and is_cacheable(fresh[key]):
+            # Duplicate of an email classified earlier in this call
+            results.append(dict(fresh[key], classification_model=f"{CACHE_MODEL_PREFIX}{model_name}"))
+        else:
+            results.append(dict(fresh[key]))
+        answered.add(key)
+    
+    hits = len(emails_data) - len(misses)
+    if hits:
+        logger.info(f"💾 Classification cache: {hits} of {len(emails_data)} emails answered without a provider call")
+    return results
@@ -0,0 +1,151 @@
+"""
+Classification Cascade
+Routes each email through increasingly expensive classifiers until one is confident enough.
+
+Stages, cheapest first:
+    rules        keyword rules engine
+    sender       sender reputation priors (predictable senders)
+    local        trained local classifier
+    lightweight  minimal LLM prompt (single emails only)
+    full         full classification prompt (always answers)
+
+Each stage answers the emails it classifies with at least its configured
+confidence threshold and escalates the rest.
+"""
+
+import threading
+import time
+import logging
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+from .keyword_rules import get_rules_engine
+
+logger = logging.getLogger(__name__)
+
+STAGES = ['rules', 'sender', 'local', 'lightweight', 'full']
+
+class CascadeStats:
+    """Per-stage hit rates and call latencies of the cascade, for this process."""
+    
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self._stages = {
+            stage: {'calls': 0, 'emails': 0, 'answered': 0, 'errors': 0, 'latencies': deque(maxlen=window)}
+            for stage in STAGES
+        }
+    
+    def record(self, stage: str, emails: int, answered: int, seconds: float, error: bool = False):
+        with self._lock:
+            stats = self._stages[stage]
+            stats['calls'] += 1
+            stats['emails'] += emails
+            stats['answered'] += answered
+            stats['errors'] += int(error)
+            stats['latencies'].append(seconds)
+    
+    def snapshot(self) -> Dict:
+        """{stage: counts, hit_rate (answered / emails seen) and avg/p95 call latency in ms}."""
+        with self._lock:
+            snapshot = {}
+            for stage, stats in self._stages.items():
+                latencies = sorted(stats['latencies'])
+                snapshot[stage] = {
+                    'calls': stats['calls'],
+                    'emails': stats['emails'],
+                    'answered': stats['answered'],
+                    'errors': stats['errors'],
+                    'hit_rate': round(stats['answered'] / stats['emails'], 3) if stats['emails'] else 0.0,
+                    'avg_latency_ms': round(1000 * sum(latencies) / len(latencies), 2) if latencies else 0.0,
+                    'p95_latency_ms': round(1000 * latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))], 2) if latencies else 0.0
+                }
+            return snapshot
+
+_stats = CascadeStats()
+
+def get_cascade_stats() -> CascadeStats:
+    return _stats
+
+class ClassificationCascade:
+    """Confidence-routed classification in front of an AI service's full prompt."""
+    
+    def __init__(self, config, lightweight_provider=None, stats: CascadeStats = None):
+        self.config = config
+        self.lightweight_provider = lightweight_provider
+        self.stats = stats or _stats
+        self.rules_threshold = float(config.get('CASCADE_RULES_THRESHOLD', 0.95))
+        self.local_threshold = float(config.get('LOCAL_CLASSIFIER_THRESHOLD', 0.9))
+        self.lightweight_threshold = float(config.get('CASCADE_LIGHTWEIGHT_THRESHOLD', 0.85))
+        self.lightweight_enabled = config.get('CASCADE_LIGHTWEIGHT_ENABLED', True)
+    
+    def _rules_stage(self, emails_data: List[Dict]) -> List[Optional[Dict]]:
+        return [
+            classification if classification['confidence_score'] >= self.rules_threshold else None
+            for classification in get_rules_engine().classify_many(emails_data)
+        ]
+    
+    def _sender_stage(self, emails_data: List[Dict]) -> List[Optional[Dict]]:
+        from .sender_reputation import SenderReputationIndex
+        return SenderReputationIndex(self.config).classify_many(emails_data)
+    
+    def _local_stage(self, emails_data: List[Dict]) -> List[Optional[Dict]]:
+        try:
+            from .local_classifier import get_local_classifier
+        except ImportError:
+            return [None] * len(emails_data)
+        
+        model = get_local_classifier(self.config)
+        if model is None:
+            return [None] * len(emails_data)
+        return model.classify_many(emails_data, self.local_threshold)
+    
+    def _lightweight_stage(self, emails_data: List[Dict]) -> List[Optional[Dict]]:
+        results = []
+        for email_data in emails_data:
+            classification = self.lightweight_provider._lightweight_classification(email_data)
+            results.append(classification if classification['confidence_score'] >= self.lightweight_threshold else None)
+        return results
+    
+    def _run_stage(self, stage: str, fn: Callable[[List[Dict]], List[Optional[Dict]]],
+                   emails_data: List[Dict]) -> List[Optional[Dict]]:
+        """Run one stage, timing it; a failing stage escalates every email."""
+        started = time.perf_counter()
+        try:
+            results = fn(emails_data)
+            error = False
+        except Exception as e:
+            logger.warning(f"Cascade stage '{stage}' failed: {str(e)}")
+            results = [None] * len(emails_data)
+            error = True
+        
+        answered = sum(result is not None for result in results)
+        self.stats.record(stage, len(emails_data), answered, time.perf_counter() - started, error)
+        return results
+    
+    def classify(self, emails_data: List[Dict], full_fn: Callable[[List[Dict]], List[Dict]],
+                 lightweight: bool = True) -> List[Dict]:
+        """
+        Classify emails through the cascade, calling `full_fn` for what no stage answered.
+        
+        Batches skip the lightweight stage (`lightweight=False`): one prompt per
+        email costs more than the batched full prompt it would save.
+        """
+        stages = [('rules', self._rules_stage), ('sender', self._sender_stage), ('local', self._local_stage)]
+        if lightweight and self.lightweight_enabled and self.lightweight_provider is not None:
+            stages.append(('lightweight', self._lightweight_stage))
+        stages.append(('full', full_fn))
+        
+        results: List[Optional[Dict]] = [None] * len(emails_data)
+        pending = list(range(len(emails_data)))
+        for stage, fn in stages:
+            if not pending:
+                break
+            stage_results = self._run_stage(stage, fn, [emails_data[i] for i in pending])
+            for i, result in zip(pending, stage_results):
+                results[i] = result
+            pending = [i for i in pending if results[i] is None]
+        
+        # Only reached if the full stage itself failed
+        for i in pending:
+            results[i] = get_rules_engine().classify(emails_data[i])
+        return results
@@ -0,0 +1,193 @@
+"""
+Classification Worker
+Drains the classification_jobs queue outside of HTTP requests.
+"""
+
+import os
+import socket
+import threading
+import time
+import logging
+from flask import current_app
+from app import db
+from app.models.email import Email
+from app.models.classification_job import ClassificationJob
+from .near_duplicates import NearDuplicateIndex
+from .sender_reputation import SenderReputationIndex
+from .online_learning import OnlineLearner, record_ai_labels
+from .body_hydration import BodyPrefetcher
+
+logger = logging.getLogger(__name__)
+
+class ClassificationWorker:
+    """Leases batches of classification jobs and applies the results."""
+    
+    def __init__(self, classifier=None, worker_id=None, config=None):
+        self.config = config or current_app.config
+        self.classifier = classifier
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+        self.batch_size = int(self.config.get('CLASSIFICATION_WORKER_BATCH_SIZE', 5))
+        self.lease_seconds = int(self.config.get('CLASSIFICATION_LEASE_SECONDS', 300))
+        self.retry_base_seconds = int(self.config.get('CLASSIFICATION_RETRY_BASE_SECONDS', 30))
+        self.online_interval = float(self.config.get('LOCAL_CLASSIFIER_ONLINE_INTERVAL_SECONDS', 300))
+        self._last_online_update = time.monotonic()
+        self.prefetch_interval = float(self.config.get('BODY_PREFETCH_INTERVAL_SECONDS', 60))
+        self._last_prefetch = 0.0
+        self._prefetcher = None
+    
+    def _get_classifier(self):
+        """Create the classification service on first use: the cascade in front of the AI providers."""
+        if self.classifier is None:
+            from .ai_service import AIService
+            self.classifier = AIService()
+        return self.classifier
+    
+    def run_once(self):
+        """Process one leased batch. Returns the number of jobs handled."""
+        jobs = ClassificationJob.claim(self.worker_id, limit=self.batch_size, lease_seconds=self.lease_seconds)
+        if not jobs:
+            return 0
+        
+        emails = {
+            email.id: email
+            for email in Email.query.filter(Email.id.in_([job.email_id for job in jobs]))
+        }
+        
+        pending = []
+        for job in jobs:
+            email = emails.get(job.email_id)
+            if email is None:
+                job.complete()
+                job.last_error = 'Email no longer exists'
+                continue
+            pending.append((job, email))
+        
+        if pending:
+            jobs_by_email = {email.id: job for job, email in pending}
+            index = NearDuplicateIndex(self.config)
+            
+            # Near-duplicates of already classified emails don't need the AI classifier
+            inherited, remaining = index.inherit_classifications([email for _, email in pending])
+            for email in inherited:
+                jobs_by_email[email.id].complete()
+            
+            # Classify one representative per group of near-duplicates in this batch
+            groups = index.group_near_duplicates(remaining)
+            
+            if groups:
+                classifier = self._get_classifier()
+                try:
+                    classifications = classifier.classify_batch(
+                        [representative.to_classification_payload() for representative, _ in groups],
+                        batch_size=len(groups)
+                    )
+                except Exception as e:
+                    logger.error(f"Classification batch failed: {str(e)}")
+                    for email in remaining:
+                        jobs_by_email[email.id].retry_later(str(e), base_delay=self.retry_base_seconds)
+                    db.session.commit()
+                    return len(jobs)
+                
+                classified = []
+                for (email, members), classification in zip(groups, classifications):
+                    group = [email] + [member for member, _ in members]
+                    
+                    if classification.get('rate_limit_retry'):
+                        for grouped_email in group:
+                            jobs_by_email[grouped_email.id].retry_later('Rate limit reached', base_delay=self.retry_base_seconds)
+                        logger.info(f"Rate limited, job {jobs_by_email[email.id].id} retries after {jobs_by_email[email.id].not_before.isoformat()}")
+                        continue
+                    
+                    email.apply_classification(classification, classifier.model)
+                    classified.append(email)
+                    for member, distance in members:
+                        if classification.get('classification_model') == 'rules':
+                            member.apply_classification(classification, classifier.model)
+                        else:
+                            index.inherit(member, email, distance)
+                    
+                    for grouped_email in group:
+                        jobs_by_email[grouped_email.id].complete()
+                    logger.info(f"Classified email {email.id} as {email.urgency_category} (job {jobs_by_email[email.id].id}, {len(members)} near-duplicates)")
+                
+                SenderReputationIndex(self.config).record_classifications(classified)
+                record_ai_labels(classified, self.config)
+        
+        db.session.commit()
+        return len(jobs)
+    
+    def learn_if_due(self):
+        """Let the local classifier learn from new labels every LOCAL_CLASSIFIER_ONLINE_INTERVAL_SECONDS."""
+        if time.monotonic() - self._last_online_update < self.online_interval:
+            return None
+        self._last_online_update = time.monotonic()
+        try:
+            return OnlineLearner(self.config).update()
+        except ImportError:
+            return None  # NumPy not installed: no local classifier
+        except Exception as e:
+            logger.error(f"Online learning failed: {str(e)}")
+            db.session.rollback()
+            return None
+    
+    def prefetch_if_due(self):
+        """Fetch the bodies of new urgent mail every BODY_PREFETCH_INTERVAL_SECONDS."""
+        if time.monotonic() - self._last_prefetch < self.prefetch_interval:
+            return 0
+        self._last_prefetch = time.monotonic()
+        if self._prefetcher is None:
+            self._prefetcher = BodyPrefetcher(self.config)
+        try:
+            return self._prefetcher.prefetch()
+        except Exception as e:
+            logger.error(f"Body prefetch failed: {str(e)}")
+            db.session.rollback()
+            return 0
+    
+    def run_forever(self, idle_sleep=5.0, stop_event=None):
+        """Keep draining the queue until `stop_event` is set."""
+        logger.info(f"Classification worker {self.worker_id} started")
+        
+        while not (stop_event and stop_event.is_set()):
+            try:
+                handled = self.run_once()
+            except Exception as e:
+                logger.error(f"Classification worker error: {str(e)}")
+                db.session.rollback()
+                handled = 0
+            else:
+                self.learn_if_due()
+                self.prefetch_if_due()
+            finally:
+                # Don't keep stale objects around between batches
+                db.session.remove()
+            
+            if not handled:
+                time.sleep(idle_sleep)
+        
+        logger.info(f"Classification worker {self.worker_id} stopped")
+
+_background_lock = threading.Lock()
+_background_pid = None
+
+def start_background_worker(app):
+    """Start one daemon worker thread per process (used when no separate worker runs)."""
+    global _background_pid
+    
+    if _background_pid == os.getpid():
+        return
+    
+    with _background_lock:
+        if _background_pid == os.getpid():
+            return
+        _background_pid = os.getpid()
+        
+        def run():
+            with app.app_context():
+                ClassificationWorker().run_forever(
+                    idle_sleep=float(app.config.get('CLASSIFICATION_WORKER_IDLE_SECONDS', 5))
+                )
+        
+        thread = threading.Thread(target=run, name='classification-worker', daemon=True)
+        thread.start()
+        logger.info(f"Started background classification worker in process {_background_pid}")
@@ -0,0 +1,88 @@
+"""
+Email Ingest
+Stores Microsoft Graph messages, shared by /sync, /sync-status, mailbox syncs and backfills.
+"""
+
+import logging
+from flask import current_app
+from app import db
+from app.models.email import Email
+from .header_rules import HEADER_RULES_MODEL, classify_by_headers
+
+logger = logging.getLogger(__name__)
+
+def classify_new_by_headers(email_account, rows, messages):
+    """Classify new bulk and automated mail from its internetMessageHeaders (no AI call; caller commits).
+    
+    Returns the ids of the emails it classified.
+    """
+    if not rows or not current_app.config.get('HEADER_RULES_ENABLED', True):
+        return set()
+    
+    headers_by_message = {message.get('id'): message.get('internetMessageHeaders') for message in messages}
+    address = (email_account.email_address or '').lower()
+    classifications = classify_by_headers(
+        rows,
+        [headers_by_message.get(row['microsoft_email_id']) for row in rows],
+        internal_domain=address.rsplit('@', 1)[1] if '@' in address else None
+    )
+    
+    mappings = [
+        dict(
+            Email.classification_values(
+                classification, HEADER_RULES_MODEL,
+                status='processed' if classification['urgency_category'] == 'processed' else 'classified'
+            ),
+            id=row['id']
+        )
+        for row, classification in zip(rows, classifications) if classification is not None
+    ]
+    if mappings:
+        db.session.bulk_update_mappings(Email, mappings)
+        logger.info(f"📨 {len(mappings)} of {len(rows)} new emails classified from their headers")
+    return {mapping['id'] for mapping in mappings}
+
+def ingest_messages(email_account, messages, classify_headers=True):
+    """Store new Graph messages and refresh the state of known ones.
+    
+    With `classify_headers`, bulk and automated mail is classified from its headers right away.
+    
+    Returns (synced_count, updated_count, skipped_count, new_emails, header_classified)
+    where new_emails holds the classification payload for every newly stored email
+    that still needs classifying and header_classified counts the others.
+    """
+    result = Email.bulk_upsert_from_graph(email_account, messages)
+    header_classified = classify_new_by_headers(email_account, result['inserted_rows'], messages) if classify_headers else set()
+    
+    new_emails = [{
+        'email_id': row['id'],
+        'email_account_id': email_account.id,
+        'subject': row['subject'],
+        'sender_name': row['sender_name'],
+        'sender_email': row['sender_email'],
+        'body_preview': row['body_preview'],
+        'received_at': row['received_at'].isoformat()
+    } for row in result['inserted_rows'] if row['id'] not in header_classified]
+    if email_account.classification_prompt:
+        for email_data in new_emails:
+            email_data['account_prompt'] = email_account.classification_prompt
+    
+    logger.info(
+        f"Ingested {len(messages)} messages: {result['inserted']} inserted, "
+        f"{result['updated']} updated, {result['unchanged']} unchanged, {result['skipped']} skipped"
+    )
+    
+    return result['inserted'], result['updated'], result['unchanged'] + result['skipped'], new_emails, len(header_classified)
+
+def remove_messages(email_account, message_ids):
+    """Delete local copies of messages that were removed from the mailbox folder (caller commits)."""
+    if not message_ids:
+        return 0
+    
+    removed_count = Email.query.filter(
+        Email.email_account_id == email_account.id,
+        Email.microsoft_email_id.in_(message_ids)
+    ).delete(synchronize_session=False)
+    
+    logger.info(f"Removed {removed_count} emails deleted or moved in Microsoft")
+    return removed_count
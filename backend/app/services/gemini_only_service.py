@@ -31,18 +31,25 @@ class GeminiOnlyService:
     
     def get_status(self):
         """Get service status."""
-        return {
+        status = {
             'service': 'GeminiOnlyService',
             'gemini_available': self.gemini_service and self.gemini_service.client is not None,
-            'primary_service': 'gemini' if self.gemini_service and self.gemini_service.client else 'fallback',
+            'primary_service': 'gemini' if self._gemini_usable() else 'fallback',
             'message': 'Gemini-only service for email classification'
         }
+        if self.gemini_service:
+            status['circuit_breaker'] = self.gemini_service.breaker.snapshot()
+        return status
+    
+    def _gemini_usable(self) -> bool:
+        """Gemini is configured and its circuit breaker is not refusing calls."""
+        return bool(self.gemini_service and self.gemini_service.client and self.gemini_service.breaker.available())
     
     def classify_email(self, email_data: Dict) -> Dict:
         """Classify email using Gemini only."""
         
-        # Try Gemini first
-        if self.gemini_service and self.gemini_service.client:
+        # Try Gemini first (skipped while its circuit breaker is open)
+        if self._gemini_usable():
             try:
                 logger.info("Using Gemini for classification")
                 return self.gemini_service.classify_email(email_data)
@@ -62,54 +69,21 @@ class GeminiOnlyService:
                 'sender_type': 'externo',
                 'email_type': 'academico',
                 'requires_immediate_action': False,
-                'suggested_deadline': None
+                'suggested_deadline': None,
+                'classification_model': 'rules'
             }
     
     def classify_batch(self, emails_data: List[Dict], batch_size: int = 5) -> List[Dict]:
-        """Classify multiple emails in batches."""
-        
-        results = []
+        """Classify multiple emails, `batch_size` emails per Gemini prompt."""
         
-        for i in range(0, len(emails_data), batch_size):
-            batch = emails_data[i:i + batch_size]
-            
-            logger.info(f"Processing batch {i//batch_size + 1}, emails {i+1}-{min(i+batch_size, len(emails_data))}")
-            
-            batch_results = []
-            for email_data in batch:
-                try:
-                    classification = self.classify_email(email_data)
-                    batch_results.append(classification)
-                    
-                    # Delay between requests
-                    import time
-                    time.sleep(2)  # 2 seconds between requests
-                    
-                except Exception as e:
-                    logger.error(f"Error classifying email: {str(e)}")
-                    # Use fallback for this email
-                    if self.gemini_service:
-                        batch_results.append(self.gemini_service._fallback_classification(email_data))
-                    else:
-                        batch_results.append({
-                            'urgency_category': 'medium',
-                            'confidence_score': 0.5,
-                            'reasoning': 'Classification failed',
-                            'sender_type': 'externo',
-                            'email_type': 'academico',
-                            'requires_immediate_action': False,
-                            'suggested_deadline': None
-                        })
-            
-            results.extend(batch_results)
-            
-            # Delay between batches
-            if i + batch_size < len(emails_data):
-                import time
-                time.sleep(5)  # 5 seconds between batches
+        if self._gemini_usable():
+            try:
+                return self.gemini_service.classify_batch(emails_data, batch_size=batch_size)
+            except Exception as e:
+                logger.error(f"Error in Gemini batch classification: {str(e)}")
         
-        logger.info(f"Completed batch classification of {len(emails_data)} emails")
-        return results
+        logger.warning("Gemini not available, using rule-based classification")
+        return [self.classify_email(email_data) for email_data in emails_data]
     
     def get_classification_stats(self, classifications: List[Dict]) -> Dict:
         """Generate statistics from classification results."""
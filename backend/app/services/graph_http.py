@@ -0,0 +1,162 @@
+"""
+Graph HTTP Layer
+Pooled keep-alive connections and throttling-aware retries for every Microsoft Graph request.
+
+Requests share one requests.Session per process, so connections (and their
+TLS handshakes) are reused instead of opened per call, with gzip responses.
+A 429 or 503 from Graph is retried, and so are a 504 and connection errors
+of idempotent requests: after the Retry-After Graph sends, otherwise after
+an exponential backoff with full jitter. Throttling makes a sync slower instead of failing it; only a
+Retry-After longer than GRAPH_RETRY_MAX_WAIT_SECONDS, or running out of
+GRAPH_MAX_RETRIES, hands the response back to the caller.
+"""
+
+import os
+import random
+import threading
+import time
+import logging
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+THROTTLE_STATUSES = (429, 503)  # Graph did not process the request: safe to retry even a POST
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE')
+
+def parse_retry_after(value) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delay-seconds or HTTP date), None if absent or invalid."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+class GraphRetryPolicy:
+    """Which Graph failures to retry and how long to wait before the next attempt."""
+    
+    def __init__(self, config):
+        self.max_retries = max(0, int(config.get('GRAPH_MAX_RETRIES', 4)))
+        self.base_seconds = float(config.get('GRAPH_RETRY_BASE_SECONDS', 1.0))
+        self.max_backoff_seconds = float(config.get('GRAPH_RETRY_MAX_BACKOFF_SECONDS', 30))
+        self.max_wait_seconds = float(config.get('GRAPH_RETRY_MAX_WAIT_SECONDS', 60))
+    
+    def should_retry(self, attempt: int, status_code: int = None, idempotent: bool = True) -> bool:
+        """Whether attempt number `attempt` (0-based) may be retried; `status_code` is None for connection errors."""
+        if attempt >= self.max_retries:
+            return False
+        if status_code is None or status_code == 504:
+            return idempotent  # The request may have reached Graph
+        return status_code in THROTTLE_STATUSES
+    
+    def delay(self, attempt: int, retry_after: float = None) -> Optional[float]:
+        """Seconds to wait before the next attempt, or None when Graph asks for longer than GRAPH_RETRY_MAX_WAIT_SECONDS."""
+        if retry_after is not None:
+            return retry_after if retry_after <= self.max_wait_seconds else None
+        return random.uniform(0, min(self.max_backoff_seconds, self.base_seconds * 2 ** attempt))
+
+class GraphHttpStats:
+    """Graph requests, retries, throttled responses and time spent waiting, for this process."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.connection_errors = 0
+        self.wait_seconds = 0.0
+    
+    def record_attempt(self, status_code: int = None):
+        with self._lock:
+            self.requests += 1
+            if status_code is None:
+                self.connection_errors += 1
+            elif status_code in THROTTLE_STATUSES:
+                self.throttled += 1
+    
+    def record_retry(self, wait_seconds: float):
+        with self._lock:
+            self.retries += 1
+            self.wait_seconds += wait_seconds
+    
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'retries': self.retries,
+                'throttled': self.throttled,
+                'connection_errors': self.connection_errors,
+                'wait_seconds': round(self.wait_seconds, 1)
+            }
+
+_stats = GraphHttpStats()
+
+def get_graph_http_stats() -> GraphHttpStats:
+    return _stats
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+def get_graph_session(config) -> requests.Session:
+    """Get the process-wide keep-alive session for Graph, pooling up to GRAPH_MAX_CONNECTIONS connections."""
+    global _session, _session_pid
+    
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            pool_size = max(1, int(config.get('GRAPH_MAX_CONNECTIONS', 20)))
+            session = requests.Session()
+            session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0))
+            session.headers['Accept-Encoding'] = 'gzip, deflate'
+            _session = session
+            _session_pid = os.getpid()
+        return _session
+
+def graph_request(config, method: str, url: str, access_token: str, headers: Dict = None,
+                  idempotent: bool = None, **kwargs) -> requests.Response:
+    """
+    Send a Graph request on the shared session, retrying throttling and transient failures.
+    
+    Returns the final response, which may still be an error when retries ran
+    out or the Retry-After was too long; raises requests.RequestException when
+    the last attempt could not connect.
+    """
+    policy = GraphRetryPolicy(config)
+    session = get_graph_session(config)
+    idempotent = method.upper() in IDEMPOTENT_METHODS if idempotent is None else idempotent
+    request_headers = {'Authorization': f'Bearer {access_token}'}
+    request_headers.update(headers or {})
+    kwargs.setdefault('timeout', 15)
+    
+    attempt = 0
+    while True:
+        try:
+            response = session.request(method, url, headers=request_headers, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            _stats.record_attempt()
+            if not policy.should_retry(attempt, idempotent=idempotent):
+                raise
+            wait = policy.delay(attempt)
+            logger.warning(f"Graph {method} connection error ({str(e)[:200]}), retrying in {wait:.1f}s")
+        else:
+            _stats.record_attempt(response.status_code)
+            if not policy.should_retry(attempt, response.status_code, idempotent):
+                return response
+            wait = policy.delay(attempt, parse_retry_after(response.headers.get('Retry-After')))
+            if wait is None:
+                return response  # Throttled for longer than a request should wait: the caller reschedules
+            logger.warning(f"Graph {method} returned {response.status_code}, retrying in {wait:.1f}s")
+        
+        _stats.record_retry(wait)
+        time.sleep(wait)
+        attempt += 1
@@ -0,0 +1,191 @@
+"""
+Request Hedging
+Tail-latency control for interactive single-email classification across two providers.
+
+The primary provider gets until the hedge deadline - a percentile of its
+recent latencies - to answer. If it has not, the same email is also sent to
+the secondary provider; the first valid answer wins and the other call is
+cancelled. Hedges are capped at a share of requests, so a slow provider
+cannot double the traffic (and the rate-limit spend) of the other one.
+"""
+
+import asyncio
+import threading
+import time
+import logging
+from collections import deque
+from typing import Dict, Optional
+
+from .async_classifier import _get_event_loop
+from .classification_cache import is_cacheable
+
+logger = logging.getLogger(__name__)
+
+# Primary latencies needed before the percentile replaces the default delay
+MIN_LATENCY_SAMPLES = 20
+
+# Unused hedge budget saved up for bursts of slow calls
+MAX_BUDGET = 5.0
+
+def model_name(service) -> str:
+    """Model of a provider service (GeminiService calls it model_name, OpenAIService model)."""
+    return getattr(service, 'model_name', None) or service.model
+
+class HedgeStats:
+    """Hedge deadlines from recent primary latencies, the hedge budget and how hedging paid off, per process."""
+    
+    def __init__(self, window: int = 500):
+        self._lock = threading.Lock()
+        self._window = window
+        self._latencies: Dict[str, deque] = {}
+        self._slow_latencies: Dict[str, deque] = {}
+        self._budget = 1.0
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.budget_exhausted = 0
+        self.saved_seconds = 0.0
+    
+    def deadline(self, provider: str, percentile: float, default_seconds: float) -> float:
+        """Seconds to wait for `provider` before hedging: the percentile of its recent latencies."""
+        with self._lock:
+            latencies = sorted(self._latencies.get(provider, ()))
+        if len(latencies) < MIN_LATENCY_SAMPLES:
+            return default_seconds
+        index = min(len(latencies) - 1, int(len(latencies) * percentile / 100.0))
+        return latencies[index]
+    
+    def start_request(self, max_ratio: float):
+        """Count a request; each one adds `max_ratio` hedges to the budget."""
+        with self._lock:
+            self.requests += 1
+            self._budget = min(MAX_BUDGET, self._budget + max_ratio)
+    
+    def try_hedge(self) -> bool:
+        """Spend one hedge from the budget, if there is one left."""
+        with self._lock:
+            if self._budget < 1.0:
+                self.budget_exhausted += 1
+                return False
+            self._budget -= 1.0
+            self.hedged += 1
+            return True
+    
+    def record_latency(self, provider: str, seconds: float, deadline: Optional[float] = None):
+        """
+        Record how long a valid primary answer took; failures would pull the deadline down.
+        
+        Calls that outlived the hedge deadline are also kept apart: they are
+        what a hedge would have been waiting for, which is how latency saved
+        by a winning hedge is estimated.
+        """
+        with self._lock:
+            self._latencies.setdefault(provider, deque(maxlen=self._window)).append(seconds)
+            if deadline is not None and seconds > deadline:
+                self._slow_latencies.setdefault(provider, deque(maxlen=self._window)).append(seconds)
+    
+    def record_hedge_win(self, provider: str, seconds: float):
+        """
+        Record a hedge that answered first, `seconds` after the primary call started.
+        
+        The cancelled primary call is kept as a latency sample of `seconds` (a
+        lower bound), so the deadline does not drift down as stalls get cut
+        short. Latency saved is the average slow primary call minus the hedged
+        answer time, when slow calls have been seen to finish.
+        """
+        with self._lock:
+            self.hedge_wins += 1
+            self._latencies.setdefault(provider, deque(maxlen=self._window)).append(seconds)
+            slow = self._slow_latencies.get(provider)
+            if slow:
+                self.saved_seconds += max(0.0, sum(slow) / len(slow) - seconds)
+    
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'hedged': self.hedged,
+                'hedge_rate': round(self.hedged / self.requests, 3) if self.requests else 0.0,
+                'hedge_wins': self.hedge_wins,
+                'budget_exhausted': self.budget_exhausted,
+                'estimated_latency_saved_ms': round(1000 * self.saved_seconds, 1),
+                'avg_latency_saved_ms': round(1000 * self.saved_seconds / self.hedge_wins, 1) if self.hedge_wins else 0.0
+            }
+
+_stats = HedgeStats()
+
+def get_hedge_stats() -> HedgeStats:
+    return _stats
+
+class RequestHedger:
+    """Single-email classification on a primary provider, hedged on a secondary one."""
+    
+    def __init__(self, config, stats: HedgeStats = None):
+        self.percentile = float(config.get('AI_HEDGE_PERCENTILE', 95))
+        self.default_delay = float(config.get('AI_HEDGE_DEFAULT_DELAY_SECONDS', 2.0))
+        self.max_ratio = float(config.get('AI_HEDGE_MAX_RATIO', 0.1))
+        self.stats = stats or _stats
+    
+    async def classify_async(self, primary, secondary, email_data: Dict) -> Dict:
+        """
+        First valid answer of `primary`, or of `secondary` once the hedge deadline passes.
+        
+        A primary that fails before the deadline is failed over to the
+        secondary without spending hedge budget. If neither answers validly,
+        the primary's rule-based fallback is returned.
+        """
+        provider = primary.breaker.provider
+        deadline = self.stats.deadline(provider, self.percentile, self.default_delay)
+        self.stats.start_request(self.max_ratio)
+        started = time.perf_counter()
+        
+        primary_task = asyncio.ensure_future(primary._classify_email_async(email_data))
+        done, _ = await asyncio.wait({primary_task}, timeout=deadline)
+        if done:
+            result = primary_task.result()
+            if is_cacheable(result):
+                self.stats.record_latency(provider, time.perf_counter() - started)
+                return result
+            logger.warning(f"{type(primary).__name__} failed - classifying with {type(secondary).__name__}")
+            secondary_result = await secondary._classify_email_async(email_data)
+            return self._tag(secondary_result, secondary) if is_cacheable(secondary_result) else result
+        
+        if not self.stats.try_hedge():
+            result = await primary_task
+            if is_cacheable(result):
+                self.stats.record_latency(provider, time.perf_counter() - started, deadline)
+            return result
+        
+        logger.info(f"{type(primary).__name__} slower than {deadline:.2f}s - hedging with {type(secondary).__name__}")
+        secondary_task = asyncio.ensure_future(secondary._classify_email_async(email_data))
+        pending = {primary_task, secondary_task}
+        results = {}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    results[task] = task.result()
+                
+                if primary_task in done and is_cacheable(results[primary_task]):
+                    self.stats.record_latency(provider, time.perf_counter() - started, deadline)
+                    return results[primary_task]
+                if secondary_task in done and is_cacheable(results[secondary_task]):
+                    if primary_task in pending:
+                        self.stats.record_hedge_win(provider, time.perf_counter() - started)
+                    return self._tag(results[secondary_task], secondary)
+        finally:
+            for task in pending:
+                task.cancel()
+        
+        return results[primary_task]
+    
+    def _tag(self, classification: Dict, service) -> Dict:
+        """Name the secondary's model on its answer; it is then stored as-is and not cached under the primary's."""
+        classification['classification_model'] = model_name(service)
+        return classification
+    
+    def classify(self, primary, secondary, email_data: Dict) -> Dict:
+        """Synchronous entry point, run on the shared classification event loop."""
+        return asyncio.run_coroutine_threadsafe(
+            self.classify_async(primary, secondary, email_data), _get_event_loop()
+        ).result()
@@ -0,0 +1,261 @@
+"""
+Keyword Rules Engine
+Rule-based fallback classification shared by the OpenAI and Gemini services.
+
+All keyword sets are compiled once into a single Aho-Corasick automaton, so
+every category hit in an email is found in one pass over its text.
+"""
+
+import re
+import threading
+import unicodedata
+from collections import deque
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set
+
+# Academic context patterns - REAL urgent situations
+URGENT_KEYWORDS = [
+    'emergencia', 'accidente', 'hospital', 'ambulancia', 'lesion',
+    'lesionado', 'herido', 'caída', 'golpe', 'sangre', 'desmayo',
+    'crisis', 'problema grave', 'suspensión', 'expulsión', 'ayuda',
+    'socorro', 'grave', 'inmediato', 'hoy mismo', 'crítico'
+]
+
+# Non-urgent keywords that might be confused with urgent
+NON_URGENT_INDICATORS = [
+    'qué día', 'que dia', 'cuando', 'cuándo', 'horario', 'hora',
+    'información', 'consulta', 'pregunta', 'duda', 'ayuda con',
+    'necesito saber', 'podrías decirme', 'me puedes ayudar',
+    'solo quería', 'solo queria', 'nada urgente', 'no es urgente',
+    'cuando puedas', 'cuando tengas tiempo', 'no hay prisa'
+]
+
+HIGH_PRIORITY_KEYWORDS = [
+    'reunión', 'junta', 'consejo', 'deadline', 'plazo', 'entrega',
+    'examen', 'evaluación', 'presentación', 'defensa', 'tesis',
+    'calificación', 'nota', 'reprobado', 'aprobado', 'suspensión',
+    'expulsión', 'disciplinario', 'problema', 'conflicto', 'queja'
+]
+
+MEDIUM_PRIORITY_KEYWORDS = [
+    'consulta', 'pregunta', 'ayuda', 'información', 'horario', 'clase', 'materia', 'asignatura'
+]
+
+# Academic content in emails from USS students
+ACADEMIC_CONTENT_KEYWORDS = MEDIUM_PRIORITY_KEYWORDS + ['profesor', 'docente']
+
+ACADEMIC_ROLES = {
+    'estudiante': ['estudiante', 'alumno', 'alumna', '@uss.cl'],
+    'profesor': ['profesor', 'profesora', 'docente', 'académico'],
+    'administracion': ['secretaria', 'coordinador', 'director', 'decanato']
+}
+
+KEYWORD_CATEGORIES = {
+    'urgent': URGENT_KEYWORDS,
+    'non_urgent': NON_URGENT_INDICATORS,
+    'high': HIGH_PRIORITY_KEYWORDS,
+    'medium': MEDIUM_PRIORITY_KEYWORDS,
+    'academic': ACADEMIC_CONTENT_KEYWORDS,
+    **{f'role:{role}': keywords for role, keywords in ACADEMIC_ROLES.items()}
+}
+
+RULES_MODEL = 'rules'
+STUDENT_DOMAIN = '@uss.cl'
+
+WHITESPACE_PATTERN = re.compile(r'\s+')
+COMBINING_MARKS_PATTERN = re.compile('[\u0300-\u036f]')
+
+def normalize_text(text: str) -> str:
+    """Lowercase, strip accents and collapse whitespace so 'Reunión' matches 'reunion'."""
+    stripped = COMBINING_MARKS_PATTERN.sub('', unicodedata.normalize('NFKD', text or ''))
+    return WHITESPACE_PATTERN.sub(' ', stripped.lower())
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == '_'
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over keyword -> categories, with word boundaries.
+    
+    Failure links are folded into a full transition table at build time, so
+    scanning is one dict lookup per character.
+    """
+    
+    def __init__(self, categories: Dict[str, Iterable[str]]):
+        keyword_categories: Dict[str, Set[str]] = {}
+        for category, keywords in categories.items():
+            for keyword in keywords:
+                normalized = normalize_text(keyword).strip()
+                if normalized:
+                    keyword_categories.setdefault(normalized, set()).add(category)
+        
+        self.categories = frozenset(categories)
+        self._build(keyword_categories)
+    
+    def _build(self, keyword_categories: Dict[str, Set[str]]):
+        goto: List[Dict[str, int]] = [{}]
+        outputs: List[List[tuple]] = [[]]
+        
+        for keyword, categories in keyword_categories.items():
+            state = 0
+            for ch in keyword:
+                if ch not in goto[state]:
+                    goto.append({})
+                    outputs.append([])
+                    goto[state][ch] = len(goto) - 1
+                state = goto[state][ch]
+            # Boundary checks only apply where the keyword edge is a word character
+            outputs[state].append((
+                len(keyword), frozenset(categories), _is_word_char(keyword[0]), _is_word_char(keyword[-1])
+            ))
+        
+        # Breadth-first: resolve failure links and complete each state's transitions
+        fail = [0] * len(goto)
+        transitions: List[Dict[str, int]] = [dict(goto[0])] + [None] * (len(goto) - 1)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            fallback = fail[state]
+            outputs[state].extend(outputs[fallback])
+            transitions[state] = dict(transitions[fallback])
+            for ch, child in goto[state].items():
+                fail[child] = transitions[fallback].get(ch, 0)
+                transitions[state][ch] = child
+                queue.append(child)
+        
+        self._transitions = transitions
+        self._outputs = [tuple(output) for output in outputs]
+    
+    def match(self, text: str, normalized: bool = False) -> FrozenSet[str]:
+        """Every category with at least one whole-word keyword in `text`."""
+        if not normalized:
+            text = normalize_text(text)
+        
+        transitions, outputs = self._transitions, self._outputs
+        length = len(text)
+        hits: Set[str] = set()
+        state = 0
+        for end, ch in enumerate(text):
+            state = transitions[state].get(ch, 0)
+            if not outputs[state]:
+                continue
+            for keyword_length, categories, check_start, check_end in outputs[state]:
+                if categories <= hits:
+                    continue
+                start = end - keyword_length + 1
+                if check_start and start > 0 and _is_word_char(text[start - 1]):
+                    continue
+                if check_end and end + 1 < length and _is_word_char(text[end + 1]):
+                    continue
+                hits |= categories
+            if len(hits) == len(self.categories):
+                break
+        
+        return frozenset(hits)
+
+class KeywordRulesEngine:
+    """Rule-based email classification over a compiled keyword automaton."""
+    
+    def __init__(self, categories: Dict[str, Iterable[str]] = None):
+        self.automaton = KeywordAutomaton(categories or KEYWORD_CATEGORIES)
+    
+    def classify(self, email_data: Dict) -> Dict:
+        """Classify one email from its subject, body preview and sender."""
+        text_content = f"{email_data.get('subject') or ''} {email_data.get('body_preview') or ''}"
+        hits = self.automaton.match(text_content)
+        return self._classify_hits(hits, (email_data.get('sender_email') or '').lower())
+    
+    def classify_many(self, emails_data: List[Dict]) -> List[Dict]:
+        """
+        Classify a list of emails, e.g. to pre-score a backlog.
+        
+        Emails with the same normalized text and sender domain are scored once.
+        """
+        match = self.automaton.match
+        seen: Dict[tuple, Dict] = {}
+        results = []
+        for email_data in emails_data:
+            text_content = normalize_text(
+                f"{email_data.get('subject') or ''} {email_data.get('body_preview') or ''}"
+            )
+            sender_email = (email_data.get('sender_email') or '').lower()
+            key = (text_content, STUDENT_DOMAIN in sender_email)
+            if key not in seen:
+                seen[key] = self._classify_hits(match(text_content, normalized=True), sender_email)
+            results.append(dict(seen[key]))
+        return results
+    
+    def _classify_hits(self, hits: FrozenSet[str], sender_email: str) -> Dict:
+        # Rule-based classification - start with different defaults to avoid medium bias
+        has_non_urgent_indicators = 'non_urgent' in hits
+        has_urgent_keywords = 'urgent' in hits
+        
+        # If it has non-urgent indicators, it's likely not urgent even if it says "urgente"
+        if has_non_urgent_indicators and not has_urgent_keywords:
+            urgency = 'low'
+            confidence = 0.8
+            reasoning = "Contenido indica consulta no urgente (a pesar de palabras como 'urgente')"
+        
+        # Check for REAL urgent keywords (only if no non-urgent indicators)
+        elif has_urgent_keywords and not has_non_urgent_indicators:
+            urgency = 'urgent'
+            confidence = 0.9
+            reasoning = "Detectadas palabras clave de urgencia crítica real"
+        
+        elif 'high' in hits:
+            urgency = 'high'
+            confidence = 0.8
+            reasoning = "Detectadas palabras clave de alta prioridad académica"
+        
+        elif 'medium' in hits:
+            urgency = 'medium'
+            confidence = 0.7
+            reasoning = "Consulta académica que requiere respuesta"
+        
+        # Student emails from USS get medium priority only if they contain academic content
+        elif STUDENT_DOMAIN in sender_email:
+            if 'academic' in hits:
+                urgency = 'medium'
+                confidence = 0.7
+                reasoning = "Correo de estudiante USS con contenido académico"
+            else:
+                urgency = 'low'
+                confidence = 0.6
+                reasoning = "Correo de estudiante USS - contenido general"
+        
+        # External emails are generally low priority unless urgent keywords
+        else:
+            urgency = 'low'
+            confidence = 0.5
+            reasoning = "Correo externo - prioridad baja"
+        
+        # Determine sender type
+        sender_type = 'externo'
+        if STUDENT_DOMAIN in sender_email:
+            sender_type = 'estudiante'
+        elif 'role:profesor' in hits:
+            sender_type = 'profesor'
+        elif 'role:administracion' in hits:
+            sender_type = 'administracion'
+        
+        return {
+            'urgency_category': urgency,
+            'confidence_score': confidence,
+            'reasoning': reasoning,
+            'sender_type': sender_type,
+            'email_type': 'academico',
+            'requires_immediate_action': urgency in ['urgent', 'high'],
+            'suggested_deadline': None,
+            'classification_model': RULES_MODEL
+        }
+
+_engine: Optional[KeywordRulesEngine] = None
+_engine_lock = threading.Lock()
+
+def get_rules_engine() -> KeywordRulesEngine:
+    """Process-wide rules engine; the automaton is compiled on first use."""
+    global _engine
+    
+    with _engine_lock:
+        if _engine is None:
+            _engine = KeywordRulesEngine()
+        return _engine
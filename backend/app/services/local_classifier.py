@@ -0,0 +1,355 @@
+"""
+Local Classifier
+Logistic regression over hashed n-grams, trained from stored classifications.
+
+Answers the emails it is confident about without calling an AI provider, so
+classification keeps working without network or quota. Between full
+retrainings the model keeps learning online from new labels (see
+online_learning.py); every save is a new version, and processes pick up a
+newer model file on their next classification.
+"""
+
+import os
+import re
+import json
+import zlib
+import threading
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, or_
+
+from app import db
+from app.models.email import Email, USER_CORRECTION_MODEL
+from app.models.classification_label import ClassificationLabel
+from .keyword_rules import normalize_text
+from .prompts import VALID_URGENCIES
+
+logger = logging.getLogger(__name__)
+
+LOCAL_MODEL = 'local'
+
+# Answers that are not provider labels and must not be learned from
+UNTRAINABLE_MODELS = ('rules', 'headers', LOCAL_MODEL, 'sender-prior')
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+def _hash(feature: str, dim: int) -> int:
+    # crc32 is stable across processes, unlike hash()
+    return zlib.crc32(feature.encode('utf-8')) % dim
+
+def extract_features(email_data: Dict, dim: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Hashed feature indices and L2-normalized log-count values of an email.
+    
+    Features are body/subject words, word bigrams, subject words and the
+    sender's domain, plus a constant bias feature so no email is empty.
+    """
+    subject = TOKEN_PATTERN.findall(normalize_text(email_data.get('subject') or ''))
+    body = TOKEN_PATTERN.findall(normalize_text(email_data.get('body_preview') or ''))
+    words = subject + body
+    sender_email = (email_data.get('sender_email') or '').lower()
+    
+    features = ['__bias__', f"d:{sender_email.rpartition('@')[2]}"]
+    features += [f"w:{word}" for word in words]
+    features += [f"b:{a}_{b}" for a, b in zip(words, words[1:])]
+    features += [f"s:{word}" for word in subject]
+    
+    indices, counts = np.unique(
+        np.fromiter((_hash(feature, dim) for feature in features), dtype=np.int64, count=len(features)),
+        return_counts=True
+    )
+    values = np.log1p(counts).astype(np.float32)
+    values /= np.linalg.norm(values)
+    return indices, values
+
+class LocalClassifier:
+    """Multinomial logistic regression on hashed features, in NumPy."""
+    
+    def __init__(self, dim: int = 2 ** 18, labels: List[str] = None):
+        self.dim = int(dim)
+        self.labels = list(labels or VALID_URGENCIES)
+        self.weights = np.zeros((len(self.labels), self.dim), dtype=np.float32)
+        self.accumulated: Optional[np.ndarray] = None  # AdaGrad squared-gradient sums, kept for online updates
+        self.metadata: Dict = {}
+    
+    def _vectorize(self, emails_data: List[Dict]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """CSR arrays (indices, values, indptr) for a list of emails."""
+        rows = [extract_features(email_data, self.dim) for email_data in emails_data]
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(indices) for indices, _ in rows])
+        indices = np.concatenate([indices for indices, _ in rows]) if rows else np.zeros(0, dtype=np.int64)
+        values = np.concatenate([values for _, values in rows]) if rows else np.zeros(0, dtype=np.float32)
+        return indices, values, indptr
+    
+    def _probabilities(self, indices: np.ndarray, values: np.ndarray, indptr: np.ndarray) -> np.ndarray:
+        """Class probabilities, shape (emails, labels)."""
+        scores = np.add.reduceat(self.weights[:, indices] * values, indptr[:-1], axis=1).T
+        scores -= scores.max(axis=1, keepdims=True)
+        probabilities = np.exp(scores)
+        return probabilities / probabilities.sum(axis=1, keepdims=True)
+    
+    def fit(self, emails_data: List[Dict], labels: List[str], sample_weights: List[float] = None,
+            epochs: int = 20, batch_size: int = 256, learning_rate: float = 0.5, l2: float = 1e-5,
+            seed: int = 0) -> 'LocalClassifier':
+        """Train with mini-batch AdaGrad on the weighted cross-entropy."""
+        self.accumulated = np.full_like(self.weights, 1e-8)
+        return self._train(emails_data, labels, sample_weights, epochs, batch_size, learning_rate, l2, seed)
+    
+    def partial_fit(self, emails_data: List[Dict], labels: List[str], sample_weights: List[float] = None,
+                    batch_size: int = 32, learning_rate: float = 0.5, l2: float = 1e-5,
+                    seed: int = 0) -> 'LocalClassifier':
+        """
+        One online pass over new examples, continuing from the current weights.
+        
+        AdaGrad's accumulated gradients carry over from earlier training, so
+        features the model has seen often move less than new ones.
+        """
+        if self.accumulated is None:
+            # Models saved without their AdaGrad state: start damped, not at full step size
+            self.accumulated = np.ones_like(self.weights)
+        return self._train(emails_data, labels, sample_weights, 1, batch_size, learning_rate, l2, seed)
+    
+    def _train(self, emails_data: List[Dict], labels: List[str], sample_weights: Optional[List[float]],
+               epochs: int, batch_size: int, learning_rate: float, l2: float, seed: int) -> 'LocalClassifier':
+        label_index = {label: i for i, label in enumerate(self.labels)}
+        targets = np.array([label_index[label] for label in labels], dtype=np.int64)
+        weights = np.ones(len(targets), dtype=np.float32) if sample_weights is None else np.asarray(sample_weights, dtype=np.float32)
+        indices, values, indptr = self._vectorize(emails_data)
+        
+        accumulated = self.accumulated
+        rng = np.random.default_rng(seed)
+        
+        for _ in range(epochs):
+            order = rng.permutation(len(targets))
+            for start in range(0, len(order), batch_size):
+                batch = order[start:start + batch_size]
+                
+                # Gather the batch's rows out of the CSR arrays
+                lengths = indptr[batch + 1] - indptr[batch]
+                positions = np.concatenate([np.arange(indptr[row], indptr[row + 1]) for row in batch])
+                batch_indptr = np.concatenate([[0], np.cumsum(lengths)])
+                batch_indices, batch_values = indices[positions], values[positions]
+                
+                errors = self._probabilities(batch_indices, batch_values, batch_indptr)
+                errors[np.arange(len(batch)), targets[batch]] -= 1.0
+                errors *= (weights[batch] / weights[batch].sum())[:, None]
+                
+                # Gradient only touches the columns of features present in the batch
+                gradient = errors[np.repeat(np.arange(len(batch)), lengths)].T * batch_values
+                columns, inverse = np.unique(batch_indices, return_inverse=True)
+                column_gradient = np.zeros((len(self.labels), len(columns)), dtype=np.float32)
+                np.add.at(column_gradient.T, inverse, gradient.T)
+                column_gradient += l2 * self.weights[:, columns]
+                
+                accumulated[:, columns] += column_gradient ** 2
+                self.weights[:, columns] -= learning_rate * column_gradient / np.sqrt(accumulated[:, columns])
+        
+        return self
+    
+    def predict_proba(self, emails_data: List[Dict]) -> np.ndarray:
+        if not emails_data:
+            return np.zeros((0, len(self.labels)), dtype=np.float32)
+        return self._probabilities(*self._vectorize(emails_data))
+    
+    def classify_many(self, emails_data: List[Dict], threshold: float) -> List[Optional[Dict]]:
+        """Classifications for emails predicted with at least `threshold` probability, else None."""
+        results = []
+        for email_data, probabilities in zip(emails_data, self.predict_proba(emails_data)):
+            best = int(probabilities.argmax())
+            confidence = float(probabilities[best])
+            if confidence < threshold:
+                results.append(None)
+                continue
+            
+            urgency = self.labels[best]
+            results.append({
+                'urgency_category': urgency,
+                'confidence_score': round(confidence, 3),
+                'reasoning': f"Clasificado por el modelo local (probabilidad {confidence:.0%})",
+                'sender_type': 'estudiante' if '@uss.cl' in (email_data.get('sender_email') or '').lower() else 'externo',
+                'email_type': 'academico',
+                'requires_immediate_action': urgency in ['urgent', 'high'],
+                'suggested_deadline': None,
+                'classification_model': LOCAL_MODEL
+            })
+        return results
+    
+    def save(self, path: str):
+        """Write the model atomically, so running workers never load a partial file."""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            weights=self.weights,
+            labels=np.array(self.labels),
+            dim=np.array(self.dim),
+            metadata=np.array(json.dumps(self.metadata)),
+            **({'accumulated': self.accumulated} if self.accumulated is not None else {})
+        )
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def load(cls, path: str) -> 'LocalClassifier':
+        with np.load(path, allow_pickle=False) as data:
+            model = cls(dim=int(data['dim']), labels=[str(label) for label in data['labels']])
+            model.weights = data['weights'].astype(np.float32)
+            model.metadata = json.loads(str(data['metadata']))
+            if 'accumulated' in data.files:
+                model.accumulated = data['accumulated'].astype(np.float32)
+        return model
+    
+    @property
+    def version(self) -> int:
+        return int(self.metadata.get('version', 0))
+
+def save_model_version(model: LocalClassifier, config):
+    """
+    Save `model` as the next version: LOCAL_CLASSIFIER_PATH plus a numbered copy.
+    
+    The newest LOCAL_CLASSIFIER_KEEP_VERSIONS copies are kept next to the
+    model file (<name>.versions/v<N>.npz) to roll back to.
+    """
+    path = config.get('LOCAL_CLASSIFIER_PATH')
+    previous = 0
+    if os.path.exists(path):
+        try:
+            previous = LocalClassifier.load(path).version
+        except Exception as e:
+            logger.warning(f"Could not read the version of {path}: {str(e)}")
+    model.metadata['version'] = max(previous, model.version) + 1
+    model.metadata['saved_at'] = datetime.now(timezone.utc).isoformat()
+    model.save(path)
+    
+    keep = int(config.get('LOCAL_CLASSIFIER_KEEP_VERSIONS', 5))
+    if keep > 0:
+        versions_dir = f"{os.path.splitext(path)[0]}.versions"
+        model.save(os.path.join(versions_dir, f"v{model.version}.npz"))
+        saved = sorted(
+            (name for name in os.listdir(versions_dir) if re.fullmatch(r'v\d+\.npz', name)),
+            key=lambda name: int(name[1:-4])
+        )
+        for name in saved[:-keep]:
+            os.remove(os.path.join(versions_dir, name))
+
+def load_training_data(correction_weight: float = 2.0, limit: int = None) -> Tuple[List[Dict], List[str], List[float]]:
+    """
+    Classified emails as (emails_data, labels, sample_weights).
+    
+    Provider labels are weighted by their confidence; urgency corrections made
+    by users count `correction_weight` times.
+    """
+    query = Email.query.filter(
+        Email.is_classified == True,
+        Email.urgency_category.in_(VALID_URGENCIES),
+        or_(Email.classification_model.is_(None), Email.classification_model.notin_(UNTRAINABLE_MODELS))
+    ).order_by(Email.classified_at.desc())
+    if limit:
+        query = query.limit(limit)
+    
+    emails_data, labels, weights = [], [], []
+    for email in query:
+        emails_data.append(email.to_classification_payload())
+        labels.append(email.urgency_category)
+        if email.classification_model == USER_CORRECTION_MODEL:
+            weights.append(correction_weight)
+        else:
+            weights.append(max(0.1, email.ai_confidence or 0.0))
+    return emails_data, labels, weights
+
+def train_local_classifier(config, holdout: float = 0.1, limit: int = None) -> Optional[LocalClassifier]:
+    """
+    Train on the stored classifications, report holdout metrics and save the model.
+    
+    Returns None when there are not enough labelled emails.
+    """
+    last_label_id = db.session.query(func.max(ClassificationLabel.id)).scalar() or 0
+    # Committed labels close below it, which online learning would otherwise check again
+    rescan_ids = int(config.get('LOCAL_CLASSIFIER_ONLINE_RESCAN_IDS', 1000))
+    learned_label_ids = [
+        label_id for label_id, in db.session.query(ClassificationLabel.id).filter(
+            ClassificationLabel.id > last_label_id - rescan_ids
+        ).order_by(ClassificationLabel.id)
+    ]
+    emails_data, labels, weights = load_training_data(
+        correction_weight=float(config.get('LOCAL_CLASSIFIER_CORRECTION_WEIGHT', 2.0)),
+        limit=limit
+    )
+    min_rows = int(config.get('LOCAL_CLASSIFIER_MIN_TRAINING_ROWS', 200))
+    if len(emails_data) < min_rows:
+        logger.warning(f"Only {len(emails_data)} classified emails - need {min_rows} to train the local classifier")
+        return None
+    
+    threshold = float(config.get('LOCAL_CLASSIFIER_THRESHOLD', 0.9))
+    dim = 2 ** int(config.get('LOCAL_CLASSIFIER_HASH_BITS', 18))
+    
+    # Holdout metrics: how often the model answers at the threshold, and how often it is right then
+    order = np.random.default_rng(0).permutation(len(emails_data))
+    split = int(len(order) * (1 - holdout))
+    train_rows, test_rows = order[:split], order[split:]
+    model = LocalClassifier(dim=dim).fit(
+        [emails_data[i] for i in train_rows], [labels[i] for i in train_rows], [weights[i] for i in train_rows]
+    )
+    predictions = model.classify_many([emails_data[i] for i in test_rows], threshold)
+    answered = [(prediction, labels[i]) for prediction, i in zip(predictions, test_rows) if prediction]
+    coverage = len(answered) / len(test_rows) if len(test_rows) else 0.0
+    precision = sum(p['urgency_category'] == label for p, label in answered) / len(answered) if answered else 0.0
+    
+    # Final model on all rows
+    model = LocalClassifier(dim=dim).fit(emails_data, labels, weights)
+    model.metadata = {
+        'trained_at': datetime.now(timezone.utc).isoformat(),
+        'training_rows': len(emails_data),
+        'threshold': threshold,
+        'holdout_coverage': round(coverage, 3),
+        'holdout_precision': round(precision, 3),
+        # Labels up to here are in the training set; online learning continues after them
+        'last_label_id': last_label_id,
+        'learned_label_ids': learned_label_ids,
+        'online_examples': 0
+    }
+    save_model_version(model, config)
+    
+    logger.info(
+        f"Local classifier v{model.version} trained on {len(emails_data)} emails: answers {coverage:.0%} of holdout "
+        f"at threshold {threshold} with {precision:.0%} precision"
+    )
+    return model
+
+_model = None
+_model_pid = None
+_model_mtime = None
+_model_lock = threading.Lock()
+
+def get_local_classifier(config) -> Optional[LocalClassifier]:
+    """The process-wide model from LOCAL_CLASSIFIER_PATH, reloaded when a newer version is saved (None if absent)."""
+    global _model, _model_pid, _model_mtime
+    
+    if not config.get('LOCAL_CLASSIFIER_ENABLED', True):
+        return None
+    
+    path = config.get('LOCAL_CLASSIFIER_PATH')
+    try:
+        mtime = os.path.getmtime(path) if path else None
+    except OSError:
+        mtime = None
+    
+    with _model_lock:
+        if _model_pid != os.getpid() or _model_mtime != mtime:
+            _model_pid = os.getpid()
+            _model_mtime = mtime
+            _model = None
+            if mtime is not None:
+                try:
+                    _model = LocalClassifier.load(path)
+                    logger.info(
+                        f"Loaded local classifier v{_model.version} from {path} "
+                        f"({_model.metadata.get('training_rows', '?')} training emails, "
+                        f"{_model.metadata.get('online_examples', 0)} learned online)"
+                    )
+                except Exception as e:
+                    logger.warning(f"Could not load local classifier from {path}: {str(e)}")
+        return _model
@@ -0,0 +1,129 @@
+"""
+Mailbox Sync
+Delta-syncs several folders of several accounts at once, for scheduled syncs outside /sync.
+
+The delta round of every (account, folder) is fetched concurrently by the
+AsyncGraphClient. Each result is stored on the calling thread as soon as it
+arrives, with the same ingest, watermark, near-duplicate and queueing steps
+as /sync, while the others are still downloading.
+"""
+
+import time
+import logging
+from concurrent.futures import as_completed
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+from flask import current_app
+from app import db
+from app.models.email import Email
+from app.models.classification_job import ClassificationJob
+from .async_graph import get_async_graph_client
+from .email_ingest import ingest_messages, remove_messages
+from .near_duplicates import NearDuplicateIndex
+
+logger = logging.getLogger(__name__)
+
+def sync_folders(config, folders: List[str] = None) -> List[str]:
+    """Folders stored by mailbox syncs (default SYNC_FOLDERS). Sent items are only read live by /sent."""
+    folders = folders or [folder.strip() for folder in config.get('SYNC_FOLDERS', 'inbox').split(',') if folder.strip()]
+    if 'sentitems' in folders:
+        logger.warning("SYNC_FOLDERS: sentitems is not stored, skipping it")
+    return [folder for folder in folders if folder != 'sentitems']
+
+class MailboxSync:
+    """Fetches delta rounds of accounts' folders concurrently and stores each as it completes."""
+    
+    def __init__(self, config=None):
+        self.config = config or current_app.config
+        self.client = get_async_graph_client(self.config)
+        self.max_messages = int(self.config.get('MAX_EMAILS_PER_SYNC', 1000))
+        self.page_size = int(self.config.get('SYNC_PAGE_SIZE', 50))
+        self.initial_days = int(self.config.get('DELTA_SYNC_INITIAL_DAYS', 30))
+        self.max_classification_attempts = self.config.get('CLASSIFICATION_MAX_ATTEMPTS', 5)
+    
+    async def _fetch(self, account_id: str, access_token: str, folder: str, delta_link: str = None) -> Dict:
+        """Changes of a folder since its watermark, starting a new round if there is none or it expired."""
+        since = datetime.now(timezone.utc) - timedelta(days=self.initial_days)
+        result = await self.client.fetch_delta(
+            account_id, access_token, folder, delta_link=delta_link, since=None if delta_link else since,
+            page_size=self.page_size, max_messages=self.max_messages
+        )
+        if result.get('resync_required'):
+            result = await self.client.fetch_delta(
+                account_id, access_token, folder, since=since,
+                page_size=self.page_size, max_messages=self.max_messages
+            )
+        return result
+    
+    def sync(self, accounts, folders: List[str] = None) -> Dict:
+        """Sync `folders` (default SYNC_FOLDERS) of every account with an access token and return totals."""
+        started = time.monotonic()
+        folders = sync_folders(self.config, folders)
+        accounts = {account.id: account for account in accounts if account.access_token}
+        
+        futures = {
+            self.client.submit(self._fetch(account.id, account.access_token, folder, account.get_delta_link(folder))): (account.id, folder)
+            for account in accounts.values() for folder in folders
+        }
+        logger.info(f"📬 Syncing {len(folders)} folders of {len(accounts)} accounts, {len(futures)} delta rounds at once")
+        
+        report = {
+            'accounts': len(accounts), 'folders': folders, 'synced': 0, 'updated': 0, 'removed': 0,
+            'inherited': 0, 'header_classified': 0, 'queued': 0, 'failed': []
+        }
+        failed_accounts = set()
+        for future in as_completed(futures):
+            account_id, folder = futures[future]
+            email_account = accounts[account_id]
+            try:
+                self._store(email_account, folder, future.result(), report)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Mailbox sync of {email_account.email_address}/{folder} failed: {str(e)}")
+                failed_accounts.add(account_id)
+                email_account.sync_error_message = str(e)[:1000]
+                db.session.commit()
+                report['failed'].append({'email_account_id': account_id, 'folder': folder, 'error': str(e)[:200]})
+        
+        now = datetime.now(timezone.utc)
+        for account_id, email_account in accounts.items():
+            if account_id not in failed_accounts:
+                email_account.last_sync_at = now
+                email_account.sync_error_message = None
+        db.session.commit()
+        
+        report['seconds'] = round(time.monotonic() - started, 2)
+        logger.info(
+            f"📬 Mailbox sync done in {report['seconds']}s: {report['synced']} new, {report['updated']} updated, "
+            f"{report['removed']} removed, {len(report['failed'])} folders failed"
+        )
+        return report
+    
+    def _store(self, email_account, folder: str, result: Dict, report: Dict):
+        """Store one folder's delta round and its watermark, then queue its new emails."""
+        classify = email_account.auto_classify_enabled
+        synced, updated, _, new_emails, header_classified = ingest_messages(
+            email_account, result['value'], classify_headers=classify
+        )
+        removed = remove_messages(email_account, result['removed'])
+        email_account.set_delta_link(folder, result.get('@odata.deltaLink') or result.get('@odata.nextLink'))
+        db.session.commit()
+        
+        # Near-duplicates of classified emails inherit their classification; the rest is queued
+        inherited, queued = [], []
+        if new_emails:
+            emails = Email.query.filter(Email.id.in_([email['email_id'] for email in new_emails])).all()
+            index = NearDuplicateIndex()
+            if classify:
+                inherited, remaining = index.inherit_classifications(emails)
+                queued = ClassificationJob.enqueue(remaining, priority=3, max_attempts=self.max_classification_attempts)
+            else:
+                index.index_emails(emails)
+            db.session.commit()
+        
+        report['synced'] += synced
+        report['updated'] += updated
+        report['removed'] += removed
+        report['inherited'] += len(inherited)
+        report['header_classified'] += header_classified
+        report['queued'] += len(queued)
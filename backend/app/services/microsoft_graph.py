@@ -3,15 +3,73 @@ Microsoft Graph API Service
 Handles authentication and email synchronization with Microsoft Graph.
 """
 
-import requests
 import msal
 from flask import current_app, url_for
 from datetime import datetime, timedelta
 import json
 import logging
+from .graph_http import graph_request, parse_retry_after
 
 logger = logging.getLogger(__name__)
 
+class GraphRequestError(Exception):
+    """A Microsoft Graph request that did not return 200."""
+    
+    def __init__(self, status_code, message='', retry_after=None):
+        super().__init__(f"Graph API error {status_code}: {message}")
+        self.status_code = status_code
+        self.retry_after = retry_after  # Seconds Graph asked to wait (429/503 throttling)
+    
+    @classmethod
+    def from_response(cls, response):
+        return cls(response.status_code, response.text, retry_after=parse_retry_after(response.headers.get('Retry-After')))
+    
+    @property
+    def kind(self):
+        """auth, forbidden, not_found, gone, throttled, server, client or invalid_response."""
+        if self.status_code == 401:
+            return 'auth'  # Token expired or revoked: the account has to reconnect
+        if self.status_code == 403:
+            return 'forbidden'
+        if self.status_code == 404:
+            return 'not_found'
+        if self.status_code == 410:
+            return 'gone'  # Delta watermark expired
+        if self.status_code == 429 or (self.status_code == 503 and self.retry_after is not None):
+            return 'throttled'
+        if self.status_code >= 500:
+            return 'server'
+        if self.status_code >= 400:
+            return 'client'
+        return 'invalid_response'
+    
+    @property
+    def is_auth_error(self):
+        return self.kind in ('auth', 'forbidden')
+    
+    @property
+    def is_transient(self):
+        """Whether the same request may succeed later (throttling or a Graph outage)."""
+        return self.kind in ('throttled', 'server')
+
+def split_delta_page(page):
+    """
+    Split a Graph delta page into 'value' (changed messages), 'removed'
+    (deleted message ids) and its watermark ('@odata.nextLink' or '@odata.deltaLink').
+    """
+    messages = []
+    removed = []
+    for item in page.get('value', []):
+        if '@removed' in item:
+            removed.append(item['id'])
+        else:
+            messages.append(item)
+    
+    watermark = {key: page[key] for key in ('@odata.nextLink', '@odata.deltaLink') if key in page}
+    if not watermark:
+        raise GraphRequestError(200, 'Delta response ended without deltaLink or nextLink')
+    return dict(watermark, value=messages, removed=removed)
+
 class MicrosoftGraphService:
     """Service class for Microsoft Graph API operations."""
     
@@ -110,11 +168,10 @@ class MicrosoftGraphService:
     
     def test_token(self, access_token):
         """Test if token has correct permissions by getting user profile."""
-        headers = {'Authorization': f'Bearer {access_token}'}
         url = 'https://graph.microsoft.com/v1.0/me'
         
         try:
-            response = requests.get(url, headers=headers, timeout=10)
+            response = graph_request(self.config, 'GET', url, access_token, timeout=10)
             logger.info(f"Token test response: {response.status_code}")
             if response.status_code == 200:
                 return {'success': True, 'data': response.json()}
@@ -127,14 +184,8 @@ class MicrosoftGraphService:
 
     def get_user_profile(self, access_token):
         """Get user profile information from Microsoft Graph."""
-        headers = {'Authorization': f'Bearer {access_token}'}
-        
         try:
-            response = requests.get(
-                'https://graph.microsoft.com/v1.0/me',
-                headers=headers,
-                timeout=10
-            )
+            response = graph_request(self.config, 'GET', 'https://graph.microsoft.com/v1.0/me', access_token, timeout=10)
             
             if response.status_code == 200:
                 return response.json()
@@ -146,64 +197,187 @@ class MicrosoftGraphService:
             return None
     
     def get_user_emails(self, access_token, top=50, skip=0, folder='inbox'):
-        """Get user emails from Microsoft Graph."""
-        headers = {'Authorization': f'Bearer {access_token}'}
+        """
+        Get user emails from Microsoft Graph.
         
+        Throttled requests are retried (see graph_http); raises GraphRequestError
+        on a non-200 response and requests.RequestException when Graph is unreachable.
+        """
         # Build query parameters - adjust for sent items folder
         if folder == 'sentitems':
             params = {
                 '$top': top,
                 '$skip': skip,
                 '$orderby': 'sentDateTime desc',
-                '$select': 'id,subject,sender,from,toRecipients,sentDateTime,createdDateTime,body,isRead,importance,flag,hasAttachments,conversationId,conversationIndex'
+                '$select': self._message_select_fields(folder)
             }
         else:
             params = {
                 '$top': top,
                 '$skip': skip,
                 '$orderby': 'receivedDateTime desc',
-                '$select': 'id,subject,sender,from,toRecipients,receivedDateTime,createdDateTime,body,isRead,importance,flag,hasAttachments,internetMessageHeaders'
+                '$select': self._message_select_fields(folder)
             }
         
         url = f'https://graph.microsoft.com/v1.0/me/mailFolders/{folder}/messages'
         
-        try:
-            logger.info(f"Making Graph API request to: {url}")
-            logger.info(f"Token length: {len(access_token) if access_token else 0}")
-            logger.info(f"Token preview: {access_token[:10] + '...' if access_token else 'No token'}")
-            
-            response = requests.get(url, headers=headers, params=params, timeout=15)
+        logger.info(f"Making Graph API request to: {url}")
+        logger.info(f"Token length: {len(access_token) if access_token else 0}")
+        logger.info(f"Token preview: {access_token[:10] + '...' if access_token else 'No token'}")
+        
+        response = graph_request(self.config, 'GET', url, access_token, params=params, timeout=15)
+        
+        logger.info(f"Graph API response status: {response.status_code}")
+        if response.status_code != 200:
+            logger.error(f"Graph API error details: {response.text}")
+            # Try to parse the error for more specific details
+            try:
+                error_data = response.json()
+                if 'error' in error_data:
+                    logger.error(f"Graph API error code: {error_data['error'].get('code')}")
+                    logger.error(f"Graph API error message: {error_data['error'].get('message')}")
+            except:
+                pass
+            raise GraphRequestError.from_response(response)
+        
+        result = response.json()
+        logger.info(f"Successfully retrieved {len(result.get('value', []))} emails")
+        return result
+    
+    def iter_pages(self, access_token, url, params=None, page_size=None):
+        """
+        Yield the pages of a Graph collection one at a time, following @odata.nextLink.
+        
+        Only the current page is held in memory, and the next one is requested
+        when the caller asks for it. Throttled requests are retried (see
+        graph_http); raises GraphRequestError on a non-200 response.
+        """
+        headers = {'Prefer': f'odata.maxpagesize={page_size}'} if page_size else None
+        
+        while url:
+            response = graph_request(self.config, 'GET', url, access_token, headers=headers, params=params, timeout=15)
+            params = None  # nextLink already carries the query
             
-            logger.info(f"Graph API response status: {response.status_code}")
             if response.status_code != 200:
-                logger.error(f"Graph API error details: {response.text}")
-                # Try to parse the error for more specific details
-                try:
-                    error_data = response.json()
-                    if 'error' in error_data:
-                        logger.error(f"Graph API error code: {error_data['error'].get('code')}")
-                        logger.error(f"Graph API error message: {error_data['error'].get('message')}")
-                except:
-                    pass
+                logger.error(f"Graph API error: {response.status_code} - {response.text}")
+                raise GraphRequestError.from_response(response)
             
-            if response.status_code == 200:
-                result = response.json()
-                logger.info(f"Successfully retrieved {len(result.get('value', []))} emails")
-                return result
-            else:
-                logger.error(f"Error getting emails: {response.status_code} - {response.text}")
-                return None
+            page = response.json()
+            yield page
+            url = page.get('@odata.nextLink')
+    
+    def iter_email_pages(self, access_token, folder='inbox', page_size=50, received_after=None, received_before=None):
+        """
+        Pages of a folder's messages, newest first, as Graph returns them (see iter_pages).
+        
+        With `received_after` / `received_before`, only messages received in
+        [received_after, received_before) are listed (sent in, for sentitems).
+        """
+        order_field = 'sentDateTime' if folder == 'sentitems' else 'receivedDateTime'
+        params = {
+            '$top': page_size,
+            '$orderby': f'{order_field} desc',
+            '$select': self._message_select_fields(folder)
+        }
+        filters = []
+        if received_after:
+            filters.append(f"{order_field} ge {received_after.strftime('%Y-%m-%dT%H:%M:%SZ')}")
+        if received_before:
+            filters.append(f"{order_field} lt {received_before.strftime('%Y-%m-%dT%H:%M:%SZ')}")
+        if filters:
+            params['$filter'] = ' and '.join(filters)
+        url = f'https://graph.microsoft.com/v1.0/me/mailFolders/{folder}/messages'
+        return self.iter_pages(access_token, url, params)
+    
+    def iter_delta_pages(self, access_token, folder='inbox', delta_link=None, since=None, page_size=50):
+        """
+        Pages of a Graph delta round, one at a time.
+        
+        Starts a new delta round when no delta_link is given (optionally limited to
+        messages received after `since`). Each page is a dict with 'value' (changed
+        messages), 'removed' (deleted message ids) and its watermark: the
+        '@odata.nextLink' to resume after it, or on the last page the
+        '@odata.deltaLink' for the next round. Raises GraphRequestError, with
+        status 410 when the watermark expired and a full resync is required.
+        """
+        if delta_link:
+            url = delta_link
+            params = None
+        else:
+            url = f'https://graph.microsoft.com/v1.0/me/mailFolders/{folder}/messages/delta'
+            params = {'$select': self._message_select_fields(folder)}
+            if since:
+                params['$filter'] = f"receivedDateTime ge {since.strftime('%Y-%m-%dT%H:%M:%SZ')}"
+        
+        for page in self.iter_pages(access_token, url, params, page_size=page_size):
+            yield split_delta_page(page)
+    
+    def _message_select_fields(self, folder):
+        """
+        Get the $select field list used when listing messages of a folder.
+        
+        Received mail is listed metadata-first: Graph's own bodyPreview instead
+        of the full body, which is fetched when the email is opened (or
+        prefetched for urgent mail) unless SYNC_FETCH_BODIES is set. Headers are
+        only requested for the header rules.
+        """
+        if folder == 'sentitems':
+            return 'id,subject,sender,from,toRecipients,sentDateTime,createdDateTime,body,isRead,importance,flag,hasAttachments,conversationId,conversationIndex'
+        fields = 'id,subject,sender,from,toRecipients,receivedDateTime,createdDateTime,bodyPreview,isRead,importance,flag,hasAttachments'
+        if self.config.get('SYNC_FETCH_BODIES', False):
+            fields += ',body'
+        if self.config.get('HEADER_RULES_ENABLED', True):
+            fields += ',internetMessageHeaders'
+        return fields
+    
+    def get_delta_emails(self, access_token, folder='inbox', delta_link=None, since=None,
+                         page_size=50, max_messages=None):
+        """
+        Get new, changed and deleted messages of a folder using Graph delta queries.
+        
+        Starts a new delta round when no delta_link is given (optionally limited to
+        messages received after `since`) and follows @odata.nextLink pages until
+        Graph hands back a @odata.deltaLink. If `max_messages` is reached first, the
+        pending @odata.nextLink is returned instead so the next sync resumes there.
+        
+        Returns a dict with 'value' (changed messages), 'removed' (deleted message
+        ids) and the watermark under '@odata.deltaLink' or '@odata.nextLink';
+        {'resync_required': True} if the watermark expired; None on error.
+        """
+        messages = []
+        removed = []
+        
+        try:
+            for page in self.iter_delta_pages(access_token, folder, delta_link, since, page_size):
+                messages.extend(page['value'])
+                removed.extend(page['removed'])
+                
+                if '@odata.deltaLink' in page:
+                    logger.info(f"Delta round complete: {len(messages)} changed, {len(removed)} removed")
+                    return {'value': messages, 'removed': removed, '@odata.deltaLink': page['@odata.deltaLink']}
+                
+                if max_messages and len(messages) + len(removed) >= max_messages:
+                    logger.info(f"Delta page budget reached ({max_messages}), resuming next sync")
+                    return {'value': messages, 'removed': removed, '@odata.nextLink': page['@odata.nextLink']}
+            
+            logger.error("Delta response ended without deltaLink or nextLink")
+            return None
+        except GraphRequestError as e:
+            if e.status_code == 410:
+                logger.warning(f"Delta watermark expired for folder {folder}, full resync required")
+                return {'resync_required': True}
+            logger.error(f"Error getting delta emails: {str(e)}")
+            return None
         except Exception as e:
-            logger.error(f"Exception getting emails: {str(e)}")
+            logger.error(f"Exception getting delta emails: {str(e)}")
             return None
     
-    def get_email_by_id(self, access_token, message_id):
-        """Get specific email by ID."""
-        headers = {'Authorization': f'Bearer {access_token}'}
+    def get_email_by_id(self, access_token, message_id, select=None):
+        """Get specific email by ID, optionally only the `select` fields."""
         url = f'https://graph.microsoft.com/v1.0/me/messages/{message_id}'
         
         try:
-            response = requests.get(url, headers=headers, timeout=10)
+            response = graph_request(self.config, 'GET', url, access_token, params={'$select': select} if select else None, timeout=10)
             
             if response.status_code == 200:
                 return response.json()
@@ -216,18 +390,9 @@ class MicrosoftGraphService:
     
     def send_email(self, access_token, to_email, subject, body, reply_to_message_id=None):
         """Send email or reply to existing email."""
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-            'Content-Type': 'application/json'
-        }
-        
         # Get user profile to use as sender
         try:
-            profile_response = requests.get(
-                'https://graph.microsoft.com/v1.0/me',
-                headers={'Authorization': f'Bearer {access_token}'},
-                timeout=10
-            )
+            profile_response = graph_request(self.config, 'GET', 'https://graph.microsoft.com/v1.0/me', access_token, timeout=10)
             if profile_response.status_code == 200:
                 profile = profile_response.json()
                 sender_email = profile.get('mail') or profile.get('userPrincipalName')
@@ -271,13 +436,13 @@ class MicrosoftGraphService:
                 url = f'https://graph.microsoft.com/v1.0/me/messages/{reply_to_message_id}/reply'
                 logger.info(f"Sending reply to message {reply_to_message_id}")
                 logger.info(f"Reply data: {json.dumps(email_data, indent=2)}")
-                response = requests.post(url, headers=headers, json={"message": email_data["message"]}, timeout=10)
+                response = graph_request(self.config, 'POST', url, access_token, json={"message": email_data["message"]}, timeout=10)
             else:
                 # Send new email
                 url = 'https://graph.microsoft.com/v1.0/me/sendMail'
                 logger.info(f"Sending new email to {to_email}")
                 logger.info(f"Email data: {json.dumps(email_data, indent=2)}")
-                response = requests.post(url, headers=headers, json=email_data, timeout=10)
+                response = graph_request(self.config, 'POST', url, access_token, json=email_data, timeout=10)
             
             logger.info(f"Email send response: {response.status_code}")
             if response.status_code != 202:
@@ -295,16 +460,11 @@ class MicrosoftGraphService:
     
     def mark_email_as_read(self, access_token, message_id):
         """Mark email as read."""
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-            'Content-Type': 'application/json'
-        }
-        
         url = f'https://graph.microsoft.com/v1.0/me/messages/{message_id}'
         data = {"isRead": True}
         
         try:
-            response = requests.patch(url, headers=headers, json=data, timeout=10)
+            response = graph_request(self.config, 'PATCH', url, access_token, json=data, idempotent=True, timeout=10)
             return response.status_code == 200
         except Exception as e:
             logger.error(f"Error marking email as read: {str(e)}")
@@ -312,11 +472,10 @@ class MicrosoftGraphService:
     
     def get_mail_folders(self, access_token):
         """Get user's mail folders."""
-        headers = {'Authorization': f'Bearer {access_token}'}
         url = 'https://graph.microsoft.com/v1.0/me/mailFolders'
         
         try:
-            response = requests.get(url, headers=headers, timeout=10)
+            response = graph_request(self.config, 'GET', url, access_token, timeout=10)
             
             if response.status_code == 200:
                 return response.json()
@@ -329,8 +488,6 @@ class MicrosoftGraphService:
     
     def search_emails(self, access_token, query, top=25):
         """Search emails by query."""
-        headers = {'Authorization': f'Bearer {access_token}'}
-        
         params = {
             '$search': f'"{query}"',
             '$top': top,
@@ -340,7 +497,7 @@ class MicrosoftGraphService:
         url = 'https://graph.microsoft.com/v1.0/me/messages'
         
         try:
-            response = requests.get(url, headers=headers, params=params, timeout=15)
+            response = graph_request(self.config, 'GET', url, access_token, params=params, timeout=15)
             
             if response.status_code == 200:
                 return response.json()
@@ -357,8 +514,7 @@ class MicrosoftGraphService:
         Devuelve los bytes de la imagen o None si no hay foto.
         """
         url = "https://graph.microsoft.com/v1.0/me/photo/$value"
-        headers = {"Authorization": f"Bearer {access_token}"}
-        response = requests.get(url, headers=headers)
+        response = graph_request(self.config, 'GET', url, access_token)
         if response.status_code == 200:
             return response.content  # Imagen en bytes
         return None
@@ -368,8 +524,7 @@ class MicrosoftGraphService:
         Obtiene el perfil del usuario autenticado en Microsoft.
         """
         url = "https://graph.microsoft.com/v1.0/me"
-        headers = {"Authorization": f"Bearer {access_token}"}
-        response = requests.get(url, headers=headers)
+        response = graph_request(self.config, 'GET', url, access_token)
         if response.status_code == 200:
             return response.json()
         return None
\ No newline at end of file
@@ -0,0 +1,190 @@
+"""
+Near-Duplicate Detection
+SimHash index over email content so mail-merge copies reuse an existing classification.
+"""
+
+import re
+import hashlib
+import unicodedata
+import logging
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from flask import current_app
+from sqlalchemy import or_
+from app import db
+from app.models.email import Email
+from app.models.email_fingerprint import EmailFingerprint
+from .prompts import VALID_URGENCIES
+
+logger = logging.getLogger(__name__)
+
+NEAR_DUPLICATE_MODEL = 'near-duplicate'
+
+SUBJECT_PREFIX_PATTERN = re.compile(r'^((re|rv|fw|fwd)\s*:\s*)+', re.IGNORECASE)
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+def _feature_hash(feature: str) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'big')
+
+def simhash(subject: str, body: str, min_tokens: int = 8) -> Optional[int]:
+    """
+    64-bit SimHash of an email's subject and body, over word counts.
+    
+    Plain words (no n-grams) keep mail-merge copies that differ in a name
+    or a date within a few bits of each other.
+    
+    Returns None for texts too short to fingerprint reliably.
+    """
+    subject = SUBJECT_PREFIX_PATTERN.sub('', unicodedata.normalize('NFKC', subject or '').lower().strip())
+    body = unicodedata.normalize('NFKC', body or '').lower()
+    tokens = TOKEN_PATTERN.findall(f"{subject} {body}")
+    if len(tokens) < min_tokens:
+        return None
+    
+    features = Counter(tokens)
+    weights = [0] * 64
+    for feature, weight in features.items():
+        value = _feature_hash(feature)
+        for bit in range(64):
+            weights[bit] += weight if value >> bit & 1 else -weight
+    
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+def split_bands(value: int, bands: int = EmailFingerprint.BANDS) -> List[int]:
+    """Split a 64-bit SimHash into equal-width LSH bands."""
+    width = 64 // bands
+    mask = (1 << width) - 1
+    return [(value >> (i * width)) & mask for i in range(bands)]
+
+class NearDuplicateIndex:
+    """Fingerprints emails at ingest and finds classified near-duplicates."""
+    
+    def __init__(self, config=None):
+        self.config = config or current_app.config
+        self.enabled = self.config.get('NEAR_DUPLICATE_ENABLED', True)
+        self.max_distance = int(self.config.get('NEAR_DUPLICATE_MAX_DISTANCE', 7))
+        self.min_tokens = int(self.config.get('NEAR_DUPLICATE_MIN_TOKENS', 8))
+    
+    def fingerprint(self, email: Email) -> Optional[int]:
+        return simhash(email.subject, email.body_preview, self.min_tokens)
+    
+    def index_emails(self, emails: List[Email]) -> Dict[str, EmailFingerprint]:
+        """Add fingerprints for emails that don't have one yet (caller commits)."""
+        if not self.enabled or not emails:
+            return {}
+        
+        existing = {
+            fingerprint.email_id: fingerprint
+            for fingerprint in EmailFingerprint.query.filter(
+                EmailFingerprint.email_id.in_([email.id for email in emails])
+            )
+        }
+        
+        for email in emails:
+            if email.id in existing:
+                continue
+            value = self.fingerprint(email)
+            if value is None:
+                continue
+            fingerprint = EmailFingerprint(
+                email_id=email.id,
+                email_account_id=email.email_account_id,
+                sender_email=(email.sender_email or '').lower(),
+                simhash=f"{value:016x}",
+                **{f'band_{i}': band for i, band in enumerate(split_bands(value))}
+            )
+            db.session.add(fingerprint)
+            existing[email.id] = fingerprint
+        
+        return existing
+    
+    def find_classified_duplicate(self, fingerprint: EmailFingerprint) -> Optional[Tuple[Email, int]]:
+        """Closest already-classified email from the same sender within max_distance, with its distance."""
+        candidates = db.session.query(EmailFingerprint, Email).join(
+            Email, Email.id == EmailFingerprint.email_id
+        ).filter(
+            EmailFingerprint.email_account_id == fingerprint.email_account_id,
+            EmailFingerprint.sender_email == fingerprint.sender_email,
+            EmailFingerprint.email_id != fingerprint.email_id,
+            or_(*[column == band for column, band in zip(EmailFingerprint.band_columns(), fingerprint.bands)]),
+            Email.is_classified == True,
+            Email.urgency_category.in_(VALID_URGENCIES),
+            or_(Email.classification_model.is_(None), Email.classification_model != 'rules')
+        ).order_by(Email.classified_at.desc()).limit(50).all()
+        
+        best = None
+        for candidate, email in candidates:
+            distance = hamming_distance(fingerprint.value, candidate.value)
+            if distance <= self.max_distance and (best is None or distance < best[1]):
+                best = (email, distance)
+        return best
+    
+    def inherit(self, email: Email, source: Email, distance: int, fingerprint: EmailFingerprint = None):
+        """Copy `source`'s classification onto `email` and record the link (caller commits)."""
+        email.apply_classification({
+            'urgency_category': source.urgency_category,
+            'confidence_score': source.ai_confidence or 0.0,
+            'reasoning': f"Casi idéntico a un correo ya clasificado (diferencia {distance}/64): {source.ai_reasoning or ''}".strip(),
+            'classification_model': NEAR_DUPLICATE_MODEL
+        }, NEAR_DUPLICATE_MODEL)
+        
+        fingerprint = fingerprint or db.session.get(EmailFingerprint, email.id)
+        if fingerprint is not None:
+            fingerprint.duplicate_of_id = source.id
+            fingerprint.hamming_distance = distance
+    
+    def inherit_classifications(self, emails: List[Email]) -> Tuple[List[Email], List[Email]]:
+        """
+        Classify emails that are near-duplicates of already-classified ones (caller commits).
+        
+        Returns (inherited, remaining); only `remaining` needs the AI classifier.
+        """
+        if not self.enabled or not emails:
+            return [], list(emails)
+        
+        fingerprints = self.index_emails(emails)
+        db.session.flush()
+        
+        inherited, remaining = [], []
+        for email in emails:
+            fingerprint = fingerprints.get(email.id)
+            match = self.find_classified_duplicate(fingerprint) if fingerprint is not None else None
+            if match is None:
+                remaining.append(email)
+                continue
+            
+            source, distance = match
+            self.inherit(email, source, distance, fingerprint)
+            inherited.append(email)
+        
+        if inherited:
+            logger.info(f"🔁 {len(inherited)} of {len(emails)} emails inherited a near-duplicate's classification")
+        return inherited, remaining
+    
+    def group_near_duplicates(self, emails: List[Email]) -> List[Tuple[Email, List[Tuple[Email, int]]]]:
+        """
+        Group emails of the same sender that are near-duplicates of each other.
+        
+        Returns [(representative, [(member, distance), ...])] so only the
+        representatives need to be classified.
+        """
+        fingerprints = self.index_emails(emails) if self.enabled else {}
+        
+        groups = []
+        for email in emails:
+            fingerprint = fingerprints.get(email.id)
+            for representative, members in groups:
+                other = fingerprints.get(representative.id)
+                if fingerprint is None or other is None or other.sender_email != fingerprint.sender_email:
+                    continue
+                distance = hamming_distance(fingerprint.value, other.value)
+                if distance <= self.max_distance:
+                    members.append((email, distance))
+                    break
+            else:
+                groups.append((email, []))
+        
+        return groups
@@ -0,0 +1,298 @@
+"""
+Online Learning
+Labelled examples for the local classifier, learned from as they arrive.
+
+Every urgency correction made through /update-urgency and every AI answer
+is stored as a ClassificationLabel, together with what the local model
+predicted for that email at the time. The OnlineLearner, run periodically by
+the classification worker, feeds the labels the current model has not seen
+into LocalClassifier.partial_fit and saves the result as the next model
+version, so the cascade answers more emails locally as the model improves.
+Weekly agreement between local predictions and AI answers, next to the
+weekly AI call volume, shows whether that is happening.
+"""
+
+import os
+import threading
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from flask import current_app
+from app import db
+from app.models.email import Email, USER_CORRECTION_MODEL
+from app.models.classification_label import ClassificationLabel
+from .keyword_rules import RULES_MODEL
+from .header_rules import HEADER_RULES_MODEL
+from .near_duplicates import NEAR_DUPLICATE_MODEL
+from .sender_reputation import SENDER_PRIOR_MODEL
+from .prompts import VALID_URGENCIES
+from .rate_limiter import fcntl
+
+logger = logging.getLogger(__name__)
+
+# Answers that did not come from an AI provider call (cache hits are 'cache:<model>')
+NON_AI_MODELS = (RULES_MODEL, HEADER_RULES_MODEL, 'local', SENDER_PRIOR_MODEL, NEAR_DUPLICATE_MODEL, USER_CORRECTION_MODEL)
+CACHE_MODEL_PREFIX = 'cache:'
+
+def is_ai_answer(classification_model: Optional[str]) -> bool:
+    """Whether a stored classification came from an AI provider call."""
+    return bool(classification_model) and classification_model not in NON_AI_MODELS \
+        and not classification_model.startswith(CACHE_MODEL_PREFIX)
+
+def _local_model(config):
+    """The current local model, or None (not trained yet, disabled or NumPy missing)."""
+    try:
+        from .local_classifier import get_local_classifier
+    except ImportError:
+        return None
+    return get_local_classifier(config)
+
+def _predict(config, emails: List[Email]) -> List[tuple]:
+    """(prediction, confidence, model version) of the local model for each email, or Nones."""
+    model = _local_model(config)
+    if model is None or not emails:
+        return [(None, None, None)] * len(emails)
+    
+    probabilities = model.predict_proba([email.to_classification_payload() for email in emails])
+    return [
+        (model.labels[int(row.argmax())], round(float(row.max()), 3), model.version)
+        for row in probabilities
+    ]
+
+def _in_savepoint(fn):
+    """Recording labels never fails the caller's transaction."""
+    try:
+        with db.session.begin_nested():
+            fn()
+    except Exception as e:
+        logger.warning(f"Could not record classification labels: {str(e)}")
+
+def record_ai_labels(emails: List[Email], config=None):
+    """Store the AI answers among freshly classified emails as labelled examples (caller commits)."""
+    config = config or current_app.config
+    if not config.get('LOCAL_CLASSIFIER_ONLINE_LEARNING', True):
+        return
+    
+    labelled = [
+        email for email in emails
+        if email.is_classified and email.urgency_category in VALID_URGENCIES and is_ai_answer(email.classification_model)
+    ]
+    if not labelled:
+        return
+    
+    def record():
+        for email, (prediction, confidence, version) in zip(labelled, _predict(config, labelled)):
+            db.session.add(ClassificationLabel(
+                email_id=email.id,
+                email_account_id=email.email_account_id,
+                source='ai',
+                label=email.urgency_category,
+                weight=max(0.1, email.ai_confidence or 0.0),
+                local_prediction=prediction,
+                local_confidence=confidence,
+                model_version=version
+            ))
+    
+    _in_savepoint(record)
+
+def record_correction(email: Email, category: str, config=None):
+    """Store a user's urgency correction as a labelled example; call before changing the email (caller commits)."""
+    config = config or current_app.config
+    if not config.get('LOCAL_CLASSIFIER_ONLINE_LEARNING', True):
+        return
+    
+    def record():
+        prediction, confidence, version = _predict(config, [email])[0]
+        db.session.add(ClassificationLabel(
+            email_id=email.id,
+            email_account_id=email.email_account_id,
+            source='user',
+            label=category,
+            weight=float(config.get('LOCAL_CLASSIFIER_CORRECTION_WEIGHT', 2.0)),
+            previous_label=email.urgency_category if email.is_classified else None,
+            previous_model=email.classification_model if email.is_classified else None,
+            local_prediction=prediction,
+            local_confidence=confidence,
+            model_version=version
+        ))
+    
+    _in_savepoint(record)
+
+class OnlineLearner:
+    """Applies the labels recorded since the current model version and saves the next version."""
+    
+    _thread_lock = threading.Lock()
+    
+    def __init__(self, config=None):
+        self.config = config or current_app.config
+        self.path = self.config.get('LOCAL_CLASSIFIER_PATH')
+        self.min_examples = int(self.config.get('LOCAL_CLASSIFIER_ONLINE_MIN_EXAMPLES', 20))
+        self.max_examples = int(self.config.get('LOCAL_CLASSIFIER_ONLINE_MAX_EXAMPLES', 5000))
+        self.rescan_ids = int(self.config.get('LOCAL_CLASSIFIER_ONLINE_RESCAN_IDS', 1000))
+    
+    def _unlearned(self, query, model):
+        """
+        Filter `query` to the labels `model` has not learned from.
+        
+        Ids are assigned on insert but become visible on commit, so a label
+        can show up after labels with higher ids were learned. The last
+        LOCAL_CLASSIFIER_ONLINE_RESCAN_IDS ids below the newest learned one
+        are checked again, skipping the ones listed as learned in the model.
+        """
+        last_label_id = model.metadata.get('last_label_id', 0)
+        learned = model.metadata.get('learned_label_ids', [])
+        query = query.filter(ClassificationLabel.id > last_label_id - self.rescan_ids)
+        if learned:
+            query = query.filter(ClassificationLabel.id.notin_(learned))
+        return query
+    
+    def pending(self, model) -> int:
+        return self._unlearned(ClassificationLabel.query, model).count()
+    
+    def update(self) -> Optional[Dict]:
+        """
+        Learn from pending labels if there are at least LOCAL_CLASSIFIER_ONLINE_MIN_EXAMPLES.
+        
+        Only one process updates at a time (lock file next to the model);
+        the others skip. Returns a summary of the saved version, or None.
+        """
+        if not self.config.get('LOCAL_CLASSIFIER_ONLINE_LEARNING', True) or not self.path or not os.path.exists(self.path):
+            return None
+        
+        if not OnlineLearner._thread_lock.acquire(blocking=False):
+            return None
+        lock_file = None
+        try:
+            if fcntl is not None:
+                lock_file = open(f"{self.path}.lock", 'a')
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return None  # Another process is learning
+            return self._update()
+        finally:
+            if lock_file is not None:
+                lock_file.close()
+            OnlineLearner._thread_lock.release()
+    
+    def _update(self) -> Optional[Dict]:
+        from .local_classifier import LocalClassifier, save_model_version
+        
+        # A private copy: the shared model keeps answering while this one learns
+        model = LocalClassifier.load(self.path)
+        base_version = model.version
+        
+        rows = self._unlearned(db.session.query(ClassificationLabel, Email).join(
+            Email, Email.id == ClassificationLabel.email_id
+        ).filter(
+            ClassificationLabel.label.in_(model.labels)
+        ), model).order_by(ClassificationLabel.id).limit(self.max_examples).all()
+        
+        if len(rows) < self.min_examples:
+            return None
+        
+        model.partial_fit(
+            [email.to_classification_payload() for _, email in rows],
+            [label.label for label, _ in rows],
+            [label.weight for label, _ in rows],
+            seed=rows[-1][0].id
+        )
+        last_label_id = max(model.metadata.get('last_label_id', 0), rows[-1][0].id)
+        model.metadata['last_label_id'] = last_label_id
+        model.metadata['learned_label_ids'] = sorted(
+            label_id for label_id in set(model.metadata.get('learned_label_ids', [])) | {label.id for label, _ in rows}
+            if label_id > last_label_id - self.rescan_ids
+        )
+        model.metadata['online_examples'] = model.metadata.get('online_examples', 0) + len(rows)
+        model.metadata['online_updated_at'] = datetime.now(timezone.utc).isoformat()
+        if LocalClassifier.load(self.path).version != base_version:
+            return None  # Retrained meanwhile; the new model already covers these labels
+        save_model_version(model, self.config)
+        
+        corrections = sum(label.source == 'user' for label, _ in rows)
+        logger.info(f"🧠 Local classifier v{model.version} learned from {len(rows)} new labels ({corrections} user corrections)")
+        return {
+            'version': model.version,
+            'examples': len(rows),
+            'corrections': corrections,
+            'last_label_id': model.metadata['last_label_id']
+        }
+
+def _week(moment: datetime) -> str:
+    day = moment.date()
+    return (day - timedelta(days=day.weekday())).isoformat()
+
+def get_learning_metrics(account_ids: List[str], weeks: int = 8, config=None) -> Dict:
+    """
+    Weekly local-model agreement with AI answers and classification volume by source, for some accounts.
+    
+    Per week (starting Monday): AI answers whose email the local model had
+    a prediction for and how many it agreed with, user corrections, and the
+    emails classified by an AI call, the local model or anything else.
+    """
+    config = config or current_app.config
+    since = datetime.now(timezone.utc) - timedelta(weeks=weeks)
+    since = since - timedelta(days=since.weekday())
+    series = OrderedDict()
+    
+    def week(moment):
+        return series.setdefault(_week(moment), {
+            'ai_labels': 0, 'compared': 0, 'agreed': 0, 'corrections': 0,
+            'ai_calls': 0, 'local': 0, 'other': 0, 'classified': 0
+        })
+    
+    if account_ids:
+        labels = db.session.query(
+            ClassificationLabel.created_at, ClassificationLabel.source,
+            ClassificationLabel.label, ClassificationLabel.local_prediction
+        ).filter(
+            ClassificationLabel.email_account_id.in_(account_ids),
+            ClassificationLabel.created_at >= since
+        ).order_by(ClassificationLabel.created_at)
+        for created_at, source, label, prediction in labels:
+            stats = week(created_at)
+            if source == 'user':
+                stats['corrections'] += 1
+                continue
+            stats['ai_labels'] += 1
+            if prediction is not None:
+                stats['compared'] += 1
+                stats['agreed'] += int(prediction == label)
+        
+        classified = db.session.query(Email.classified_at, Email.classification_model).filter(
+            Email.email_account_id.in_(account_ids),
+            Email.is_classified == True,
+            Email.classified_at >= since
+        )
+        for classified_at, model_name in classified:
+            stats = week(classified_at)
+            stats['classified'] += 1
+            if is_ai_answer(model_name):
+                stats['ai_calls'] += 1
+            elif model_name == 'local':
+                stats['local'] += 1
+            else:
+                stats['other'] += 1
+    
+    weekly = []
+    for week_start in sorted(series):
+        stats = series[week_start]
+        weekly.append(dict(
+            stats,
+            week=week_start,
+            agreement=round(stats['agreed'] / stats['compared'], 3) if stats['compared'] else None,
+            ai_call_share=round(stats['ai_calls'] / stats['classified'], 3) if stats['classified'] else None
+        ))
+    
+    model = _local_model(config)
+    model_info = None
+    if model is not None:
+        model_info = {
+            key: model.metadata.get(key)
+            for key in ('version', 'saved_at', 'trained_at', 'training_rows', 'online_examples',
+                        'online_updated_at', 'last_label_id', 'holdout_coverage', 'holdout_precision')
+        }
+        model_info['pending_labels'] = OnlineLearner(config).pending(model)
+    
+    return {'weekly': weekly, 'model': model_info}
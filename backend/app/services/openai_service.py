@@ -4,16 +4,39 @@ Handles AI-powered email classification using OpenAI GPT models.
 Specialized for academic context - Universidad San Sebastián ICIF.
 """
 
-from openai import OpenAI
+import openai
+from openai import OpenAI, AsyncOpenAI
 from flask import current_app
 import logging
 import json
 import re
+import time
 from datetime import datetime, timedelta
 from typing import List, Dict, Tuple, Optional
+from .prompts import (
+    build_batch_classification_prompt, build_classification_prompt, build_lightweight_classification_prompt,
+    parse_batch_classification_response, parse_classification_response, validate_classification,
+    get_parse_stats, BATCH_CLASSIFICATION_SCHEMA, CLASSIFICATION_SCHEMA, LIGHTWEIGHT_CLASSIFICATION_SCHEMA,
+    LIGHTWEIGHT_MODEL_PREFIX, retry_later_classification
+)
+from .async_classifier import AsyncClassificationEngine
+from .rate_limiter import get_rate_limiter, estimate_tokens, is_rate_limit_error
+from .prompt_usage import record_openai_usage
+from .circuit_breaker import get_circuit_breaker, CircuitOpenError
+from .classification_cache import classify_with_cache
+from .keyword_rules import get_rules_engine
 
 logger = logging.getLogger(__name__)
 
+def is_retryable_error(e: Exception) -> bool:
+    """Whether an OpenAI call failed because the provider is throttled or unavailable, not because of the email."""
+    if isinstance(e, (CircuitOpenError, openai.APITimeoutError, openai.APIConnectionError, TimeoutError)):
+        return True
+    status_code = getattr(e, 'status_code', None)
+    if status_code is not None:
+        return status_code in (408, 429) or status_code >= 500
+    return is_rate_limit_error(e)
+
 class OpenAIService:
     """Service class for OpenAI API operations with academic email classification."""
     
@@ -23,8 +46,17 @@ class OpenAIService:
         self.model = self.config.get('OPENAI_MODEL', 'gpt-4o-mini')
         self.max_tokens = int(self.config.get('OPENAI_MAX_TOKENS', 800))
         self.temperature = float(self.config.get('OPENAI_TEMPERATURE', 0.3))
+        self.output_tokens = min(self.max_tokens, int(self.config.get('AI_OUTPUT_TOKENS_PER_EMAIL', 200)))
+        self.structured_output = self.config.get('AI_STRUCTURED_OUTPUT', True)
+        self.requests_per_minute = float(self.config.get('OPENAI_REQUESTS_PER_MINUTE', 60))
+        self.tokens_per_minute = float(self.config.get('OPENAI_TOKENS_PER_MINUTE', 60000))
+        self.max_concurrency = int(self.config.get('AI_MAX_CONCURRENCY', 4))
+        self.rate_limiter = get_rate_limiter('openai', self.requests_per_minute, self.tokens_per_minute, self.config)
+        self.breaker = get_circuit_breaker('openai', self.config)
+        self.request_timeout = float(self.config.get('AI_REQUEST_TIMEOUT_SECONDS', 30))
         
         self.client = None
+        self._async_client = None
         if self.api_key and self.api_key != 'your-openai-api-key-here':
             try:
                 # Initialize OpenAI client with explicit parameters only
@@ -32,7 +64,7 @@ class OpenAIService:
                 logger.info(f"OpenAI version: {openai.__version__}")
                 
                 # Create client with only essential parameters - no proxies or other problematic params
-                self.client = OpenAI(api_key=self.api_key)
+                self.client = OpenAI(api_key=self.api_key, max_retries=0, timeout=self.request_timeout)  # 429s are retried by the shared limiter
                 logger.info("OpenAI client initialized successfully")
             except TypeError as e:
                 if "proxies" in str(e):
@@ -51,36 +83,6 @@ class OpenAIService:
                 logger.warning(f"Failed to initialize OpenAI client: {e}")
                 logger.warning(f"Error type: {type(e).__name__}")
                 self.client = None
-        
-        # Academic context patterns - REAL urgent situations
-        self.urgent_keywords = [
-            'emergencia', 'accidente', 'hospital', 'ambulancia', 'lesion',
-            'lesionado', 'herido', 'caída', 'golpe', 'sangre', 'desmayo',
-            'crisis', 'problema grave', 'suspensión', 'expulsión', 'ayuda',
-            'socorro', 'grave', 'inmediato', 'hoy mismo', 'crítico'
-        ]
-        
-        # Non-urgent keywords that might be confused with urgent
-        self.non_urgent_indicators = [
-            'qué día', 'que dia', 'cuando', 'cuándo', 'horario', 'hora',
-            'información', 'consulta', 'pregunta', 'duda', 'ayuda con',
-            'necesito saber', 'podrías decirme', 'me puedes ayudar',
-            'solo quería', 'solo queria', 'nada urgente', 'no es urgente',
-            'cuando puedas', 'cuando tengas tiempo', 'no hay prisa'
-        ]
-        
-        self.high_priority_keywords = [
-            'reunión', 'junta', 'consejo', 'deadline', 'plazo', 'entrega',
-            'examen', 'evaluación', 'presentación', 'defensa', 'tesis',
-            'calificación', 'nota', 'reprobado', 'aprobado', 'suspensión',
-            'expulsión', 'disciplinario', 'problema', 'conflicto', 'queja'
-        ]
-        
-        self.academic_roles = {
-            'estudiante': ['estudiante', 'alumno', 'alumna', '@uss.cl'],
-            'profesor': ['profesor', 'profesora', 'docente', 'académico'],
-            'administracion': ['secretaria', 'coordinador', 'director', 'decanato']
-        }
     
     def get_status(self):
         """Get service status."""
@@ -91,116 +93,34 @@ class OpenAIService:
             'message': 'OpenAI service ready for academic email classification' if self.api_key else 'OpenAI API key not configured'
         }
     
-    def _build_classification_prompt(self, email_data: Dict) -> str:
-        """Build specialized prompt for academic email classification."""
-        
-        current_date = datetime.now().strftime('%Y-%m-%d')
-        
-        # Smart content truncation - keep important parts
-        content = email_data.get('body_preview', '')
-        if len(content) > 400:
-            # Keep first 200 chars and last 200 chars for context
-            content = content[:200] + "..." + content[-200:]
-        
-        base_prompt = f"""Eres un asistente especializado en clasificar correos para Maritza Silva, Directora de ICIF en Universidad San Sebastián, Chile.
-
-CONTEXTO: Directora universitaria que gestiona estudiantes, profesores y personal. Debe responder emergencias rápidamente.
-
-NIVELES DE URGENCIA:
-1. URGENTE (1 hora): Emergencias médicas, accidentes, crisis de seguridad, acción INMEDIATA
-2. ALTA (3 horas): Problemas académicos graves, reuniones urgentes hoy, deadlines críticos
-3. MEDIA (hoy/próximos días): Solicitudes académicas con plazo, cambios de horario, coordinación
-4. BAJA (mañana+): Información general, invitaciones futuras, documentación no urgente
-
-PALABRAS CLAVE CRÍTICAS para URGENTE:
-- Emergencias: accidente, lesión, hospital, ambulancia, herido, sangre, desmayo, caída
-- Crisis: ayuda, socorro, crítico, grave, urgente, emergencia
-- Seguridad: peligro, amenaza, violencia, drogas, alcohol
-
-EJEMPLOS:
-- URGENTE: "Estudiante herido en laboratorio, necesita ambulancia"
-- ALTA: "Reunión urgente hoy a las 3pm para resolver problema académico"
-- MEDIA: "Solicitud cambio de horario con plazo viernes 20 septiembre"
-- BAJA: "Consulta general sobre horarios del próximo semestre"
-
-CORREO A CLASIFICAR:
-Remitente: {email_data.get('sender_name', '')} <{email_data.get('sender_email', '')}>
-Asunto: {email_data.get('subject', '')}
-Fecha recibido: {email_data.get('received_at', '')}
-Contenido: {email_data.get('body_preview', '')[:500]}
-
-INSTRUCCIONES:
-1. Analiza el contexto académico del remitente (estudiante/profesor/administración)
-2. Identifica palabras clave de urgencia y deadlines
-3. Considera la proximidad temporal de eventos
-4. Evalúa el impacto en las responsabilidades de la directora
-
-Responde SOLO en formato JSON válido:
-{{
-    "urgency_category": "urgent|high|medium|low",
-    "confidence_score": 0.85,
-    "reasoning": "Explicación breve de la clasificación",
-    "sender_type": "estudiante|profesor|administracion|externo",
-    "email_type": "academico|administrativo|personal|emergencia",
-    "requires_immediate_action": true/false,
-    "suggested_deadline": "2024-01-15T14:00:00" // o null
-}}"""
-        
-        return base_prompt.strip()
-    
     def _lightweight_classification(self, email_data: Dict) -> Dict:
-        """Lightweight classification using minimal tokens."""
-        
-        # Ultra-minimal prompt for basic classification
-        subject = email_data.get('subject', '')
-        content = email_data.get('body_preview', '')[:100]  # Only first 100 chars
+        """
+        Lightweight classification using minimal tokens.
         
-        lightweight_prompt = f"""Clasifica urgencia para directora universitaria:
-
-Asunto: {subject}
-Contenido: {content}
-
-URGENTE: emergencias médicas, accidentes, crisis
-ALTA: reuniones urgentes hoy, deadlines críticos
-MEDIA: consultas académicas, coordinación
-BAJA: información general
-
-JSON:
-{{
-    "urgency_category": "urgent|high|medium|low",
-    "confidence_score": 0.8,
-    "reasoning": "Breve explicación",
-    "sender_type": "estudiante|profesor|administracion|externo",
-    "email_type": "academico|administrativo|personal|emergencia",
-    "requires_immediate_action": true/false
-}}"""
+        Raises instead of falling back to rules, so the cascade can escalate
+        to the full prompt.
+        """
+        system_prompt, prompt = build_lightweight_classification_prompt(email_data)
+        content = self._create_completion(system_prompt, prompt, self.output_tokens, LIGHTWEIGHT_CLASSIFICATION_SCHEMA)
+        logger.info(f"Lightweight classification result: {content[:100]}...")
         
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": lightweight_prompt}],
-                max_tokens=200,  # Reduced tokens
-                temperature=0.3
-            )
-            
-            result = response.choices[0].message.content.strip()
-            logger.info(f"Lightweight classification result: {result[:100]}...")
-            
-            # Parse JSON response
-            import json
-            classification = json.loads(result)
-            
-            # Add missing fields with defaults
-            classification.setdefault('suggested_deadline', None)
-            classification.setdefault('rate_limit_retry', False)
-            
-            return classification
-            
-        except Exception as e:
-            logger.error(f"Lightweight classification error: {str(e)}")
-            raise e
+            classification = validate_classification(parse_classification_response(content))
+        except (ValueError, TypeError):
+            get_parse_stats().record('openai', 1, 0)
+            raise
+        get_parse_stats().record('openai', 1, 1)
+        classification.setdefault('suggested_deadline', None)
+        classification['classification_model'] = f"{LIGHTWEIGHT_MODEL_PREFIX}{self.model}"
+        return classification
     
     def classify_email(self, email_data: Dict) -> Dict:
+        """Classify a single email using OpenAI GPT-4, answering repeated content from the classification cache."""
+        return classify_with_cache(
+            [email_data], self.model, lambda misses: [self._classify_email_uncached(misses[0])], self.config
+        )[0]
+    
+    def _classify_email_uncached(self, email_data: Dict) -> Dict:
         """Classify a single email using OpenAI GPT-4."""
         
         logger.info(f"Starting email classification for: {email_data.get('subject', 'No subject')[:50]}...")
@@ -213,209 +133,224 @@ JSON:
             return self._fallback_classification(email_data)
         
         try:
-            prompt = self._build_classification_prompt(email_data)
-            logger.info(f"Prompt length: {len(prompt)} characters")
+            system_prompt, prompt = build_classification_prompt(email_data)
+            logger.info(f"Prompt length: {len(system_prompt)} + {len(prompt)} characters")
             
             logger.info("Making OpenAI API call...")
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "Eres un experto en clasificación de correos académicos. Responde siempre en JSON válido."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=self.max_tokens,
-                temperature=self.temperature
-            )
+            content = self._create_completion(system_prompt, prompt, self.output_tokens, CLASSIFICATION_SCHEMA)
             logger.info("OpenAI API call successful")
-            
-            content = response.choices[0].message.content.strip()
-            logger.info(f"OpenAI response received: {content[:200]}...")
-            
-            # Clean response - remove markdown formatting if present
-            if content.startswith('```json'):
-                content = content[7:]  # Remove ```json
-            if content.endswith('```'):
-                content = content[:-3]  # Remove ```
-            content = content.strip()
-            
-            # Parse JSON response
-            try:
-                classification = json.loads(content)
-                logger.info(f"JSON parsed successfully: {classification}")
-                
-                # Validate required fields
-                required_fields = ['urgency_category', 'confidence_score', 'reasoning']
-                for field in required_fields:
-                    if field not in classification:
-                        raise ValueError(f"Missing required field: {field}")
-                
-                # Normalize urgency category
-                urgency = classification['urgency_category'].lower()
-                if urgency not in ['urgent', 'high', 'medium', 'low']:
-                    urgency = 'medium'
-                classification['urgency_category'] = urgency
-                
-                # Ensure confidence score is float between 0-1
-                confidence = float(classification['confidence_score'])
-                classification['confidence_score'] = max(0.0, min(1.0, confidence))
-                
-                logger.info(f"✅ Email classified as {urgency} with confidence {confidence}")
-                return classification
-                
-            except (json.JSONDecodeError, ValueError, KeyError) as e:
-                logger.error(f"❌ Error parsing OpenAI response: {e}")
-                logger.error(f"Raw response: {content}")
-                logger.warning("Falling back to rule-based classification")
-                return self._fallback_classification(email_data)
-        
         except Exception as e:
-            error_str = str(e)
-            if "rate_limit" in error_str.lower() or "429" in error_str:
-                logger.warning(f"⚠️  OpenAI Rate limit reached: {error_str}")
-                # In production, we should retry after delay, not fallback
-                from flask import current_app
-                is_production = current_app.config.get('FLASK_ENV') == 'production'
-                
-                if is_production:
-                    logger.info("Production mode: Will retry classification later")
-                    # Set rate limit timestamp
-                    self._last_rate_limit = time.time()
-                    # Return a special status to indicate rate limit
-                    return {
-                        'urgency_category': 'medium',
-                        'confidence_score': 0.0,
-                        'reasoning': 'Rate limit reached - will retry later',
-                        'sender_type': 'externo',
-                        'email_type': 'academico',
-                        'requires_immediate_action': False,
-                        'suggested_deadline': None,
-                        'rate_limit_retry': True
-                    }
-                else:
-                    logger.info("Development mode: Falling back to rule-based classification")
-                    return self._fallback_classification(email_data)
-            else:
-                logger.error(f"❌ OpenAI API error: {error_str}")
-                logger.warning("Falling back to rule-based classification")
-                return self._fallback_classification(email_data)
+            return self._handle_api_error(e, email_data)
+        
+        return self._parse_single_response(content, email_data)
     
-    def _fallback_classification(self, email_data: Dict) -> Dict:
-        """Fallback classification when OpenAI is unavailable."""
+    async def _classify_email_async(self, email_data: Dict) -> Dict:
+        """Async version of classify_email, used by the concurrent batch engine."""
         
-        subject = email_data.get('subject', '').lower()
-        body = email_data.get('body_preview', '').lower()
-        sender_email = email_data.get('sender_email', '').lower()
-        text_content = f"{subject} {body}"
-        
-        # Rule-based classification - start with different defaults to avoid medium bias
-        urgency = 'low'  # Start with low as default
-        confidence = 0.6
-        reasoning = "Clasificación basada en reglas (OpenAI no disponible)"
-        
-        # Check for non-urgent indicators first (to avoid false positives)
-        has_non_urgent_indicators = any(keyword in text_content for keyword in self.non_urgent_indicators)
-        has_urgent_keywords = any(keyword in text_content for keyword in self.urgent_keywords)
-        
-        # If it has non-urgent indicators, it's likely not urgent even if it says "urgente"
-        if has_non_urgent_indicators and not has_urgent_keywords:
-            urgency = 'low'
-            confidence = 0.8
-            reasoning = "Contenido indica consulta no urgente (a pesar de palabras como 'urgente')"
-        
-        # Check for REAL urgent keywords (only if no non-urgent indicators)
-        elif has_urgent_keywords and not has_non_urgent_indicators:
-            urgency = 'urgent'
-            confidence = 0.9
-            reasoning = "Detectadas palabras clave de urgencia crítica real"
-        
-        # Check for high priority keywords
-        elif any(keyword in text_content for keyword in self.high_priority_keywords):
-            urgency = 'high'
-            confidence = 0.8
-            reasoning = "Detectadas palabras clave de alta prioridad académica"
-        
-        # Check for medium priority indicators
-        elif any(keyword in text_content for keyword in ['consulta', 'pregunta', 'ayuda', 'información', 'horario', 'clase', 'materia', 'asignatura']):
-            urgency = 'medium'
-            confidence = 0.7
-            reasoning = "Consulta académica que requiere respuesta"
-        
-        # Student emails from USS get medium priority only if they contain academic content
-        elif '@uss.cl' in sender_email:
-            if any(keyword in text_content for keyword in ['consulta', 'pregunta', 'ayuda', 'información', 'horario', 'clase', 'materia', 'asignatura', 'profesor', 'docente']):
-                urgency = 'medium'
-                confidence = 0.7
-                reasoning = "Correo de estudiante USS con contenido académico"
-            else:
-                urgency = 'low'
-                confidence = 0.6
-                reasoning = "Correo de estudiante USS - contenido general"
-        
-        # External emails are generally low priority unless urgent keywords
-        else:
-            urgency = 'low'
-            confidence = 0.5
-            reasoning = "Correo externo - prioridad baja"
-        
-        # Determine sender type
-        sender_type = 'externo'
-        if '@uss.cl' in sender_email:
-            sender_type = 'estudiante'
-        elif any(keyword in text_content for keyword in self.academic_roles['profesor']):
-            sender_type = 'profesor'
-        elif any(keyword in text_content for keyword in self.academic_roles['administracion']):
-            sender_type = 'administracion'
+        try:
+            system_prompt, prompt = build_classification_prompt(email_data)
+            content = await self._create_completion_async(system_prompt, prompt, self.output_tokens, CLASSIFICATION_SCHEMA)
+        except Exception as e:
+            return self._handle_api_error(e, email_data)
         
-        return {
-            'urgency_category': urgency,
-            'confidence_score': confidence,
-            'reasoning': reasoning,
-            'sender_type': sender_type,
-            'email_type': 'academico',
-            'requires_immediate_action': urgency in ['urgent', 'high'],
-            'suggested_deadline': None
+        return self._parse_single_response(content, email_data)
+    
+    def _completion_request(self, system_prompt: str, prompt: str, max_tokens: int, schema: Dict = None) -> Dict:
+        """
+        Chat completion arguments shared by the sync and async clients.
+        
+        The static instructions go first, as the system message, so consecutive
+        requests share a prefix that OpenAI can serve from its prompt cache.
+        With structured output on, the answer is constrained to `schema`.
+        """
+        request = {
+            'model': self.model,
+            'messages': [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt}
+            ],
+            'max_tokens': max_tokens,
+            'temperature': self.temperature
         }
+        if schema is not None and self.structured_output:
+            request['response_format'] = {
+                'type': 'json_schema',
+                'json_schema': {'name': 'email_classification', 'schema': schema, 'strict': True}
+            }
+        return request
     
-    def classify_batch(self, emails_data: List[Dict], batch_size: int = 5) -> List[Dict]:
-        """Classify multiple emails in batches to avoid rate limits."""
+    def _create_completion(self, system_prompt: str, prompt: str, max_tokens: int, schema: Dict = None) -> str:
+        """
+        Run one chat completion within the shared rate limit and return its text.
+        
+        Fails fast with CircuitOpenError while the OpenAI breaker is open.
+        """
+        request = self._completion_request(system_prompt, prompt, max_tokens, schema)
+        self.breaker.guard()
+        
+        def create():
+            started = time.perf_counter()
+            response = self.breaker.call(lambda: self.client.chat.completions.create(**request))
+            record_openai_usage(response, time.perf_counter() - started)
+            return response
+        
+        response = self.rate_limiter.call(create, tokens=estimate_tokens(system_prompt + prompt) + max_tokens)
+        return self._response_text(response)
+    
+    async def _create_completion_async(self, system_prompt: str, prompt: str, max_tokens: int, schema: Dict = None) -> str:
+        """Async version of _create_completion."""
+        request = self._completion_request(system_prompt, prompt, max_tokens, schema)
+        self.breaker.guard()
+        
+        async def create():
+            started = time.perf_counter()
+            response = await self.breaker.call_async(lambda: self._get_async_client().chat.completions.create(**request))
+            record_openai_usage(response, time.perf_counter() - started)
+            return response
+        
+        response = await self.rate_limiter.call_async(create, tokens=estimate_tokens(system_prompt + prompt) + max_tokens)
+        return self._response_text(response)
+    
+    def _response_text(self, response) -> str:
+        """Text of a completion; a refusal or an answer cut off by the token cap is logged."""
+        choice = response.choices[0]
+        if choice.finish_reason == 'length':
+            logger.warning("OpenAI answer hit the output-token cap - keeping its complete items")
+        refusal = getattr(choice.message, 'refusal', None)
+        if refusal:
+            raise Exception(f"OpenAI refused to classify: {refusal}")
+        return (choice.message.content or '').strip()
+    
+    def _get_async_client(self):
+        """Create the async OpenAI client on first use (it binds to the engine's event loop)."""
+        if self._async_client is None:
+            self._async_client = AsyncOpenAI(api_key=self.api_key, max_retries=0, timeout=self.request_timeout)  # 429s are retried by the shared limiter
+        return self._async_client
+    
+    def _parse_single_response(self, content: str, email_data: Dict) -> Dict:
+        """Parse a single-email response, falling back to rules when it is unusable."""
+        logger.info(f"OpenAI response received: {content[:200]}...")
+        
+        try:
+            classification = validate_classification(parse_classification_response(content))
+            get_parse_stats().record('openai', 1, 1)
+            logger.info(f"✅ Email classified as {classification['urgency_category']} with confidence {classification['confidence_score']}")
+            return classification
+            
+        except (ValueError, KeyError, TypeError) as e:
+            get_parse_stats().record('openai', 1, 0)
+            logger.error(f"❌ Error parsing OpenAI response: {e}")
+            logger.error(f"Raw response: {content}")
+            logger.warning("Falling back to rule-based classification")
+            return self._fallback_classification(email_data)
+    
+    def _handle_api_error(self, e: Exception, email_data: Dict) -> Dict:
+        """
+        Turn an OpenAI API error into a retry-later marker (throttled or unavailable) or a rule-based result.
+        
+        The marker lets AIService fail over to another provider and the worker
+        requeue the job; rules only answer for errors that retrying cannot fix.
+        """
+        if is_retryable_error(e):
+            logger.warning(f"⚠️  OpenAI rate limited or unavailable, will retry later: {type(e).__name__} {str(e)}")
+            return retry_later_classification()
+        
+        logger.error(f"❌ OpenAI API error: {str(e)}")
+        logger.warning("Falling back to rule-based classification")
+        return self._fallback_classification(email_data)
+    
+    def _key_emails(self, emails_data: List[Dict]) -> List[Dict]:
+        """Key every email in the prompt, even if the caller did not give ids."""
+        return [dict(email_data, email_id=str(email_data.get('email_id') or f'email-{i}'))
+                for i, email_data in enumerate(emails_data)]
+    
+    def _parse_chunk_response(self, content: str, keyed: List[Dict]) -> List[Optional[Dict]]:
+        """Parse a multi-email response; None marks emails that must be classified individually."""
+        try:
+            items = parse_batch_classification_response(content)
+        except (ValueError, TypeError) as e:
+            logger.error(f"❌ Error parsing OpenAI batch response: {e}")
+            items = {}
         
         results = []
+        for keyed_data in keyed:
+            try:
+                results.append(validate_classification(items[keyed_data['email_id']]))
+            except (KeyError, ValueError, TypeError) as e:
+                # Missing or malformed item - classify this email on its own
+                logger.warning(f"Batch item {keyed_data['email_id']} unusable ({e}), classifying individually")
+                results.append(None)
         
-        for i in range(0, len(emails_data), batch_size):
-            batch = emails_data[i:i + batch_size]
-            
-            logger.info(f"Processing batch {i//batch_size + 1}, emails {i+1}-{min(i+batch_size, len(emails_data))}")
-            
-            batch_results = []
-            for email_data in batch:
-                try:
-                    classification = self.classify_email(email_data)
-                    batch_results.append(classification)
-                    
-                    # Adaptive delay based on environment
-                    import time
-                    from flask import current_app
-                    is_production = current_app.config.get('FLASK_ENV') == 'production'
-                    delay = 10.0 if is_production else 5.0  # Ultra long delay to avoid rate limits
-                    time.sleep(delay)
-                    
-                except Exception as e:
-                    logger.error(f"Error classifying email: {str(e)}")
-                    batch_results.append(self._fallback_classification(email_data))
-            
-            results.extend(batch_results)
+        get_parse_stats().record('openai', len(keyed), sum(result is not None for result in results))
+        return results
+    
+    def _classify_chunk(self, emails_data: List[Dict]) -> List[Dict]:
+        """Classify several emails with one multi-email prompt."""
+        
+        if len(emails_data) == 1:
+            return [self._classify_email_uncached(emails_data[0])]
+        
+        keyed = self._key_emails(emails_data)
+        
+        try:
+            system_prompt, prompt = build_batch_classification_prompt(keyed)
+            logger.info(f"Batch prompt for {len(keyed)} emails: {len(system_prompt)} + {len(prompt)} characters")
             
-            # Adaptive delay between batches
-            if i + batch_size < len(emails_data):
-                import time
-                from flask import current_app
-                is_production = current_app.config.get('FLASK_ENV') == 'production'
-                delay = 30.0 if is_production else 15.0  # Ultra long delay to avoid rate limits
-                time.sleep(delay)
-        
-        logger.info(f"Completed batch classification of {len(emails_data)} emails")
+            content = self._create_completion(
+                system_prompt, prompt, self.output_tokens * len(keyed), BATCH_CLASSIFICATION_SCHEMA
+            )
+        except Exception as e:
+            return [self._handle_api_error(e, email_data) for email_data in emails_data]
+        
+        results = self._parse_chunk_response(content, keyed)
+        return [result or self._classify_email_uncached(email_data) for email_data, result in zip(emails_data, results)]
+    
+    async def _classify_chunk_async(self, emails_data: List[Dict]) -> List[Dict]:
+        """Async version of _classify_chunk, used by the concurrent batch engine."""
+        
+        if len(emails_data) == 1:
+            return [await self._classify_email_async(emails_data[0])]
+        
+        keyed = self._key_emails(emails_data)
+        
+        try:
+            system_prompt, prompt = build_batch_classification_prompt(keyed)
+            content = await self._create_completion_async(
+                system_prompt, prompt, self.output_tokens * len(keyed), BATCH_CLASSIFICATION_SCHEMA
+            )
+        except Exception as e:
+            return [self._handle_api_error(e, email_data) for email_data in emails_data]
+        
+        results = self._parse_chunk_response(content, keyed)
+        for i, email_data in enumerate(emails_data):
+            if results[i] is None:
+                results[i] = await self._classify_email_async(email_data)
         return results
     
+    def _fallback_classification(self, email_data: Dict) -> Dict:
+        """Fallback classification when OpenAI is unavailable."""
+        return get_rules_engine().classify(email_data)
+    
+    def classify_batch(self, emails_data: List[Dict], batch_size: int = 5) -> List[Dict]:
+        """Classify multiple emails, answering repeated content from the classification cache."""
+        return classify_with_cache(
+            emails_data, self.model, lambda misses: self._classify_batch_uncached(misses, batch_size), self.config
+        )
+    
+    def _classify_batch_uncached(self, emails_data: List[Dict], batch_size: int = 5) -> List[Dict]:
+        """
+        Classify multiple emails, `batch_size` emails per prompt.
+        
+        Prompts run concurrently, paced by the OpenAI requests/tokens-per-minute
+        budget (shared by all workers) instead of fixed sleeps between batches.
+        """
+        
+        if not self.client:
+            return get_rules_engine().classify_many(emails_data)
+        
+        engine = AsyncClassificationEngine(self, max_concurrency=self.max_concurrency)
+        return engine.classify_batch(emails_data, batch_size=batch_size)
+    
     def get_classification_stats(self, classifications: List[Dict]) -> Dict:
         """Generate statistics from classification results."""
         
@@ -0,0 +1,85 @@
+"""
+Prompt Usage
+Input, cached and output token counts reported by the AI providers, per process.
+
+Used to check that the static prompt prefix is actually served from the
+providers' prompt caches (cached_tokens > 0) and what that does to latency.
+"""
+
+import threading
+import logging
+from collections import deque
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+class PromptUsageStats:
+    """Token usage and call latency per provider."""
+    
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self._window = window
+        self._providers: Dict[str, Dict] = {}
+    
+    def record(self, provider: str, prompt_tokens: int, cached_tokens: int, output_tokens: int, seconds: float):
+        with self._lock:
+            stats = self._providers.setdefault(provider, {
+                'calls': 0, 'prompt_tokens': 0, 'cached_tokens': 0, 'output_tokens': 0,
+                'cached_calls': 0, 'latencies': deque(maxlen=self._window),
+                'cached_latencies': deque(maxlen=self._window)
+            })
+            stats['calls'] += 1
+            stats['prompt_tokens'] += prompt_tokens
+            stats['cached_tokens'] += cached_tokens
+            stats['output_tokens'] += output_tokens
+            stats['latencies'].append(seconds)
+            if cached_tokens:
+                stats['cached_calls'] += 1
+                stats['cached_latencies'].append(seconds)
+    
+    def snapshot(self) -> Dict:
+        """Totals, cached share of input tokens and average latency, overall and on cache hits."""
+        def average_ms(latencies):
+            return round(1000 * sum(latencies) / len(latencies), 1) if latencies else 0.0
+        
+        with self._lock:
+            return {
+                provider: {
+                    'calls': stats['calls'],
+                    'prompt_tokens': stats['prompt_tokens'],
+                    'cached_tokens': stats['cached_tokens'],
+                    'output_tokens': stats['output_tokens'],
+                    'cached_token_ratio': round(stats['cached_tokens'] / stats['prompt_tokens'], 3) if stats['prompt_tokens'] else 0.0,
+                    'cached_calls': stats['cached_calls'],
+                    'avg_latency_ms': average_ms(stats['latencies']),
+                    'avg_cached_latency_ms': average_ms(stats['cached_latencies'])
+                }
+                for provider, stats in self._providers.items()
+            }
+
+_stats = PromptUsageStats()
+
+def get_prompt_usage_stats() -> PromptUsageStats:
+    return _stats
+
+def record_openai_usage(response, seconds: float):
+    """Record usage of an OpenAI chat completion (cached_tokens is in prompt_tokens_details)."""
+    usage = getattr(response, 'usage', None)
+    if usage is None:
+        return
+    details = getattr(usage, 'prompt_tokens_details', None)
+    cached_tokens = (getattr(details, 'cached_tokens', 0) or 0) if details is not None else 0
+    _stats.record('openai', usage.prompt_tokens or 0, cached_tokens, usage.completion_tokens or 0, seconds)
+
+def record_gemini_usage(response, seconds: float):
+    """Record usage of a Gemini response, if this SDK version reports usage_metadata."""
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None:
+        return
+    _stats.record(
+        'gemini',
+        getattr(usage, 'prompt_token_count', 0) or 0,
+        getattr(usage, 'cached_content_token_count', 0) or 0,
+        getattr(usage, 'candidates_token_count', 0) or 0,
+        seconds
+    )
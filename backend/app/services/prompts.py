@@ -0,0 +1,299 @@
+"""
+Classification Prompts
+Prompt texts and response parsing shared by the OpenAI and Gemini services.
+"""
+
+import threading
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from app.utils.email_text import compact_email_text
+from app.utils.json_stream import iter_json_objects
+
+VALID_URGENCIES = ['urgent', 'high', 'medium', 'low']
+REQUIRED_FIELDS = ['urgency_category', 'confidence_score', 'reasoning']
+SENDER_TYPES = ['estudiante', 'profesor', 'administracion', 'externo']
+EMAIL_TYPES = ['academico', 'administrativo', 'personal', 'emergencia']
+
+# Bump whenever the prompt texts change, so cached classifications are not reused
+PROMPT_VERSION = '3'
+
+# classification_model prefix of answers to the lightweight prompt
+LIGHTWEIGHT_MODEL_PREFIX = 'lite:'
+
+CLASSIFICATION_CONTEXT = """Eres un asistente especializado en clasificar correos para Maritza Silva, Directora de ICIF en Universidad San Sebastián, Chile.
+
+CONTEXTO: Directora universitaria que gestiona estudiantes, profesores y personal. Debe responder emergencias rápidamente.
+
+NIVELES DE URGENCIA:
+1. URGENTE (1 hora): Emergencias médicas, accidentes, crisis de seguridad, acción INMEDIATA
+2. ALTA (3 horas): Problemas académicos graves, reuniones urgentes hoy, deadlines críticos
+3. MEDIA (hoy/próximos días): Solicitudes académicas con plazo, cambios de horario, coordinación
+4. BAJA (mañana+): Información general, invitaciones futuras, documentación no urgente
+
+PALABRAS CLAVE CRÍTICAS para URGENTE:
+- Emergencias: accidente, lesión, hospital, ambulancia, herido, sangre, desmayo, caída
+- Crisis: ayuda, socorro, crítico, grave, urgente, emergencia
+- Seguridad: peligro, amenaza, violencia, drogas, alcohol
+
+EJEMPLOS:
+- URGENTE: "Estudiante herido en laboratorio, necesita ambulancia"
+- ALTA: "Reunión urgente hoy a las 3pm para resolver problema académico"
+- MEDIA: "Solicitud cambio de horario con plazo viernes 20 septiembre"
+- BAJA: "Consulta general sobre horarios del próximo semestre\""""
+
+CLASSIFICATION_INSTRUCTIONS = """INSTRUCCIONES:
+1. Analiza el contexto académico del remitente (estudiante/profesor/administración)
+2. Identifica palabras clave de urgencia y deadlines
+3. Considera la proximidad temporal de eventos
+4. Evalúa el impacto en las responsabilidades de la directora"""
+
+SINGLE_RESPONSE_FORMAT = """Responde SOLO en formato JSON válido:
+{
+    "urgency_category": "urgent|high|medium|low",
+    "confidence_score": 0.85,
+    "reasoning": "Explicación breve de la clasificación",
+    "sender_type": "estudiante|profesor|administracion|externo",
+    "email_type": "academico|administrativo|personal|emergencia",
+    "requires_immediate_action": true/false,
+    "suggested_deadline": "2024-01-15T14:00:00" // o null
+}"""
+
+BATCH_RESPONSE_FORMAT = """5. Clasifica cada correo de forma independiente
+
+Responde SOLO con un arreglo JSON válido, un objeto por correo, usando el mismo email_id:
+[
+    {
+        "email_id": "email_id del correo",
+        "urgency_category": "urgent|high|medium|low",
+        "confidence_score": 0.85,
+        "reasoning": "Explicación breve de la clasificación",
+        "sender_type": "estudiante|profesor|administracion|externo",
+        "email_type": "academico|administrativo|personal|emergencia",
+        "requires_immediate_action": true/false,
+        "suggested_deadline": "2024-01-15T14:00:00" // o null
+    }
+]"""
+
+LIGHTWEIGHT_SYSTEM_PROMPT = """Clasifica urgencia para directora universitaria:
+
+URGENTE: emergencias médicas, accidentes, crisis
+ALTA: reuniones urgentes hoy, deadlines críticos
+MEDIA: consultas académicas, coordinación
+BAJA: información general
+
+JSON:
+{
+    "urgency_category": "urgent|high|medium|low",
+    "confidence_score": 0.8,
+    "reasoning": "Breve explicación",
+    "sender_type": "estudiante|profesor|administracion|externo",
+    "email_type": "academico|administrativo|personal|emergencia",
+    "requires_immediate_action": true/false
+}"""
+
+# JSON schemas for structured output (OpenAI strict json_schema: every field required, no extras)
+CLASSIFICATION_PROPERTIES = {
+    'urgency_category': {'type': 'string', 'enum': VALID_URGENCIES},
+    'confidence_score': {'type': 'number'},
+    'reasoning': {'type': 'string'},
+    'sender_type': {'type': 'string', 'enum': SENDER_TYPES},
+    'email_type': {'type': 'string', 'enum': EMAIL_TYPES},
+    'requires_immediate_action': {'type': 'boolean'},
+    'suggested_deadline': {'type': ['string', 'null']}
+}
+
+def _object_schema(properties: Dict) -> Dict:
+    return {'type': 'object', 'properties': properties, 'required': list(properties), 'additionalProperties': False}
+
+CLASSIFICATION_SCHEMA = _object_schema(CLASSIFICATION_PROPERTIES)
+
+LIGHTWEIGHT_CLASSIFICATION_SCHEMA = _object_schema(
+    {key: value for key, value in CLASSIFICATION_PROPERTIES.items() if key != 'suggested_deadline'}
+)
+
+# Strict mode needs an object at the root, so batch answers are wrapped
+BATCH_CLASSIFICATION_SCHEMA = _object_schema({
+    'classifications': {
+        'type': 'array',
+        'items': _object_schema({'email_id': {'type': 'string'}, **CLASSIFICATION_PROPERTIES})
+    }
+})
+
+def to_gemini_schema(schema: Dict) -> Dict:
+    """Gemini's OpenAPI-style subset: no additionalProperties, `nullable` instead of type unions."""
+    converted = {}
+    for key, value in schema.items():
+        if key == 'additionalProperties':
+            continue
+        if key == 'type' and isinstance(value, list):
+            converted['type'] = next(t for t in value if t != 'null')
+            converted['nullable'] = 'null' in value
+        elif key == 'properties':
+            converted[key] = {name: to_gemini_schema(prop) for name, prop in value.items()}
+        elif key == 'items':
+            converted[key] = to_gemini_schema(value)
+        else:
+            converted[key] = value
+    return converted
+
+def compact_content(content: str) -> str:
+    """Drop quoted replies, signatures and disclaimers, then keep first and last 200 chars for context."""
+    content = compact_email_text(content, source='prompt')
+    if len(content) > 400:
+        content = content[:200] + "..." + content[-200:]
+    return content
+
+@lru_cache(maxsize=64)
+def build_system_prompt(batch: bool = False, account_prompt: Optional[str] = None) -> str:
+    """
+    Static instruction prefix of a classification prompt.
+    
+    Identical for every email (per account, when the account has its own
+    classification_prompt), so providers can cache it; compiled once per process.
+    """
+    sections = [CLASSIFICATION_CONTEXT]
+    if account_prompt and account_prompt.strip():
+        sections.append(f"INDICACIONES ADICIONALES DE LA CUENTA:\n{account_prompt.strip()}")
+    sections.append(CLASSIFICATION_INSTRUCTIONS)
+    sections.append(BATCH_RESPONSE_FORMAT if batch else SINGLE_RESPONSE_FORMAT)
+    return '\n\n'.join(sections)
+
+def _email_block(email_data: Dict) -> str:
+    return f"""Remitente: {email_data.get('sender_name', '')} <{email_data.get('sender_email', '')}>
+Asunto: {email_data.get('subject', '')}
+Fecha recibido: {email_data.get('received_at', '')}
+Contenido: {compact_content(email_data.get('body_preview', ''))}"""
+
+def build_classification_prompt(email_data: Dict) -> Tuple[str, str]:
+    """(system prefix, per-email suffix) for classifying one email."""
+    prompt = f"""Fecha actual: {datetime.now().strftime('%Y-%m-%d')}
+
+CORREO A CLASIFICAR:
+{_email_block(email_data)}"""
+    
+    return build_system_prompt(False, email_data.get('account_prompt')), prompt
+
+def build_batch_classification_prompt(emails_data: List[Dict]) -> Tuple[str, str]:
+    """
+    (system prefix, per-batch suffix) for classifying several emails, keyed by email_id.
+    
+    All emails must share the same account_prompt (see group_by_account_prompt).
+    """
+    emails_section = '\n\n'.join(
+        f"[email_id: {email_data['email_id']}]\n{_email_block(email_data)}" for email_data in emails_data
+    )
+    prompt = f"""Fecha actual: {datetime.now().strftime('%Y-%m-%d')}
+
+CORREOS A CLASIFICAR ({len(emails_data)}):
+
+{emails_section}"""
+    
+    return build_system_prompt(True, emails_data[0].get('account_prompt') if emails_data else None), prompt
+
+def build_lightweight_classification_prompt(email_data: Dict) -> Tuple[str, str]:
+    """Ultra-minimal prompt (subject and first 100 chars) for the cheap cascade stage."""
+    content = compact_email_text(email_data.get('body_preview'), source='prompt')[:100]  # Only first 100 chars
+    return LIGHTWEIGHT_SYSTEM_PROMPT, f"""Asunto: {email_data.get('subject') or ''}
+Contenido: {content}"""
+
+def group_by_account_prompt(emails_data: List[Dict]) -> List[List[int]]:
+    """Indices of emails grouped by account_prompt, in first-seen order, for batched prompts."""
+    groups: Dict[Optional[str], List[int]] = {}
+    for i, email_data in enumerate(emails_data):
+        groups.setdefault(email_data.get('account_prompt') or None, []).append(i)
+    return list(groups.values())
+
+def retry_later_classification(reasoning: str = 'Rate limit reached - will retry later') -> Dict:
+    """Placeholder result telling the caller to classify again later (the worker requeues the job)."""
+    return {
+        'urgency_category': 'medium',
+        'confidence_score': 0.0,
+        'reasoning': reasoning,
+        'sender_type': 'externo',
+        'email_type': 'academico',
+        'requires_immediate_action': False,
+        'suggested_deadline': None,
+        'rate_limit_retry': True
+    }
+
+def validate_classification(classification: Dict) -> Dict:
+    """Validate and normalize one classification object, raising ValueError if unusable."""
+    if not isinstance(classification, dict):
+        raise ValueError(f"Classification is not an object: {classification!r}")
+    
+    # Validate required fields
+    for field in REQUIRED_FIELDS:
+        if field not in classification:
+            raise ValueError(f"Missing required field: {field}")
+    
+    # Normalize urgency category
+    urgency = str(classification['urgency_category']).lower()
+    if urgency not in VALID_URGENCIES:
+        urgency = 'medium'
+    classification['urgency_category'] = urgency
+    
+    # Ensure confidence score is float between 0-1
+    confidence = float(classification['confidence_score'])
+    classification['confidence_score'] = max(0.0, min(1.0, confidence))
+    
+    return classification
+
+def parse_classification_response(content: str) -> Dict:
+    """
+    The classification object of a single-email answer, raising ValueError if there is none.
+    
+    Tolerates fences, surrounding prose, template comments and trailing commas.
+    """
+    objects = [obj for _, obj in iter_json_objects(content) if isinstance(obj, dict) and 'urgency_category' in obj]
+    if not objects:
+        raise ValueError(f"No classification object in response: {content[:200]!r}")
+    return objects[-1]  # innermost-first order: the last one is the outermost
+
+def parse_batch_classification_response(content: str) -> Dict[str, Dict]:
+    """
+    Parse a batched classification response into {email_id: raw classification}.
+    
+    Accepts a bare array or one wrapped in an object, and keeps every complete
+    item of an answer that was cut off. Items without an email_id are dropped;
+    callers validate each item and fall back to a single-email call for ids
+    that are missing or malformed.
+    """
+    items = {}
+    for _, item in iter_json_objects(content):
+        if isinstance(item, dict) and item.get('email_id') is not None:
+            items[str(item['email_id'])] = {key: value for key, value in item.items() if key != 'email_id'}
+    return items
+
+class ParseStats:
+    """Answers that could not be fully parsed, per provider, for this process."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._providers: Dict[str, Dict[str, int]] = {}
+    
+    def record(self, provider: str, expected: int, parsed: int):
+        with self._lock:
+            stats = self._providers.setdefault(provider, {
+                'responses': 0, 'failed_responses': 0, 'items_expected': 0, 'items_parsed': 0
+            })
+            stats['responses'] += 1
+            stats['failed_responses'] += int(parsed < expected)
+            stats['items_expected'] += expected
+            stats['items_parsed'] += parsed
+    
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                provider: dict(
+                    stats,
+                    failure_rate=round(stats['failed_responses'] / stats['responses'], 3) if stats['responses'] else 0.0,
+                    item_failure_rate=round(1 - stats['items_parsed'] / stats['items_expected'], 3) if stats['items_expected'] else 0.0
+                )
+                for provider, stats in self._providers.items()
+            }
+
+_parse_stats = ParseStats()
+
+def get_parse_stats() -> ParseStats:
+    return _parse_stats
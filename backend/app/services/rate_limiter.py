@@ -0,0 +1,295 @@
+"""
+AI Rate Limiter
+Requests/tokens-per-minute budget per AI provider, shared across worker processes.
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+import logging
+from datetime import datetime, timezone
+from typing import Callable, Dict
+from app.utils.helpers import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Whether a provider error is a 429 / quota error."""
+    if getattr(error, 'status_code', None) == 429 or getattr(error, 'code', None) == 429:
+        return True
+    message = str(error).lower()
+    return 'rate_limit' in message or 'rate limit' in message or '429' in message or 'resource_exhausted' in message
+
+def retry_after_seconds(error: Exception, default: float = 20.0) -> float:
+    """Read Retry-After (or retry-after-ms) from a 429 response, else `default`."""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000.0
+        if headers.get('retry-after'):
+            return float(headers['retry-after'])
+    except (TypeError, ValueError):
+        pass
+    return default
+
+def _reserve(state: Dict, requests_per_minute: float, tokens_per_minute: float,
+             tokens: float, requests: float, now: float) -> float:
+    """
+    Refill `state`, take a reservation from it and return the seconds to wait.
+    
+    The reservation is taken immediately (the balance may go negative), so
+    concurrent callers queue up behind each other instead of racing.
+    """
+    if state.get('refilled_at') is None:
+        state.update(requests=requests_per_minute, tokens=tokens_per_minute, refilled_at=now)
+    
+    elapsed = max(0.0, now - state['refilled_at'])
+    state['requests'] = min(requests_per_minute, state['requests'] + elapsed * requests_per_minute / 60.0)
+    state['tokens'] = min(tokens_per_minute, state['tokens'] + elapsed * tokens_per_minute / 60.0)
+    state['refilled_at'] = now
+    
+    state['requests'] -= requests
+    state['tokens'] -= min(tokens, tokens_per_minute)  # A single call can never need more than a full minute
+    
+    wait = max(0.0, (state.get('blocked_until') or 0.0) - now)
+    if state['requests'] < 0:
+        wait = max(wait, -state['requests'] * 60.0 / requests_per_minute)
+    if state['tokens'] < 0:
+        wait = max(wait, -state['tokens'] * 60.0 / tokens_per_minute)
+    return wait
+
+class MemoryBackend:
+    """Budget state kept in this process only."""
+    
+    name = 'memory'
+    
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+    
+    def update(self, provider: str, fn: Callable[[Dict], float]) -> float:
+        with self._lock:
+            return fn(self._states.setdefault(provider, {}))
+
+class FileBackend:
+    """Budget state in a JSON file guarded by flock, shared by processes on one host."""
+    
+    name = 'file'
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+    
+    def update(self, provider: str, fn: Callable[[Dict], float]) -> float:
+        with self._lock, open(self.path, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    states = json.loads(f.read() or '{}')
+                except ValueError:
+                    states = {}
+                
+                state = states.setdefault(provider, {})
+                result = fn(state)
+                
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(states))
+                f.flush()
+                return result
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+class DatabaseBackend:
+    """Budget state in the ai_rate_limits table, locked with SELECT ... FOR UPDATE."""
+    
+    name = 'database'
+    
+    def __init__(self, engine):
+        from app.models.ai_rate_limit import AIRateLimit
+        self.engine = engine
+        self.table = AIRateLimit.__table__
+    
+    @staticmethod
+    def _epoch(value):
+        if value is None:
+            return None
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    
+    @staticmethod
+    def _datetime(value):
+        return datetime.fromtimestamp(value, timezone.utc) if value else None
+    
+    def update(self, provider: str, fn: Callable[[Dict], float]) -> float:
+        table = self.table
+        
+        # Own short transaction, independent of the request's db.session
+        with self.engine.begin() as conn:
+            select_row = table.select().where(table.c.provider == provider).with_for_update()
+            row = conn.execute(select_row).mappings().first()
+            if row is None:
+                from sqlalchemy.dialects.postgresql import insert
+                conn.execute(insert(table).values(
+                    provider=provider, requests_available=0.0, tokens_available=0.0,
+                    refilled_at=datetime.now(timezone.utc), blocked_until=None
+                ).on_conflict_do_nothing(index_elements=['provider']))
+                row = conn.execute(select_row).mappings().first()
+                state = {}
+            else:
+                state = {
+                    'requests': row['requests_available'],
+                    'tokens': row['tokens_available'],
+                    'refilled_at': self._epoch(row['refilled_at']),
+                    'blocked_until': self._epoch(row['blocked_until'])
+                }
+            
+            result = fn(state)
+            
+            conn.execute(table.update().where(table.c.provider == provider).values(
+                requests_available=state.get('requests', 0.0),
+                tokens_available=state.get('tokens', 0.0),
+                refilled_at=self._datetime(state.get('refilled_at')) or datetime.now(timezone.utc),
+                blocked_until=self._datetime(state.get('blocked_until'))
+            ))
+            return result
+
+class RateLimiter:
+    """Paces calls to one provider and waits out 429s instead of failing them."""
+    
+    def __init__(self, provider: str, requests_per_minute: float, tokens_per_minute: float,
+                 backend=None, max_retries: int = 3, max_wait: float = 60.0):
+        self.provider = provider
+        self.requests_per_minute = float(requests_per_minute)
+        self.tokens_per_minute = float(tokens_per_minute)
+        self.backend = backend or MemoryBackend()
+        self.max_retries = max_retries
+        self.max_wait = max_wait
+    
+    def reserve(self, tokens: int = 0, requests: int = 1) -> float:
+        """Reserve budget for a call and return how many seconds to wait before making it."""
+        now = time.time()
+        return self.backend.update(self.provider, lambda state: _reserve(
+            state, self.requests_per_minute, self.tokens_per_minute, tokens, requests, now
+        ))
+    
+    def block_for(self, seconds: float):
+        """Hold every worker's calls to this provider for `seconds` (Retry-After)."""
+        now = time.time()
+        until = now + seconds
+        
+        def block(state):
+            _reserve(state, self.requests_per_minute, self.tokens_per_minute, 0, 0, now)
+            state['blocked_until'] = max(state.get('blocked_until') or 0.0, until)
+            return 0.0
+        
+        self.backend.update(self.provider, block)
+    
+    def acquire(self, tokens: int = 0, requests: int = 1):
+        """Block until the call fits the budget."""
+        wait = self.reserve(tokens, requests)
+        if wait > 0:
+            time.sleep(wait)
+    
+    async def acquire_async(self, tokens: int = 0, requests: int = 1):
+        """Wait (without blocking the event loop) until the call fits the budget."""
+        loop = asyncio.get_running_loop()
+        wait = await loop.run_in_executor(None, self.reserve, tokens, requests)
+        if wait > 0:
+            await asyncio.sleep(wait)
+    
+    def _retry_delay(self, error: Exception, attempt: int):
+        """Delay before retrying a failed call, or None if it should be raised."""
+        if not is_rate_limit_error(error):
+            return None
+        
+        delay = retry_after_seconds(error)
+        self.block_for(delay)
+        logger.warning(f"⚠️  {self.provider} rate limit reached, holding calls for {delay:.1f}s")
+        
+        if attempt >= self.max_retries or delay > self.max_wait:
+            return None
+        return delay
+    
+    def call(self, fn: Callable, tokens: int = 0):
+        """Run a provider call within the budget, retrying after Retry-After on 429."""
+        attempt = 0
+        while True:
+            self.acquire(tokens)
+            try:
+                return fn()
+            except Exception as e:
+                attempt += 1
+                if self._retry_delay(e, attempt) is None:
+                    raise
+    
+    async def call_async(self, fn: Callable, tokens: int = 0):
+        """Async version of call; `fn` returns an awaitable."""
+        attempt = 0
+        while True:
+            await self.acquire_async(tokens)
+            try:
+                return await fn()
+            except Exception as e:
+                attempt += 1
+                if self._retry_delay(e, attempt) is None:
+                    raise
+
+_backend = None
+_backend_pid = None
+_backend_lock = threading.Lock()
+
+def _get_backend(config):
+    """Pick the shared backend once per process, from AI_RATE_LIMIT_BACKEND."""
+    global _backend, _backend_pid
+    
+    with _backend_lock:
+        if _backend is not None and _backend_pid == os.getpid():
+            return _backend
+        
+        kind = config.get('AI_RATE_LIMIT_BACKEND', 'auto')
+        backend = None
+        
+        if kind in ('auto', 'database'):
+            try:
+                from app import db
+                if db.engine.dialect.name == 'postgresql':
+                    backend = DatabaseBackend(db.engine)
+                elif kind == 'database':
+                    logger.warning("AI rate limit database backend needs PostgreSQL - using file backend")
+            except Exception as e:
+                logger.warning(f"AI rate limit database backend unavailable: {e}")
+        
+        if backend is None and kind != 'memory':
+            if fcntl is not None:
+                path = config.get('AI_RATE_LIMIT_FILE') or os.path.join(tempfile.gettempdir(), 'emailmanager_ai_rate_limits.json')
+                backend = FileBackend(path)
+            else:
+                logger.warning("File locking not available - AI rate limits apply per process only")
+        
+        _backend = backend or MemoryBackend()
+        _backend_pid = os.getpid()
+        logger.info(f"AI rate limiter using {_backend.name} backend")
+        return _backend
+
+def get_rate_limiter(provider: str, requests_per_minute: float, tokens_per_minute: float, config) -> RateLimiter:
+    """Get the rate limiter for a provider, backed by the process-wide shared backend."""
+    return RateLimiter(
+        provider,
+        requests_per_minute,
+        tokens_per_minute,
+        backend=_get_backend(config),
+        max_retries=int(config.get('AI_RATE_LIMIT_MAX_RETRIES', 3)),
+        max_wait=float(config.get('AI_RATE_LIMIT_MAX_WAIT_SECONDS', 60))
+    )
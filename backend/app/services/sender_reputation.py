@@ -0,0 +1,253 @@
+"""
+Sender Reputation
+Per-sender urgency distributions, so predictable senders are classified without an AI call.
+
+Every classification adds to the counts of its sender address and sender
+domain in the email account; /update-urgency corrections move a count to
+the corrected category. Once a sender (or, for senders seen too rarely, its
+domain) has enough classifications concentrated on one category and few
+corrections, the cascade assigns that category directly. A sampled share of
+those emails still goes to the AI service; every AI answer given while a
+distribution is settled is an audit of it, and disagreeing audits turn the
+prior off until the distribution agrees again.
+"""
+
+import random
+import threading
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from flask import current_app
+from app import db
+from app.models.email import Email, USER_CORRECTION_MODEL
+from app.models.sender_reputation import SenderReputation
+from .keyword_rules import RULES_MODEL, get_rules_engine
+from .near_duplicates import NEAR_DUPLICATE_MODEL
+from .header_rules import HEADER_RULES_MODEL
+
+logger = logging.getLogger(__name__)
+
+SENDER_PRIOR_MODEL = 'sender-prior'
+
+# Not evidence of how the AI sees a sender: keyword and header rules, the local classifier
+# (numpy is optional, so its LOCAL_MODEL is not imported), copies of another email's
+# answer and the priors themselves; user corrections are counted separately
+UNCOUNTED_MODELS = (RULES_MODEL, HEADER_RULES_MODEL, 'local', NEAR_DUPLICATE_MODEL, SENDER_PRIOR_MODEL, USER_CORRECTION_MODEL)
+
+EMPTY_COUNTS = {
+    'urgent_count': 0, 'high_count': 0, 'medium_count': 0, 'low_count': 0,
+    'correction_count': 0, 'audit_count': 0, 'audit_mismatch_count': 0
+}
+
+def sender_keys(sender_email: Optional[str]) -> List[Tuple[str, str]]:
+    """[('sender', address), ('domain', domain)] of a sender address, normalized."""
+    address = (sender_email or '').strip().lower()
+    if '@' not in address:
+        return []
+    return [('sender', address[:255]), ('domain', address.rsplit('@', 1)[1][:255])]
+
+class SenderPriorStats:
+    """How often priors answered and were sent to the AI service for an audit, per process."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.emails = 0
+        self.answered = 0
+        self.audited = 0
+    
+    def record(self, emails: int, answered: int, audited: int):
+        with self._lock:
+            self.emails += emails
+            self.answered += answered
+            self.audited += audited
+    
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                'emails': self.emails,
+                'answered': self.answered,
+                'audited': self.audited,
+                'hit_rate': round(self.answered / self.emails, 3) if self.emails else 0.0
+            }
+
+_stats = SenderPriorStats()
+
+def get_sender_prior_stats() -> SenderPriorStats:
+    return _stats
+
+class SenderReputationIndex:
+    """Keeps the sender_reputation table up to date and answers from settled distributions."""
+    
+    def __init__(self, config=None, stats: SenderPriorStats = None):
+        self.config = config or current_app.config
+        self.stats = stats or _stats
+        self.enabled = self.config.get('SENDER_PRIOR_ENABLED', True)
+        self.min_samples = int(self.config.get('SENDER_PRIOR_MIN_SAMPLES', 20))
+        self.min_share = float(self.config.get('SENDER_PRIOR_MIN_SHARE', 0.9))
+        self.max_error_rate = float(self.config.get('SENDER_PRIOR_MAX_ERROR_RATE', 0.1))
+        self.audit_rate = float(self.config.get('SENDER_PRIOR_AUDIT_RATE', 0.05))
+    
+    def _rows(self, keys, lock: bool = False) -> Dict[Tuple[str, str, str], SenderReputation]:
+        """Rows of (email_account_id, kind, key) triples, created if `lock` (caller commits)."""
+        keys = list(set(keys))
+        if not keys:
+            return {}
+        
+        if lock:
+            dialect = db.session.get_bind().dialect.name
+            if dialect == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert
+            elif dialect == 'sqlite':
+                from sqlalchemy.dialects.sqlite import insert
+            else:
+                insert = None
+            
+            if insert is not None:
+                now = datetime.now(timezone.utc)
+                db.session.execute(insert(SenderReputation.__table__).on_conflict_do_nothing(), [
+                    dict(EMPTY_COUNTS, email_account_id=account_id, kind=kind, key=key, created_at=now)
+                    for account_id, kind, key in keys
+                ])
+        
+        rows = {}
+        account_ids = {account_id for account_id, _, _ in keys}
+        query = SenderReputation.query.filter(
+            SenderReputation.email_account_id.in_(account_ids),
+            SenderReputation.key.in_({key for _, _, key in keys})
+        )
+        if lock:
+            query = query.with_for_update()
+        for row in query:
+            rows[(row.email_account_id, row.kind, row.key)] = row
+        
+        if lock:
+            # Dialects without ON CONFLICT: create what is missing through the session
+            for account_id, kind, key in keys:
+                if (account_id, kind, key) not in rows:
+                    row = SenderReputation(email_account_id=account_id, kind=kind, key=key, **EMPTY_COUNTS)
+                    db.session.add(row)
+                    rows[(account_id, kind, key)] = row
+        return rows
+    
+    def _settled(self, row: Optional[SenderReputation]) -> bool:
+        """Enough classifications for the distribution to count, whatever it looks like."""
+        return row is not None and row.total >= self.min_samples
+    
+    def _confident(self, row: Optional[SenderReputation]) -> bool:
+        if not self._settled(row):
+            return False
+        _, share = row.top_category
+        return (share >= self.min_share
+                and row.correction_rate <= self.max_error_rate
+                and row.audit_mismatch_rate <= self.max_error_rate)
+    
+    def record_classifications(self, emails: List[Email]):
+        """Add classified emails to their sender and domain statistics (caller commits)."""
+        if not self.enabled or not emails:
+            return
+        
+        counted = [
+            email for email in emails
+            if email.is_classified and email.urgency_category in SenderReputation.CATEGORIES
+            and email.classification_model not in UNCOUNTED_MODELS
+        ]
+        
+        def update():
+            keys = [(email.email_account_id, kind, key) for email in counted for kind, key in sender_keys(email.sender_email)]
+            rows = self._rows(keys, lock=True)
+            
+            now = datetime.now(timezone.utc)
+            for email in counted:
+                for kind, key in sender_keys(email.sender_email):
+                    row = rows[(email.email_account_id, kind, key)]
+                    if self._settled(row):
+                        row.audit_count += 1
+                        row.audit_mismatch_count += int(email.urgency_category != row.top_category[0])
+                    row.add(email.urgency_category)
+                    row.last_seen_at = now
+        
+        self._in_savepoint(update)
+    
+    def record_correction(self, email: Email, previous_category: Optional[str], previous_model: Optional[str], category: str):
+        """Move a count from the previous to the corrected category and count the correction (caller commits).
+        
+        The previous category only lost a count if its classification added one: an AI answer or an
+        earlier correction, not a rule, local, near-duplicate or prior answer.
+        """
+        if not self.enabled or category not in SenderReputation.CATEGORIES:
+            return
+        counted = previous_category in SenderReputation.CATEGORIES and (
+            previous_model not in UNCOUNTED_MODELS or previous_model == USER_CORRECTION_MODEL
+        )
+        
+        def update():
+            keys = [(email.email_account_id, kind, key) for kind, key in sender_keys(email.sender_email)]
+            rows = self._rows(keys, lock=True)
+            for row in (rows[key] for key in keys):
+                if counted:
+                    row.add(previous_category, -1)
+                row.add(category)
+                row.correction_count += 1
+                row.last_seen_at = datetime.now(timezone.utc)
+        
+        self._in_savepoint(update)
+    
+    def _in_savepoint(self, fn):
+        """Statistics that fail to update never fail the caller's transaction."""
+        try:
+            with db.session.begin_nested():
+                fn()
+        except Exception as e:
+            logger.warning(f"Could not update sender statistics: {str(e)}")
+    
+    def _prior(self, email_data: Dict, rows: Dict) -> Optional[Dict]:
+        keys = sender_keys(email_data.get('sender_email'))
+        account_id = email_data.get('email_account_id')
+        if not keys or not account_id:
+            return None
+        
+        # The sender's own distribution once it has one, else the domain's
+        sender_row = rows.get((account_id, *keys[0]))
+        row = sender_row if self._settled(sender_row) else rows.get((account_id, *keys[1]))
+        if not self._confident(row):
+            return None
+        
+        category, share = row.top_category
+        classification = get_rules_engine().classify(email_data)
+        if classification['urgency_category'] == 'urgent' and category != 'urgent':
+            return None  # Emergency keywords from a usually calm sender: let the AI look
+        
+        classification.update({
+            'urgency_category': category,
+            'confidence_score': round(share, 3),
+            'reasoning': f"Remitente habitual ({'dominio ' if row.kind == 'domain' else ''}{row.key}): "
+                         f"{round(100 * share)}% de sus {row.total} correos son '{category}'",
+            'suggested_deadline': None,
+            'classification_model': SENDER_PRIOR_MODEL
+        })
+        if category not in ('urgent', 'high'):
+            classification['requires_immediate_action'] = False
+        return classification
+    
+    def classify_many(self, emails_data: List[Dict]) -> List[Optional[Dict]]:
+        """Prior classification per email, or None where the sender is not predictable (or sampled for an audit)."""
+        if not self.enabled or not emails_data:
+            return [None] * len(emails_data)
+        
+        keys = [
+            (email_data.get('email_account_id'), kind, key)
+            for email_data in emails_data if email_data.get('email_account_id')
+            for kind, key in sender_keys(email_data.get('sender_email'))
+        ]
+        rows = self._rows(keys)
+        
+        results, audited = [], 0
+        for email_data in emails_data:
+            classification = self._prior(email_data, rows)
+            if classification is not None and random.random() < self.audit_rate:
+                classification = None
+                audited += 1
+            results.append(classification)
+        
+        self.stats.record(len(emails_data), sum(result is not None for result in results), audited)
+        return results
@@ -0,0 +1,149 @@
+"""
+Email text compaction.
+
+Drops quoted replies, reply/forward headers, signatures and legal
+disclaimers from email bodies, so previews and prompts keep the part of
+the message that was actually written. Used at ingest (body_preview) and
+again when building prompts, for rows stored before compaction existed.
+"""
+
+import re
+import html
+import threading
+from typing import Dict
+
+from .helpers import estimate_tokens
+
+# Block-level HTML that should become line breaks before tags are stripped
+BLOCK_TAG_PATTERN = re.compile(r'<\s*(br|/p|/div|/tr|/li|/h[1-6]|hr)\b[^>]*>', re.IGNORECASE)
+STYLE_PATTERN = re.compile(r'<\s*(style|script|head)\b.*?<\s*/\s*\1\s*>', re.IGNORECASE | re.DOTALL)
+TAG_PATTERN = re.compile(r'<[^>]+>')
+
+# Start of the quoted history of a reply or forward. These also match bodies
+# that were already flattened to one line (previews stored before compaction).
+QUOTE_START_PATTERNS = [
+    # Outlook: "De: Ana <ana@uss.cl> Enviado: lunes..." / "From: ... Sent: ..."
+    re.compile(r'(?:^|\s)(?:De|From)\s*:\s*.{0,200}?\s(?:Enviado(?: el)?|Sent|Fecha|Date)\s*:', re.IGNORECASE | re.DOTALL),
+    # Gmail / Apple: "El lun, 2 sept 2025 a las 10:00, Ana (<ana@uss.cl>) escribió:"
+    re.compile(r'(?:^|\s)(?:El|On)\s[^:]{0,40}?\d.{0,160}?\s(?:escribió|wrote)\s*:', re.IGNORECASE | re.DOTALL),
+    re.compile(r'-{2,}\s*(?:Mensaje original|Original Message|Mensaje reenviado|Forwarded message)\s*-{2,}', re.IGNORECASE),
+    re.compile(r'^\s*>', re.MULTILINE),
+]
+
+HEADER_LINE_PATTERN = re.compile(
+    r'^\s*(?:De|From|Para|To|CC|Enviado(?: el)?|Sent|Fecha|Date|Asunto|Subject)\s*:', re.IGNORECASE
+)
+
+SIGNATURE_PATTERNS = [
+    re.compile(r'^-- ?$', re.MULTILINE),
+    re.compile(r'(?:Enviado desde mi|Sent from my|Obtener Outlook para)\s+\w+', re.IGNORECASE),
+    # Sign-off on its own line; everything after it is the signature block
+    re.compile(
+        r'^\s*(?:saludos(?: cordiales)?|atentamente|cordialmente|un abrazo|muchas gracias|best regards|regards)\s*[,.!]?\s*$',
+        re.IGNORECASE | re.MULTILINE
+    ),
+]
+
+DISCLAIMER_PATTERNS = [
+    re.compile(r'(?:aviso de confidencialidad|confidentiality notice|aviso legal|disclaimer)\s*:?', re.IGNORECASE),
+    re.compile(r'este (?:correo|mensaje|e-?mail)(?: electrónico)?(?: y sus (?:anexos|adjuntos))?'
+               r'(?: es| son| puede contener| contiene)[^.]{0,80}?confidencial', re.IGNORECASE),
+    re.compile(r'this (?:e-?mail|message)(?: and any attachments)?[^.]{0,80}?confidential', re.IGNORECASE),
+    re.compile(r'antes de imprimir(?: este (?:correo|mensaje))?', re.IGNORECASE),
+]
+
+# Keep the quoted part of a forward when the sender wrote (almost) nothing above it
+MIN_OWN_TEXT_CHARS = 20
+
+# Sign-offs this far into a body are most likely the start of a signature
+MIN_SIGNATURE_OFFSET = 40
+
+def html_to_text(body: str) -> str:
+    """Plain text of an HTML body, keeping line breaks."""
+    if not body:
+        return ''
+    text = STYLE_PATTERN.sub(' ', body)
+    text = BLOCK_TAG_PATTERN.sub('\n', text)
+    text = TAG_PATTERN.sub('', text)
+    return html.unescape(text).replace('\xa0', ' ')
+
+def _cut_at_first(text: str, patterns, min_offset: int = 0) -> str:
+    """Text before the earliest match (at or after `min_offset`) of any pattern."""
+    cut = len(text)
+    for pattern in patterns:
+        match = pattern.search(text, min_offset)
+        if match and match.start() < cut:
+            cut = match.start()
+    return text[:cut]
+
+def strip_quoted_reply(text: str) -> str:
+    """Drop quoted history; a forward with no own text keeps the forwarded message."""
+    own_text = _cut_at_first(text, QUOTE_START_PATTERNS)
+    if len(own_text.strip()) >= MIN_OWN_TEXT_CHARS or len(own_text) == len(text):
+        return own_text
+    
+    # Forward without comment: skip the marker and header lines, keep the
+    # forwarded body up to its own quoted history
+    lines = text[len(own_text):].split('\n')
+    start = 1
+    while start < len(lines) and (not lines[start].strip() or HEADER_LINE_PATTERN.match(lines[start])):
+        start += 1
+    if start >= len(lines):
+        return own_text
+    return _cut_at_first('\n'.join(lines[start:]), QUOTE_START_PATTERNS)
+
+def strip_signature(text: str) -> str:
+    return _cut_at_first(text, SIGNATURE_PATTERNS, min_offset=MIN_SIGNATURE_OFFSET)
+
+def strip_disclaimers(text: str) -> str:
+    return _cut_at_first(text, DISCLAIMER_PATTERNS, min_offset=MIN_SIGNATURE_OFFSET)
+
+class CompactionStats:
+    """Estimated tokens before and after compaction, per caller, for this process."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sources: Dict[str, Dict[str, int]] = {}
+    
+    def record(self, source: str, tokens_before: int, tokens_after: int):
+        with self._lock:
+            stats = self._sources.setdefault(source, {'texts': 0, 'tokens_before': 0, 'tokens_after': 0})
+            stats['texts'] += 1
+            stats['tokens_before'] += tokens_before
+            stats['tokens_after'] += tokens_after
+    
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                source: dict(
+                    stats,
+                    tokens_saved=stats['tokens_before'] - stats['tokens_after'],
+                    saved_ratio=round(1 - stats['tokens_after'] / stats['tokens_before'], 3) if stats['tokens_before'] else 0.0
+                )
+                for source, stats in self._sources.items()
+            }
+
+_stats = CompactionStats()
+
+def get_compaction_stats() -> CompactionStats:
+    return _stats
+
+def compact_email_text(body: str, source: str = 'other') -> str:
+    """
+    Own text of an email body (HTML or plain), whitespace collapsed.
+    
+    Falls back to the original text if compaction would leave nothing.
+    Savings are recorded under `source` (e.g. 'ingest' or 'prompt').
+    """
+    if not body:
+        return ''
+    
+    text = html_to_text(body)
+    compacted = strip_disclaimers(strip_signature(strip_quoted_reply(text)))
+    compacted = re.sub(r'\s+', ' ', compacted).strip()
+    original = re.sub(r'\s+', ' ', text).strip()
+    if not compacted:
+        compacted = original
+    
+    _stats.record(source, estimate_tokens(original), estimate_tokens(compacted))
+    return compacted
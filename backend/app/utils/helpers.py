@@ -60,6 +60,10 @@ def extract_email_preview(body, max_length=500):
     
     return clean_text
 
+def estimate_tokens(text):
+    """Rough token count for budgeting (about 4 characters per token)."""
+    return len(text or '') // 4 + 1
+
 def get_urgency_from_priority(priority_level):
     """Convert priority level to urgency category."""
     priority_map = {
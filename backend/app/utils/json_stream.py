@@ -0,0 +1,125 @@
+"""
+Tolerant incremental JSON object parser.
+
+Model answers are not always clean JSON: they come wrapped in markdown
+fences or prose, echo the `// o null` comments of the prompt template,
+leave trailing commas or get cut off by the output-token cap. This parser
+is fed the text as it arrives and hands back every JSON object as soon as
+its closing brace is seen, so the complete items of a truncated or
+slightly malformed answer are still usable.
+
+Each object is parsed once: when an enclosing object closes, the children
+already parsed are swapped for placeholders in its text and put back into
+the result, so nested answers cost linear rather than quadratic time.
+"""
+
+import re
+import json
+from typing import Dict, List, Tuple
+
+TRAILING_COMMA_PATTERN = re.compile(r',\s*([}\]])')
+
+# JSON text standing in for an already parsed child object, and the string it decodes to
+CHILD_MARKER = '\\u0000child:'
+CHILD_PLACEHOLDER = '"' + CHILD_MARKER + '{}"'
+CHILD_VALUE = '\x00child:{}'
+
+class StreamingJSONParser:
+    """
+    Yields (depth, object) for each complete JSON object in the text fed so far.
+    
+    A nested object is the same instance as the one inside its parent.
+    """
+    
+    def __init__(self):
+        self._buffer: List[str] = []
+        self._open: List[Tuple[int, List]] = []  # (start, parsed children as (start, end, value)) per unfinished object
+        self._in_string = False
+        self._escape = False
+        self._in_comment = False
+        self.malformed = 0
+    
+    def feed(self, text: str) -> List[Tuple[int, Dict]]:
+        """Consume more text; returns the objects completed by it, innermost first."""
+        completed = []
+        buffer = self._buffer
+        for ch in text:
+            if self._in_comment:
+                if ch == '\n':
+                    self._in_comment = False
+                    buffer.append(ch)
+                continue
+            
+            buffer.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == '/' and len(buffer) > 1 and buffer[-2] == '/':
+                # `// comment` outside a string: drop it up to the end of the line
+                del buffer[-2:]
+                self._in_comment = True
+            elif ch == '{':
+                self._open.append((len(buffer) - 1, []))
+            elif ch == '}' and self._open:
+                start, children = self._open.pop()
+                parsed = self._load_object(start, len(buffer), children)
+                if parsed is not None:
+                    completed.append((len(self._open), parsed))
+                    if self._open:
+                        self._open[-1][1].append((start, len(buffer), parsed))
+        return completed
+    
+    def _load_object(self, start: int, end: int, children: List):
+        """Parse buffer[start:end], reusing the children parsed before instead of parsing them again."""
+        buffer = self._buffer
+        pieces = []
+        position = start
+        for index, (child_start, child_end, _) in enumerate(children):
+            pieces.append(''.join(buffer[position:child_start]))
+            pieces.append(CHILD_PLACEHOLDER.format(index))
+            position = child_end
+        pieces.append(''.join(buffer[position:end]))
+        
+        if any(CHILD_MARKER in piece for piece in pieces[::2]):
+            return self._load(''.join(buffer[start:end]))  # The answer itself contains the placeholder text
+        
+        parsed = self._load(''.join(pieces))
+        if parsed is None or not children:
+            return parsed
+        return _restore_children(parsed, {CHILD_VALUE.format(index): value for index, (_, _, value) in enumerate(children)})
+    
+    def _load(self, text: str):
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            pass
+        try:
+            return json.loads(TRAILING_COMMA_PATTERN.sub(r'\1', text))
+        except json.JSONDecodeError:
+            self.malformed += 1
+            return None
+    
+    @property
+    def truncated(self) -> bool:
+        """True if the text fed so far ends inside an unfinished object."""
+        return bool(self._open)
+
+def _restore_children(value, children: Dict):
+    """Put parsed child objects back where their placeholders ended up."""
+    if isinstance(value, dict):
+        return {key: _restore_children(item, children) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_restore_children(item, children) for item in value]
+    if isinstance(value, str):
+        return children.get(value, value)
+    return value
+
+def iter_json_objects(text: str) -> List[Tuple[int, Dict]]:
+    """Every complete JSON object in `text` as (depth, object), innermost first."""
+    return StreamingJSONParser().feed(text or '')
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Mailbox Backfill
+Imports the history of a connected mailbox, in parallel date windows checkpointed page by page.
+
+A new backfill is created for the account unless one is unfinished, which is
+resumed instead; windows continue after their last stored page. Imported
+emails are queued for classification behind regular syncs.
+
+Usage:
+    python backfill_emails.py --account user@example.com                  # Last BACKFILL_DEFAULT_YEARS years
+    python backfill_emails.py --account user@example.com --since 2019-01-01
+    python backfill_emails.py --job-id <id>                               # Resume a job
+    python backfill_emails.py --resume-stalled                            # Resume every job whose runner died
+"""
+
+import json
+import argparse
+import logging
+from datetime import datetime, timedelta, timezone
+from app import create_app, db
+from app.models.email_account import EmailAccount
+from app.models.backfill_job import BackfillJob
+from app.services.backfill import BackfillRunner, active_backfill_job, create_backfill_job
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description='Import the history of an Email Manager IA mailbox')
+    parser.add_argument('--account', help='Email address or id of the email account')
+    parser.add_argument('--folder', default='inbox', help='Mail folder (default: inbox)')
+    parser.add_argument('--since', help='Oldest date to import, YYYY-MM-DD (default: BACKFILL_DEFAULT_YEARS ago)')
+    parser.add_argument('--window-days', type=int, help='Days per window (default: BACKFILL_WINDOW_DAYS)')
+    parser.add_argument('--job-id', help='Resume this backfill job')
+    parser.add_argument('--resume-stalled', action='store_true', help='Resume unfinished jobs whose lease expired')
+    args = parser.parse_args()
+    
+    app = create_app()
+    
+    with app.app_context():
+        if args.resume_stalled:
+            job_ids = [job.id for job in BackfillJob.query.filter(
+                BackfillJob.state.in_(BackfillJob.ACTIVE_STATES),
+                db.or_(BackfillJob.lease_expires_at.is_(None), BackfillJob.lease_expires_at < datetime.now(timezone.utc))
+            )]
+        elif args.job_id:
+            job_ids = [args.job_id]
+        elif args.account:
+            email_account = EmailAccount.query.filter(
+                db.or_(EmailAccount.id == args.account, EmailAccount.email_address == args.account)
+            ).first()
+            if not email_account:
+                logger.error(f"No email account {args.account}")
+                return
+            
+            job = active_backfill_job(email_account.id, args.folder)
+            if job is None:
+                if args.since:
+                    since = datetime.strptime(args.since, '%Y-%m-%d').replace(tzinfo=timezone.utc)
+                else:
+                    since = datetime.now(timezone.utc) - timedelta(days=365 * app.config['BACKFILL_DEFAULT_YEARS'])
+                job = create_backfill_job(
+                    email_account, since=since, folder=args.folder,
+                    window_days=args.window_days or app.config['BACKFILL_WINDOW_DAYS']
+                )
+                db.session.commit()
+                logger.info(f"Created backfill {job.id}: {job.windows_total} windows since {since.date()}")
+            else:
+                logger.info(f"Resuming backfill {job.id} ({job.windows_done}/{job.windows_total} windows done)")
+            job_ids = [job.id]
+        else:
+            parser.error('one of --account, --job-id or --resume-stalled is required')
+        
+        for job_id in job_ids:
+            report = BackfillRunner(app).run(job_id)
+            if report:
+                print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
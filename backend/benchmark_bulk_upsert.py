@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the email sync ingest path.
+
+Compares the old per-message ingest (one SELECT + one flush per message) with
+Email.bulk_upsert_from_graph for a first sync (all messages new) and a re-sync
+(all messages known, 10% with changed read status).
+
+Usage:
+    python benchmark_bulk_upsert.py                     # SQLite in memory, 200 and 5000 messages
+    python benchmark_bulk_upsert.py --sizes 200 5000 20000
+    DATABASE_URL=postgresql://... python benchmark_bulk_upsert.py --config development
+"""
+
+import argparse
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import event
+
+from app import create_app, db
+from app.models import User, EmailAccount, Email
+
+
+def build_messages(count, prefix):
+    """Generate Graph-like message payloads."""
+    base = datetime(2025, 9, 1, tzinfo=timezone.utc)
+    messages = []
+    for i in range(count):
+        messages.append({
+            'id': f'{prefix}-{i}',
+            'subject': f'Consulta sobre evaluación {i}',
+            'from': {'emailAddress': {'address': f'alumno{i % 300}@uss.cl', 'name': f'Alumno {i % 300}'}},
+            'receivedDateTime': (base + timedelta(minutes=i)).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'body': {'content': f'<p>Estimada directora, le escribo por la evaluación {i}.</p>' * 5},
+            'isRead': False,
+            'importance': 'normal',
+            'flag': {'flagStatus': 'notFlagged'},
+            'hasAttachments': False
+        })
+    return messages
+
+
+def legacy_ingest(email_account, messages):
+    """Per-message ingest as done by sync_emails before the bulk path."""
+    for message in messages:
+        existing_email = Email.query.filter_by(microsoft_email_id=message['id']).first()
+        if existing_email:
+            if existing_email.is_read != message.get('isRead', False):
+                existing_email.is_read = message.get('isRead', False)
+                existing_email.updated_at = datetime.now()
+                db.session.add(existing_email)
+            continue
+
+        row = Email.row_from_graph_message(email_account, message)
+        db.session.add(Email(**row))
+        db.session.flush()
+
+
+class StatementCounter:
+    """Count statements sent to the database."""
+
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+
+def run_case(label, email_account, counter, fn):
+    """Time one ingest call including its commit."""
+    counter.count = 0
+    started = time.perf_counter()
+    result = fn()
+    db.session.commit()
+    elapsed = time.perf_counter() - started
+    print(f"  {label:<28} {elapsed * 1000:>9.1f} ms  {counter.count:>6} statements")
+    if result:
+        print(f"  {'':<28} inserted={result['inserted']} updated={result['updated']} unchanged={result['unchanged']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark email ingest paths')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[200, 5000])
+    parser.add_argument('--config', default='testing', help='Flask config name (default: testing, SQLite in memory)')
+    args = parser.parse_args()
+
+    app = create_app(args.config)
+
+    with app.app_context():
+        db.create_all()
+        counter = StatementCounter(db.engine)
+
+        user = User(email=f'benchmark-{uuid.uuid4()}@uss.cl', full_name='Benchmark')
+        db.session.add(user)
+        db.session.flush()
+        email_account = EmailAccount(user_id=user.id, email_address=user.email, display_name='Benchmark')
+        db.session.add(email_account)
+        db.session.commit()
+
+        for size in args.sizes:
+            print(f"\n{size} messages ({db.engine.dialect.name})")
+
+            legacy_messages = build_messages(size, f'legacy-{size}-{uuid.uuid4()}')
+            bulk_messages = build_messages(size, f'bulk-{size}-{uuid.uuid4()}')
+
+            run_case('legacy first sync', email_account, counter,
+                     lambda: legacy_ingest(email_account, legacy_messages))
+            run_case('bulk first sync', email_account, counter,
+                     lambda: Email.bulk_upsert_from_graph(email_account, bulk_messages))
+
+            for i in range(0, size, 10):
+                legacy_messages[i]['isRead'] = True
+                bulk_messages[i]['isRead'] = True
+
+            run_case('legacy re-sync (10% read)', email_account, counter,
+                     lambda: legacy_ingest(email_account, legacy_messages))
+            run_case('bulk re-sync (10% read)', email_account, counter,
+                     lambda: Email.bulk_upsert_from_graph(email_account, bulk_messages))
+
+        # Leave the database as we found it
+        Email.query.filter_by(email_account_id=email_account.id).delete()
+        db.session.delete(email_account)
+        db.session.delete(user)
+        db.session.commit()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Classification Worker
+Drains the classification_jobs queue in its own process.
+
+Run as many of these as needed next to the web server; jobs are leased, so
+workers never classify the same email twice. Set CLASSIFICATION_INLINE_WORKER=false
+on the web service when dedicated workers are running.
+
+Usage:
+    python classification_worker.py          # Run until interrupted
+    python classification_worker.py --once   # Process one batch and exit
+"""
+
+import argparse
+import logging
+import threading
+import signal
+from app import create_app
+from app.services.classification_worker import ClassificationWorker
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description='Email Manager IA classification worker')
+    parser.add_argument('--once', action='store_true', help='Process one batch and exit')
+    args = parser.parse_args()
+    
+    app = create_app()
+    
+    with app.app_context():
+        worker = ClassificationWorker()
+        
+        if args.once:
+            handled = worker.run_once()
+            logger.info(f"Processed {handled} classification jobs")
+            return
+        
+        stop_event = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+        signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+        
+        worker.run_forever(
+            idle_sleep=app.config.get('CLASSIFICATION_WORKER_IDLE_SECONDS', 5),
+            stop_event=stop_event
+        )
+
+if __name__ == '__main__':
+    main()
@@ -61,13 +61,16 @@ def migrate_existing_emails():
                 
                 logger.info(f"Procesando lote {batch_num + 1}/{total_batches} ({len(batch_emails)} correos)")
                 
-                # Clasificar lote
+                # Clasificar lote (classify_batch ya respeta el límite de solicitudes por minuto)
                 classifications = openai_service.classify_batch(batch_emails, batch_size=len(batch_emails))
                 
                 # Actualizar correos con nuevas clasificaciones
                 for i, email_data in enumerate(batch_emails):
                     if i < len(classifications):
                         classification = classifications[i]
+                        if classification.get('rate_limit_retry'):
+                            logger.warning(f"OpenAI no disponible, se mantiene la clasificación de {email_data['email_id']}")
+                            continue
                         
                         # Encontrar y actualizar el correo
                         email = Email.query.get(email_data['email_id'])
@@ -83,7 +86,7 @@ def migrate_existing_emails():
                             email.processing_status = 'completed'
                             email.is_classified = True
                             email.classified_at = datetime.now()
-                            email.classification_model = openai_service.model
+                            email.classification_model = classification.get('classification_model') or openai_service.model
                             
                             # Log del cambio
                             if old_urgency != email.urgency_category:
@@ -94,12 +97,6 @@ def migrate_existing_emails():
                 # Guardar cambios del lote
                 db.session.commit()
                 logger.info(f"Lote {batch_num + 1} guardado exitosamente")
-                
-                # Pausa entre lotes para evitar rate limiting
-                if batch_num < total_batches - 1:
-                    logger.info("Esperando 10 segundos antes del siguiente lote...")
-                    import time
-                    time.sleep(10)
             
             logger.info(f"✅ Migración completada. {len(all_emails)} correos reclasificados exitosamente.")
             
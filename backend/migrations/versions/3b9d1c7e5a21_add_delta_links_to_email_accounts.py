@@ -0,0 +1,26 @@
+"""Add delta sync watermarks to email accounts
+
+Revision ID: 3b9d1c7e5a21
+Revises: f5c4c2484f18
+Create Date: 2025-10-02 10:12:31.418220
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b9d1c7e5a21'
+down_revision = 'f5c4c2484f18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('email_accounts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('delta_links', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('email_accounts', schema=None) as batch_op:
+        batch_op.drop_column('delta_links')
@@ -0,0 +1,53 @@
+"""Add classification job queue
+
+Revision ID: 8e4f0a6b2c93
+Revises: 3b9d1c7e5a21
+Create Date: 2025-10-03 09:41:07.552310
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e4f0a6b2c93'
+down_revision = '3b9d1c7e5a21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('classification_jobs',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('email_id', sa.String(length=36), nullable=False),
+    sa.Column('email_account_id', sa.String(length=36), nullable=False),
+    sa.Column('state', sa.String(length=20), nullable=False),
+    sa.Column('priority', sa.Integer(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('max_attempts', sa.Integer(), nullable=False),
+    sa.Column('not_before', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('lease_owner', sa.String(length=100), nullable=True),
+    sa.Column('lease_expires_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('completed_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['email_account_id'], ['email_accounts.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['email_id'], ['emails.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('classification_jobs', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_classification_jobs_email_account_id'), ['email_account_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_classification_jobs_email_id'), ['email_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_classification_jobs_not_before'), ['not_before'], unique=False)
+        batch_op.create_index(batch_op.f('ix_classification_jobs_state'), ['state'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('classification_jobs', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_classification_jobs_state'))
+        batch_op.drop_index(batch_op.f('ix_classification_jobs_not_before'))
+        batch_op.drop_index(batch_op.f('ix_classification_jobs_email_id'))
+        batch_op.drop_index(batch_op.f('ix_classification_jobs_email_account_id'))
+
+    op.drop_table('classification_jobs')
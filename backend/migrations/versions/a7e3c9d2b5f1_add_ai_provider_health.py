@@ -0,0 +1,29 @@
+"""Add shared AI provider health (circuit breakers)
+
+Revision ID: a7e3c9d2b5f1
+Revises: e6b2f8c4d1a9
+Create Date: 2025-10-14 10:21:37.415062
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7e3c9d2b5f1'
+down_revision = 'e6b2f8c4d1a9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ai_provider_health',
+    sa.Column('provider', sa.String(length=50), nullable=False),
+    sa.Column('state', sa.JSON(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('provider')
+    )
+
+
+def downgrade():
+    op.drop_table('ai_provider_health')
@@ -0,0 +1,39 @@
+"""Add per-sender urgency statistics (sender reputation priors)
+
+Revision ID: b8f2d6e4c0a3
+Revises: a7e3c9d2b5f1
+Create Date: 2025-10-15 09:42:18.203517
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8f2d6e4c0a3'
+down_revision = 'a7e3c9d2b5f1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('sender_reputation',
+    sa.Column('email_account_id', sa.String(length=36), nullable=False),
+    sa.Column('kind', sa.String(length=10), nullable=False),
+    sa.Column('key', sa.String(length=255), nullable=False),
+    sa.Column('urgent_count', sa.Integer(), nullable=False),
+    sa.Column('high_count', sa.Integer(), nullable=False),
+    sa.Column('medium_count', sa.Integer(), nullable=False),
+    sa.Column('low_count', sa.Integer(), nullable=False),
+    sa.Column('correction_count', sa.Integer(), nullable=False),
+    sa.Column('audit_count', sa.Integer(), nullable=False),
+    sa.Column('audit_mismatch_count', sa.Integer(), nullable=False),
+    sa.Column('last_seen_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['email_account_id'], ['email_accounts.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('email_account_id', 'kind', 'key')
+    )
+
+
+def downgrade():
+    op.drop_table('sender_reputation')
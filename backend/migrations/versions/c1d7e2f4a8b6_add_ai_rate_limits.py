@@ -0,0 +1,31 @@
+"""Add shared AI rate limits
+
+Revision ID: c1d7e2f4a8b6
+Revises: 8e4f0a6b2c93
+Create Date: 2025-10-06 16:12:45.208913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c1d7e2f4a8b6'
+down_revision = '8e4f0a6b2c93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ai_rate_limits',
+    sa.Column('provider', sa.String(length=50), nullable=False),
+    sa.Column('requests_available', sa.Float(), nullable=False),
+    sa.Column('tokens_available', sa.Float(), nullable=False),
+    sa.Column('refilled_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('blocked_until', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('provider')
+    )
+
+
+def downgrade():
+    op.drop_table('ai_rate_limits')
@@ -0,0 +1,49 @@
+"""Add labelled examples for online learning of the local classifier
+
+Revision ID: c9e1a5f3d7b2
+Revises: b8f2d6e4c0a3
+Create Date: 2025-10-16 14:08:52.730164
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9e1a5f3d7b2'
+down_revision = 'b8f2d6e4c0a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('classification_labels',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('email_id', sa.String(length=36), nullable=False),
+    sa.Column('email_account_id', sa.String(length=36), nullable=False),
+    sa.Column('source', sa.String(length=10), nullable=False),
+    sa.Column('label', sa.String(length=20), nullable=False),
+    sa.Column('weight', sa.Float(), nullable=False),
+    sa.Column('previous_label', sa.String(length=20), nullable=True),
+    sa.Column('previous_model', sa.String(length=50), nullable=True),
+    sa.Column('local_prediction', sa.String(length=20), nullable=True),
+    sa.Column('local_confidence', sa.Float(), nullable=True),
+    sa.Column('model_version', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['email_account_id'], ['email_accounts.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['email_id'], ['emails.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('classification_labels', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_classification_labels_created_at'), ['created_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_classification_labels_email_account_id'), ['email_account_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_classification_labels_email_id'), ['email_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('classification_labels', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_classification_labels_email_id'))
+        batch_op.drop_index(batch_op.f('ix_classification_labels_email_account_id'))
+        batch_op.drop_index(batch_op.f('ix_classification_labels_created_at'))
+
+    op.drop_table('classification_labels')
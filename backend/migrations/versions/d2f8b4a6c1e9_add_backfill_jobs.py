@@ -0,0 +1,78 @@
+"""Add backfill jobs and their checkpointed windows
+
+Revision ID: d2f8b4a6c1e9
+Revises: c9e1a5f3d7b2
+Create Date: 2025-10-17 09:41:27.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2f8b4a6c1e9'
+down_revision = 'c9e1a5f3d7b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('backfill_jobs',
+    sa.Column('id', sa.String(length=36), nullable=False),
+    sa.Column('email_account_id', sa.String(length=36), nullable=False),
+    sa.Column('folder', sa.String(length=50), nullable=False),
+    sa.Column('range_start', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('range_end', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('window_days', sa.Integer(), nullable=False),
+    sa.Column('state', sa.String(length=20), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('lease_owner', sa.String(length=100), nullable=True),
+    sa.Column('lease_expires_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('windows_total', sa.Integer(), nullable=False),
+    sa.Column('windows_done', sa.Integer(), nullable=False),
+    sa.Column('windows_failed', sa.Integer(), nullable=False),
+    sa.Column('messages_fetched', sa.Integer(), nullable=False),
+    sa.Column('messages_inserted', sa.Integer(), nullable=False),
+    sa.Column('header_classified', sa.Integer(), nullable=False),
+    sa.Column('classification_queued', sa.Integer(), nullable=False),
+    sa.Column('active_seconds', sa.Float(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('started_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('completed_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['email_account_id'], ['email_accounts.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('backfill_jobs', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_backfill_jobs_email_account_id'), ['email_account_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_backfill_jobs_state'), ['state'], unique=False)
+
+    op.create_table('backfill_windows',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('job_id', sa.String(length=36), nullable=False),
+    sa.Column('window_start', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('window_end', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('state', sa.String(length=20), nullable=False),
+    sa.Column('next_link', sa.Text(), nullable=True),
+    sa.Column('messages_fetched', sa.Integer(), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('completed_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['job_id'], ['backfill_jobs.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('backfill_windows', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_backfill_windows_job_id'), ['job_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('backfill_windows', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_backfill_windows_job_id'))
+
+    op.drop_table('backfill_windows')
+    with op.batch_alter_table('backfill_jobs', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_backfill_jobs_state'))
+        batch_op.drop_index(batch_op.f('ix_backfill_jobs_email_account_id'))
+
+    op.drop_table('backfill_jobs')
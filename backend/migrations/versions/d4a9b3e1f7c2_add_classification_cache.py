@@ -0,0 +1,41 @@
+"""Add classification cache
+
+Revision ID: d4a9b3e1f7c2
+Revises: c1d7e2f4a8b6
+Create Date: 2025-10-08 11:27:33.640192
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4a9b3e1f7c2'
+down_revision = 'c1d7e2f4a8b6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('classification_cache',
+    sa.Column('cache_key', sa.String(length=64), nullable=False),
+    sa.Column('model', sa.String(length=50), nullable=False),
+    sa.Column('prompt_version', sa.String(length=20), nullable=False),
+    sa.Column('classification', sa.JSON(), nullable=False),
+    sa.Column('hit_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('last_used_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('cache_key')
+    )
+    with op.batch_alter_table('classification_cache', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_classification_cache_expires_at'), ['expires_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_classification_cache_last_used_at'), ['last_used_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('classification_cache', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_classification_cache_last_used_at'))
+        batch_op.drop_index(batch_op.f('ix_classification_cache_expires_at'))
+
+    op.drop_table('classification_cache')
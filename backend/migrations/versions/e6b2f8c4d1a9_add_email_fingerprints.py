@@ -0,0 +1,51 @@
+"""Add email fingerprints for near-duplicate detection
+
+Revision ID: e6b2f8c4d1a9
+Revises: d4a9b3e1f7c2
+Create Date: 2025-10-09 15:03:52.117840
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6b2f8c4d1a9'
+down_revision = 'd4a9b3e1f7c2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('email_fingerprints',
+    sa.Column('email_id', sa.String(length=36), nullable=False),
+    sa.Column('email_account_id', sa.String(length=36), nullable=False),
+    sa.Column('sender_email', sa.String(length=255), nullable=False),
+    sa.Column('simhash', sa.String(length=16), nullable=False),
+    sa.Column('band_0', sa.Integer(), nullable=False),
+    sa.Column('band_1', sa.Integer(), nullable=False),
+    sa.Column('band_2', sa.Integer(), nullable=False),
+    sa.Column('band_3', sa.Integer(), nullable=False),
+    sa.Column('band_4', sa.Integer(), nullable=False),
+    sa.Column('band_5', sa.Integer(), nullable=False),
+    sa.Column('band_6', sa.Integer(), nullable=False),
+    sa.Column('band_7', sa.Integer(), nullable=False),
+    sa.Column('duplicate_of_id', sa.String(length=36), nullable=True),
+    sa.Column('hamming_distance', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['duplicate_of_id'], ['emails.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['email_account_id'], ['email_accounts.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['email_id'], ['emails.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('email_id')
+    )
+    with op.batch_alter_table('email_fingerprints', schema=None) as batch_op:
+        batch_op.create_index('ix_email_fingerprints_account_sender', ['email_account_id', 'sender_email'], unique=False)
+        batch_op.create_index(batch_op.f('ix_email_fingerprints_duplicate_of_id'), ['duplicate_of_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('email_fingerprints', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_email_fingerprints_duplicate_of_id'))
+        batch_op.drop_index('ix_email_fingerprints_account_sender')
+
+    op.drop_table('email_fingerprints')
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Bulk Reclassification
+Reclassifies stored emails offline through the OpenAI Batch API, e.g. after a prompt change.
+
+Requests are written to a run directory, submitted as batches, polled and
+applied in bulk. The run is checkpointed after every step: re-running with
+the same --run-dir resumes it. With --dry-run nothing is written to the
+database; the diff report shows which urgencies would change, and resuming
+the run without --dry-run applies the same results.
+
+Usage:
+    python reclassify_bulk.py --dry-run                          # New run, report changes only
+    python reclassify_bulk.py --run-dir bulk_reclassify/<run>    # Resume (and apply) a run
+    python reclassify_bulk.py --backend local --limit 500        # Rules-engine stand-in, no provider calls
+    python reclassify_bulk.py --run-dir <run> --no-wait          # Submit / check once and exit
+"""
+
+import os
+import json
+import argparse
+import logging
+from datetime import datetime
+from app import create_app
+from app.services.bulk_reclassifier import BulkReclassifier, LocalBatchBackend, OpenAIBatchBackend
+from app.services.openai_service import OpenAIService
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description='Reclassify stored emails through the OpenAI Batch API')
+    parser.add_argument('--run-dir', help='Run directory; an existing run is resumed (default: a new one under BULK_RECLASSIFY_DIR)')
+    parser.add_argument('--backend', choices=['openai', 'local'], default='openai', help="'local' answers with the rules engine, for testing")
+    parser.add_argument('--dry-run', action='store_true', help='Report urgency changes without updating emails')
+    parser.add_argument('--limit', type=int, help='Only the first N classified emails (new runs)')
+    parser.add_argument('--account-id', help='Only emails of this email account (new runs)')
+    parser.add_argument('--poll-interval', type=float, help='Seconds between batch status checks (default: BULK_RECLASSIFY_POLL_SECONDS)')
+    parser.add_argument('--no-wait', action='store_true', help='Submit and check once instead of waiting for every batch')
+    args = parser.parse_args()
+    
+    app = create_app()
+    
+    with app.app_context():
+        run_dir = args.run_dir or os.path.join(
+            app.config['BULK_RECLASSIFY_DIR'], datetime.now().strftime('%Y%m%d-%H%M%S')
+        )
+        service = OpenAIService(app.config)
+        
+        if args.backend == 'local':
+            backend = LocalBatchBackend(os.path.join(run_dir, 'local-batches'))
+        else:
+            if service.client is None:
+                logger.error("OpenAI client not configured - set OPENAI_API_KEY or use --backend local")
+                return
+            backend = OpenAIBatchBackend(service.client)
+        
+        reclassifier = BulkReclassifier(app.config, backend, run_dir, service=service)
+        if reclassifier.prepared:
+            logger.info(f"Resuming run {run_dir} ({reclassifier.state['total']} emails)")
+        elif not reclassifier.prepare(limit=args.limit, account_id=args.account_id):
+            logger.info("No classified emails to reclassify")
+            return
+        
+        report = reclassifier.run(
+            poll_interval=args.poll_interval or app.config['BULK_RECLASSIFY_POLL_SECONDS'],
+            dry_run=args.dry_run,
+            wait=not args.no_wait
+        )
+        
+        print(f"\n=== {'DRY RUN - ' if args.dry_run else ''}BULK RECLASSIFICATION ({run_dir}) ===")
+        print(json.dumps(report, indent=2))
+        print(f"Changed emails are listed in {os.path.join(run_dir, 'changes-*.jsonl')}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Mailbox Sync
+Delta-syncs the folders of every account due for sync, all accounts and folders concurrently.
+
+Meant to run on a schedule next to the classification worker. Each folder
+continues from the watermark /sync stores, so both can be used together.
+
+Usage:
+    python sync_mailboxes.py                                   # Accounts due for sync, SYNC_FOLDERS
+    python sync_mailboxes.py --account user@example.com
+    python sync_mailboxes.py --folders inbox,archive
+"""
+
+import json
+import argparse
+import logging
+from app import create_app, db
+from app.models.email_account import EmailAccount
+from app.services.mailbox_sync import MailboxSync
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description='Sync Email Manager IA mailboxes concurrently')
+    parser.add_argument('--account', help='Email address or id of one email account (default: accounts due for sync)')
+    parser.add_argument('--folders', help='Comma-separated mail folders (default: SYNC_FOLDERS)')
+    args = parser.parse_args()
+    
+    app = create_app()
+    
+    with app.app_context():
+        if args.account:
+            accounts = EmailAccount.query.filter(
+                db.or_(EmailAccount.id == args.account, EmailAccount.email_address == args.account),
+                EmailAccount.is_active == True
+            ).all()
+            if not accounts:
+                logger.error(f"No active email account {args.account}")
+                return
+        else:
+            accounts = EmailAccount.get_accounts_for_sync()
+        
+        folders = [folder.strip() for folder in args.folders.split(',') if folder.strip()] if args.folders else None
+        report = MailboxSync(app.config).sync(accounts, folders)
+        print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
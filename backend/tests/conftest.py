@@ -0,0 +1,99 @@
+"""Shared fixtures: an app on in-memory SQLite, a connected account and a fake Graph."""
+
+import json
+from datetime import datetime, timezone
+import pytest
+from app import create_app, db
+from app.models.user import User
+from app.models.email import Email
+from app.models.email_account import EmailAccount
+from app.services import graph_http
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+@pytest.fixture
+def email_account(app):
+    user = User(email='directora@example.com', full_name='Directora')
+    db.session.add(user)
+    db.session.commit()
+    
+    account = EmailAccount(
+        user_id=user.id,
+        email_address='directora@example.com',
+        display_name='Directora',
+        provider='microsoft',
+        access_token='token',
+        is_active=True
+    )
+    db.session.add(account)
+    db.session.commit()
+    return account
+
+@pytest.fixture
+def make_email(email_account):
+    """Create and commit a stored email."""
+    def make(microsoft_email_id, **fields):
+        email = Email(
+            email_account_id=email_account.id,
+            microsoft_email_id=microsoft_email_id,
+            sender_name='Estudiante',
+            sender_email='estudiante@example.com',
+            subject=f'Consulta {microsoft_email_id}',
+            received_at=datetime(2026, 10, 1, 10, 0, tzinfo=timezone.utc),
+            **fields
+        )
+        db.session.add(email)
+        db.session.commit()
+        return email
+    return make
+
+def graph_message(message_id, **fields):
+    """A message as Graph lists it."""
+    message = {
+        'id': message_id,
+        'subject': f'Consulta {message_id}',
+        'from': {'emailAddress': {'name': 'Estudiante', 'address': 'estudiante@example.com'}},
+        'receivedDateTime': '2026-10-01T10:00:00Z',
+        'bodyPreview': f'Texto del correo {message_id}',
+        'isRead': False
+    }
+    message.update(fields)
+    return message
+
+class FakeResponse:
+    def __init__(self, status_code=200, body=None, headers=None):
+        self.status_code = status_code
+        self._body = body if body is not None else {}
+        self.headers = headers or {}
+        self.text = json.dumps(self._body)
+    
+    def json(self):
+        return self._body
+
+class FakeGraph:
+    """Answers Graph requests with queued responses and records the requested URLs."""
+    
+    def __init__(self):
+        self.responses = []
+        self.urls = []
+    
+    def respond(self, status_code=200, body=None, headers=None):
+        self.responses.append(FakeResponse(status_code, body, headers))
+    
+    def request(self, method, url, headers=None, params=None, **kwargs):
+        self.urls.append(url)
+        return self.responses.pop(0)
+
+@pytest.fixture
+def graph(monkeypatch):
+    fake = FakeGraph()
+    monkeypatch.setattr(graph_http, 'get_graph_session', lambda config: fake)
+    monkeypatch.setattr(graph_http.time, 'sleep', lambda seconds: None)
+    return fake
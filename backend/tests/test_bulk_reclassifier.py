@@ -0,0 +1,53 @@
+"""Bulk reclassification resubmits what an expired batch left unanswered."""
+
+import pytest
+from app.services.bulk_reclassifier import BulkReclassifier, LocalBatchBackend
+
+class ExpiringBackend(LocalBatchBackend):
+    """Expires the first batch after answering its first request."""
+    
+    def __init__(self, jobs_dir):
+        super().__init__(jobs_dir)
+        self.batches = []
+    
+    def submit(self, request_path):
+        self.batches.append(super().submit(request_path))
+        return self.batches[-1]
+    
+    def poll(self, batch_id):
+        status, output = super().poll(batch_id)
+        if batch_id == self.batches[0]:
+            return 'expired', output.splitlines(keepends=True)[0]
+        return status, output
+
+@pytest.fixture
+def emails(make_email):
+    return [
+        make_email(f'bulk-{n}', urgency_category='low', is_classified=True, classification_model='gpt-4o-mini')
+        for n in range(3)
+    ]
+
+def test_expired_batch_resubmits_unanswered_requests(app, emails, tmp_path):
+    backend = ExpiringBackend(str(tmp_path / 'batches'))
+    reclassifier = BulkReclassifier(app.config, backend, str(tmp_path / 'run'))
+    reclassifier.prepare()
+    
+    report = reclassifier.run(poll_interval=0)
+    
+    first, retry = reclassifier.state['parts']
+    assert first['status'] == 'applied' and first['retry_part'] == 1
+    assert retry['status'] == 'applied' and retry['retry_of'] == 0 and retry['count'] == 2
+    assert len(backend.batches) == 2
+    assert report['emails'] == 3 and report['answered'] == 3 and report['missing'] == 0
+
+def test_expired_batch_without_output_resubmits_every_request(app, emails, tmp_path):
+    backend = ExpiringBackend(str(tmp_path / 'batches'))
+    backend.poll = lambda batch_id: ('expired', '') if batch_id == backend.batches[0] \
+        else LocalBatchBackend.poll(backend, batch_id)
+    reclassifier = BulkReclassifier(app.config, backend, str(tmp_path / 'run'))
+    reclassifier.prepare()
+    
+    report = reclassifier.run(poll_interval=0)
+    
+    assert reclassifier.state['parts'][1]['count'] == 3
+    assert report['emails'] == 3 and report['answered'] == 3
@@ -0,0 +1,65 @@
+"""Email.bulk_upsert_from_graph counts and stored values."""
+
+from app import db
+from app.models.email import Email
+from conftest import graph_message
+
+def test_inserts_new_messages(email_account):
+    result = Email.bulk_upsert_from_graph(email_account, [graph_message('m1'), graph_message('m2')])
+    db.session.commit()
+    
+    assert (result['inserted'], result['updated'], result['unchanged'], result['skipped']) == (2, 0, 0, 0)
+    assert {row['microsoft_email_id'] for row in result['inserted_rows']} == {'m1', 'm2'}
+    assert Email.query.count() == 2
+
+def test_updates_only_changed_state(email_account, make_email):
+    make_email('read', is_read=False)
+    make_email('same', is_read=False)
+    make_email('flagged', is_starred=False)
+    
+    result = Email.bulk_upsert_from_graph(email_account, [
+        graph_message('read', isRead=True),
+        graph_message('same', isRead=False),
+        graph_message('flagged', flag={'flagStatus': 'flagged'}),
+        graph_message('new')
+    ])
+    db.session.commit()
+    
+    assert (result['inserted'], result['updated'], result['unchanged'], result['skipped']) == (1, 2, 1, 0)
+    assert Email.query.filter_by(microsoft_email_id='read').one().is_read is True
+    assert Email.query.filter_by(microsoft_email_id='flagged').one().is_starred is True
+
+def test_delta_payload_without_state_is_unchanged(email_account, make_email):
+    make_email('m1', is_read=True)
+    
+    result = Email.bulk_upsert_from_graph(email_account, [{'id': 'm1', 'subject': 'Renamed'}])
+    
+    assert (result['updated'], result['unchanged']) == (0, 1)
+
+def test_skips_messages_without_id_or_fields(email_account):
+    result = Email.bulk_upsert_from_graph(email_account, [
+        {'subject': 'No id'},
+        {'id': 'no-date', 'subject': 'No receivedDateTime'},
+        graph_message('m1')
+    ])
+    db.session.commit()
+    
+    assert (result['inserted'], result['skipped']) == (1, 2)
+
+def test_keeps_last_occurrence_of_duplicates(email_account):
+    result = Email.bulk_upsert_from_graph(email_account, [graph_message('m1'), graph_message('m1', isRead=True)])
+    db.session.commit()
+    
+    assert result['inserted'] == 1
+    assert Email.query.one().is_read is True
+
+def test_insert_new_false_only_updates(email_account, make_email):
+    make_email('known', is_read=False)
+    
+    result = Email.bulk_upsert_from_graph(
+        email_account, [graph_message('known', isRead=True), graph_message('unknown')], insert_new=False
+    )
+    db.session.commit()
+    
+    assert (result['inserted'], result['updated']) == (0, 1)
+    assert Email.query.count() == 1
@@ -0,0 +1,62 @@
+"""Confidence routing of the classification cascade."""
+
+from app.services.classification_cascade import ClassificationCascade, CascadeStats
+
+URGENT_WORD_ONLY = {'subject': 'Taller de pensamiento crítico', 'body_preview': 'Les comparto el material', 'sender_email': 'x@example.com'}
+
+def full_answer(emails_data):
+    return [{'urgency_category': 'medium', 'confidence_score': 0.8, 'reasoning': 'full', 'classification_model': 'full'} for _ in emails_data]
+
+class Lightweight:
+    def __init__(self, confidence):
+        self.confidence = confidence
+        self.calls = 0
+    
+    def _lightweight_classification(self, email_data):
+        self.calls += 1
+        return {'urgency_category': 'low', 'confidence_score': self.confidence, 'reasoning': 'lite', 'classification_model': 'lite:x'}
+
+def test_rules_stage_is_off_by_default(app):
+    stats = CascadeStats()
+    cascade = ClassificationCascade(app.config, stats=stats)
+    
+    [result] = cascade.classify([URGENT_WORD_ONLY], full_answer, lightweight=False)
+    
+    assert result['classification_model'] == 'full'
+    assert stats.snapshot()['rules']['answered'] == 0
+
+def test_rules_stage_answers_above_a_lowered_threshold(app):
+    cascade = ClassificationCascade(dict(app.config, CASCADE_RULES_THRESHOLD=0.85), stats=CascadeStats())
+    
+    [result] = cascade.classify([URGENT_WORD_ONLY], full_answer, lightweight=False)
+    
+    assert result['classification_model'] == 'rules'
+    assert result['urgency_category'] == 'urgent'
+
+def test_lightweight_answers_only_when_confident(app):
+    confident = ClassificationCascade(app.config, lightweight_provider=Lightweight(0.9), stats=CascadeStats())
+    unsure = ClassificationCascade(app.config, lightweight_provider=Lightweight(0.5), stats=CascadeStats())
+    
+    assert confident.classify([URGENT_WORD_ONLY], full_answer)[0]['classification_model'] == 'lite:x'
+    assert unsure.classify([URGENT_WORD_ONLY], full_answer)[0]['classification_model'] == 'full'
+
+def test_batches_skip_the_lightweight_stage(app):
+    provider = Lightweight(0.9)
+    cascade = ClassificationCascade(app.config, lightweight_provider=provider, stats=CascadeStats())
+    
+    results = cascade.classify([URGENT_WORD_ONLY, URGENT_WORD_ONLY], full_answer, lightweight=False)
+    
+    assert [result['classification_model'] for result in results] == ['full', 'full']
+    assert provider.calls == 0
+
+def test_failing_full_stage_falls_back_to_rules(app):
+    stats = CascadeStats()
+    cascade = ClassificationCascade(app.config, stats=stats)
+    
+    def failing(emails_data):
+        raise RuntimeError('provider down')
+    
+    [result] = cascade.classify([URGENT_WORD_ONLY], failing, lightweight=False)
+    
+    assert result['classification_model'] == 'rules'
+    assert stats.snapshot()['full']['errors'] == 1
@@ -0,0 +1,80 @@
+"""Classification queue: enqueueing, leasing and retries."""
+
+from datetime import datetime, timedelta, timezone
+from app import db
+from app.models.classification_job import ClassificationJob
+
+def _as_utc(value):
+    # SQLite hands back naive datetimes
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+def test_enqueue_keeps_the_active_job(make_email):
+    email = make_email('m1')
+    first = ClassificationJob.enqueue([email])
+    db.session.commit()
+    second = ClassificationJob.enqueue([email])
+    db.session.commit()
+    
+    assert [job.id for job in second] == [job.id for job in first]
+    assert ClassificationJob.query.count() == 1
+
+def test_claim_leases_due_jobs_by_priority(make_email):
+    low, urgent, later = make_email('low'), make_email('urgent'), make_email('later')
+    ClassificationJob.enqueue([low], priority=4)
+    ClassificationJob.enqueue([urgent], priority=1)
+    ClassificationJob.enqueue([later], priority=1)[0].not_before = datetime.now(timezone.utc) + timedelta(minutes=5)
+    db.session.commit()
+    
+    jobs = ClassificationJob.claim('worker-1', limit=5)
+    
+    assert [job.email_id for job in jobs] == [urgent.id, low.id]
+    for job in jobs:
+        assert job.state == 'leased'
+        assert job.lease_owner == 'worker-1'
+        assert job.attempts == 1
+    assert ClassificationJob.claim('worker-2', limit=5) == []
+
+def test_claim_respects_limit(make_email):
+    ClassificationJob.enqueue([make_email(f'm{i}') for i in range(3)])
+    db.session.commit()
+    
+    assert len(ClassificationJob.claim('worker-1', limit=2)) == 2
+    assert len(ClassificationJob.claim('worker-2', limit=2)) == 1
+
+def test_claim_takes_over_expired_lease(make_email):
+    ClassificationJob.enqueue([make_email('m1')])
+    db.session.commit()
+    job = ClassificationJob.claim('crashed-worker', limit=1)[0]
+    job.lease_expires_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+    db.session.commit()
+    
+    reclaimed = ClassificationJob.claim('worker-2', limit=1)
+    
+    assert [job.lease_owner for job in reclaimed] == ['worker-2']
+    assert reclaimed[0].attempts == 2
+
+def test_retry_later_backs_off(make_email):
+    ClassificationJob.enqueue([make_email('m1')])
+    db.session.commit()
+    job = ClassificationJob.claim('worker-1', limit=1)[0]
+    
+    job.retry_later('Rate limit reached', base_delay=30)
+    db.session.commit()
+    
+    assert job.state == 'queued'
+    assert job.lease_owner is None
+    assert job.last_error == 'Rate limit reached'
+    assert _as_utc(job.not_before) >= datetime.now(timezone.utc) + timedelta(seconds=25)
+    assert ClassificationJob.claim('worker-1', limit=1) == []
+
+def test_retry_later_fails_when_out_of_attempts(make_email):
+    ClassificationJob.enqueue([make_email('m1')], max_attempts=1)
+    db.session.commit()
+    job = ClassificationJob.claim('worker-1', limit=1)[0]
+    
+    job.retry_later('Provider error')
+    db.session.commit()
+    
+    assert job.state == 'failed'
+    assert job.completed_at is not None
+    assert ClassificationJob.get_queue_stats()['failed'] == 1
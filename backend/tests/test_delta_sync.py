@@ -0,0 +1,81 @@
+"""Delta pages from Graph: splitting, paging and expired watermarks."""
+
+import pytest
+from app import db
+from app.routes.emails import _delta_pages
+from app.services.microsoft_graph import MicrosoftGraphService, GraphRequestError, split_delta_page
+from conftest import graph_message
+
+DELTA_URL = 'https://graph.microsoft.com/v1.0/me/mailFolders/inbox/messages/delta'
+
+def test_split_delta_page_separates_removed_messages():
+    page = split_delta_page({
+        'value': [graph_message('m1'), {'id': 'm2', '@removed': {'reason': 'deleted'}}],
+        '@odata.nextLink': f'{DELTA_URL}?$skiptoken=1'
+    })
+    
+    assert [message['id'] for message in page['value']] == ['m1']
+    assert page['removed'] == ['m2']
+    assert page['@odata.nextLink'] == f'{DELTA_URL}?$skiptoken=1'
+    assert '@odata.deltaLink' not in page
+
+def test_split_delta_page_requires_a_watermark():
+    with pytest.raises(GraphRequestError):
+        split_delta_page({'value': [graph_message('m1')]})
+
+def test_iter_delta_pages_follows_next_links(app, graph):
+    graph.respond(body={'value': [graph_message('m1')], '@odata.nextLink': f'{DELTA_URL}?$skiptoken=1'})
+    graph.respond(body={'value': [graph_message('m2')], '@odata.deltaLink': f'{DELTA_URL}?$deltatoken=2'})
+    
+    pages = list(MicrosoftGraphService().iter_delta_pages('token', page_size=1))
+    
+    assert [[message['id'] for message in page['value']] for page in pages] == [['m1'], ['m2']]
+    assert pages[-1]['@odata.deltaLink'] == f'{DELTA_URL}?$deltatoken=2'
+    assert graph.urls == [DELTA_URL, f'{DELTA_URL}?$skiptoken=1']
+
+def test_iter_delta_pages_raises_410_for_expired_watermark(app, graph):
+    graph.respond(410, {'error': {'code': 'SyncStateNotFound'}})
+    
+    with pytest.raises(GraphRequestError) as error:
+        list(MicrosoftGraphService().iter_delta_pages('token', delta_link=f'{DELTA_URL}?$deltatoken=old'))
+    assert error.value.status_code == 410
+    assert error.value.kind == 'gone'
+
+def test_delta_pages_resume_from_stored_watermark(app, graph, email_account):
+    email_account.set_delta_link('inbox', f'{DELTA_URL}?$deltatoken=1')
+    db.session.commit()
+    graph.respond(body={'value': [graph_message('m1')], '@odata.deltaLink': f'{DELTA_URL}?$deltatoken=2'})
+    
+    pages = list(_delta_pages(MicrosoftGraphService(), email_account, 'inbox', page_size=50))
+    
+    assert len(pages) == 1
+    assert graph.urls == [f'{DELTA_URL}?$deltatoken=1']
+
+def test_delta_pages_restart_round_when_watermark_expired(app, graph, email_account):
+    email_account.set_delta_link('inbox', f'{DELTA_URL}?$deltatoken=old')
+    db.session.commit()
+    graph.respond(410, {'error': {'code': 'SyncStateNotFound'}})
+    graph.respond(body={'value': [graph_message('m1')], '@odata.nextLink': f'{DELTA_URL}?$skiptoken=1'})
+    graph.respond(body={'value': [graph_message('m2')], '@odata.deltaLink': f'{DELTA_URL}?$deltatoken=new'})
+    
+    pages = list(_delta_pages(MicrosoftGraphService(), email_account, 'inbox', page_size=50))
+    
+    assert [[message['id'] for message in page['value']] for page in pages] == [['m1'], ['m2']]
+    assert graph.urls == [f'{DELTA_URL}?$deltatoken=old', DELTA_URL, f'{DELTA_URL}?$skiptoken=1']
+    assert email_account.get_delta_link('inbox') is None  # The caller stores the new round's watermarks
+
+def test_delta_pages_raise_410_without_stored_watermark(app, graph, email_account):
+    graph.respond(410, {'error': {'code': 'SyncStateNotFound'}})
+    
+    with pytest.raises(GraphRequestError):
+        list(_delta_pages(MicrosoftGraphService(), email_account, 'inbox', page_size=50))
+
+def test_delta_pages_raise_other_errors(app, graph, email_account):
+    email_account.set_delta_link('inbox', f'{DELTA_URL}?$deltatoken=1')
+    db.session.commit()
+    graph.respond(401, {'error': {'code': 'InvalidAuthenticationToken'}})
+    
+    with pytest.raises(GraphRequestError) as error:
+        list(_delta_pages(MicrosoftGraphService(), email_account, 'inbox', page_size=50))
+    assert error.value.is_auth_error
+    assert email_account.get_delta_link('inbox') == f'{DELTA_URL}?$deltatoken=1'
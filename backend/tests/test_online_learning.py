@@ -0,0 +1,60 @@
+"""Online learning resumes from labels the local model has not learned yet, including late commits."""
+
+import pytest
+from app import db
+from app.models.classification_label import ClassificationLabel
+from app.services.local_classifier import LocalClassifier, save_model_version
+from app.services.online_learning import OnlineLearner
+
+@pytest.fixture
+def learner(app, tmp_path):
+    app.config.update(
+        LOCAL_CLASSIFIER_PATH=str(tmp_path / 'local_classifier.npz'),
+        LOCAL_CLASSIFIER_KEEP_VERSIONS=0,
+        LOCAL_CLASSIFIER_ONLINE_MIN_EXAMPLES=1,
+        LOCAL_CLASSIFIER_ONLINE_RESCAN_IDS=10
+    )
+    save_model_version(LocalClassifier(dim=2 ** 8), app.config)
+    return OnlineLearner(app.config)
+
+@pytest.fixture
+def label(make_email, email_account):
+    def label(label_id):
+        email = make_email(f'label-{label_id}')
+        db.session.add(ClassificationLabel(
+            id=label_id, email_id=email.id, email_account_id=email_account.id, source='ai', label='low'
+        ))
+        db.session.commit()
+    return label
+
+def model(learner):
+    return LocalClassifier.load(learner.path)
+
+def test_learns_new_labels_once(learner, label):
+    for label_id in (1, 2, 3):
+        label(label_id)
+    
+    assert learner.update()['examples'] == 3
+    assert learner.pending(model(learner)) == 0
+    assert learner.update() is None
+
+def test_learns_labels_committed_after_higher_ids(learner, label):
+    label(1)
+    label(3)
+    learner.update()
+    
+    label(2)  # Id taken before 3, committed after it was learned
+    
+    assert learner.pending(model(learner)) == 1
+    summary = learner.update()
+    assert summary['examples'] == 1
+    assert summary['last_label_id'] == 3
+    assert model(learner).metadata['online_examples'] == 3
+
+def test_forgets_learned_ids_below_the_rescan_window(learner, label):
+    label(1)
+    label(20)
+    learner.update()
+    
+    assert model(learner).metadata['learned_label_ids'] == [20]
+    assert learner.pending(model(learner)) == 0
@@ -0,0 +1,153 @@
+"""Circuit breakers and failover between AI providers."""
+
+import httpx
+import openai
+import pytest
+from app.services import circuit_breaker
+from app.services.ai_service import AIService
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.services.openai_service import OpenAIService
+
+EMAIL = {'email_id': 'e1', 'subject': 'Cambio de sala', 'body_preview': 'La clase se mueve a la sala 204', 'sender_email': 'x@example.com'}
+
+def server_error():
+    request = httpx.Request('POST', 'https://api.openai.com/v1/chat/completions')
+    return openai.InternalServerError('Service Unavailable', response=httpx.Response(503, request=request), body=None)
+
+class DownCompletions:
+    def __init__(self):
+        self.calls = 0
+    
+    def create(self, **request):
+        self.calls += 1
+        raise server_error()
+
+class DownClient:
+    def __init__(self):
+        self.completions = DownCompletions()
+        self.chat = self
+
+class AsyncDownClient(DownClient):
+    def __init__(self):
+        super().__init__()
+        self.completions = self
+        self.calls = 0
+    
+    async def create(self, **request):
+        self.calls += 1
+        raise server_error()
+
+class HealthyGemini:
+    """Stands in for GeminiService: answers every email."""
+    
+    model_name = 'gemini-test'
+    
+    def __init__(self):
+        self.client = object()
+        self.breaker = CircuitBreaker('gemini-test')
+        self.emails = []
+    
+    def _answer(self, email_data):
+        self.emails.append(email_data['email_id'])
+        return {'urgency_category': 'low', 'confidence_score': 0.9, 'reasoning': 'gemini'}
+    
+    def classify_email(self, email_data):
+        return self._answer(email_data)
+    
+    def classify_batch(self, emails_data, batch_size=5):
+        return [self._answer(email_data) for email_data in emails_data]
+
+@pytest.fixture
+def openai_down(app):
+    service = OpenAIService(app.config)
+    service.client = DownClient()
+    service._async_client = AsyncDownClient()
+    service.breaker = CircuitBreaker('openai-test', min_calls=100)
+    return service
+
+@pytest.fixture
+def ai_service(app, openai_down):
+    service = AIService()
+    service.openai_service = openai_down
+    service.gemini_service = HealthyGemini()
+    service.hedger = None
+    return service
+
+def test_openai_outage_returns_retry_marker_not_rules(openai_down):
+    classification = openai_down.classify_email(EMAIL)
+    
+    assert classification.get('rate_limit_retry') is True
+    assert classification.get('classification_model') != 'rules'
+
+def test_openai_open_circuit_returns_retry_marker(openai_down):
+    assert openai_down._handle_api_error(CircuitOpenError('open'), EMAIL).get('rate_limit_retry') is True
+
+def test_openai_client_error_still_uses_rules(openai_down):
+    request = httpx.Request('POST', 'https://api.openai.com/v1/chat/completions')
+    error = openai.BadRequestError('bad request', response=httpx.Response(400, request=request), body=None)
+    
+    assert openai_down._handle_api_error(error, EMAIL)['classification_model'] == 'rules'
+
+def test_single_email_fails_over_to_gemini(ai_service, openai_down):
+    classification = ai_service._classify_email_remote(EMAIL)
+    
+    assert openai_down.client.completions.calls == 1
+    assert classification['reasoning'] == 'gemini'
+    assert ai_service.gemini_service.emails == ['e1']
+
+def test_batch_fails_over_to_gemini(ai_service, openai_down):
+    emails = [dict(EMAIL, email_id=f'e{i}', subject=f'Cambio de sala {i}') for i in range(3)]
+    
+    classifications = ai_service._classify_batch_remote(emails, batch_size=3)
+    
+    assert openai_down._async_client.calls >= 1
+    assert [classification['reasoning'] for classification in classifications] == ['gemini'] * 3
+    assert sorted(ai_service.gemini_service.emails) == ['e0', 'e1', 'e2']
+
+def test_all_providers_down_retries_later(ai_service):
+    ai_service.gemini_service = None
+    
+    assert ai_service._classify_email_remote(EMAIL).get('rate_limit_retry') is True
+    assert all(result.get('rate_limit_retry') for result in ai_service._classify_batch_remote([EMAIL], batch_size=1))
+
+def test_breaker_opens_fails_fast_and_recovers(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(circuit_breaker.time, 'time', lambda: clock[0])
+    breaker = CircuitBreaker('test', min_calls=2, failure_threshold=0.5, cooldown_seconds=30)
+    
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            breaker.call(lambda: (_ for _ in ()).throw(RuntimeError('down')))
+    
+    assert breaker.snapshot()['state'] == 'open'
+    assert breaker.health_score() == 0
+    with pytest.raises(CircuitOpenError):
+        breaker.guard()
+    
+    clock[0] += 31
+    breaker.guard()  # Cooldown over: this call is the half-open probe
+    assert not breaker.available()  # Only one probe at a time
+    breaker.call(lambda: 'ok')
+    assert breaker.snapshot()['state'] == 'closed'
+
+def test_breaker_reopens_on_failed_probe(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(circuit_breaker.time, 'time', lambda: clock[0])
+    breaker = CircuitBreaker('test', min_calls=1, cooldown_seconds=30)
+    breaker.record(False, 0.1)
+    clock[0] += 31
+    
+    breaker.guard()
+    breaker.record(False, 0.1)
+    
+    assert breaker.snapshot()['state'] == 'open'
+
+def test_rate_limits_do_not_count_against_health():
+    breaker = CircuitBreaker('test', min_calls=1)
+    request = httpx.Request('POST', 'https://api.openai.com/v1/chat/completions')
+    error = openai.RateLimitError('slow down', response=httpx.Response(429, request=request), body=None)
+    
+    with pytest.raises(openai.RateLimitError):
+        breaker.call(lambda: (_ for _ in ()).throw(error))
+    
+    assert breaker.snapshot()['window_calls'] == 0
@@ -0,0 +1,85 @@
+"""Sender prior accounting: which classifications and corrections move the sender counts."""
+
+import pytest
+from flask_jwt_extended import create_access_token
+from app import db
+from app.models.email import USER_CORRECTION_MODEL
+from app.models.sender_reputation import SenderReputation
+from app.services.sender_reputation import SenderReputationIndex, SENDER_PRIOR_MODEL
+from app.services.keyword_rules import RULES_MODEL
+
+@pytest.fixture
+def index(app):
+    return SenderReputationIndex(config={'SENDER_PRIOR_MIN_SAMPLES': 3, 'SENDER_PRIOR_AUDIT_RATE': 0.0})
+
+def counts(email_account, kind='sender', key='estudiante@example.com'):
+    row = db.session.get(SenderReputation, (email_account.id, kind, key))
+    return dict(row.counts, corrections=row.correction_count) if row else None
+
+def classified(make_email, message_id, category, model):
+    return make_email(message_id, urgency_category=category, is_classified=True, classification_model=model)
+
+def test_only_ai_answers_are_counted(app, index, make_email, email_account):
+    emails = [
+        classified(make_email, 'ai', 'low', 'gpt-4o-mini'),
+        classified(make_email, 'rules', 'low', RULES_MODEL),
+        classified(make_email, 'prior', 'low', SENDER_PRIOR_MODEL)
+    ]
+    
+    index.record_classifications(emails)
+    
+    assert counts(email_account)['low'] == 1
+    assert counts(email_account, 'domain', 'example.com')['low'] == 1
+
+def test_correcting_an_ai_answer_moves_its_count(app, index, make_email, email_account):
+    email = classified(make_email, 'ai', 'low', 'gpt-4o-mini')
+    index.record_classifications([email])
+    
+    index.record_correction(email, 'low', 'gpt-4o-mini', 'urgent')
+    
+    assert counts(email_account) == {'urgent': 1, 'high': 0, 'medium': 0, 'low': 0, 'corrections': 1}
+
+def test_correcting_a_prior_answer_keeps_the_counts_it_came_from(app, index, make_email, email_account):
+    ai_emails = [classified(make_email, f'ai-{n}', 'low', 'gpt-4o-mini') for n in range(3)]
+    index.record_classifications(ai_emails)
+    email = classified(make_email, 'prior', 'low', SENDER_PRIOR_MODEL)
+    index.record_classifications([email])
+    
+    index.record_correction(email, 'low', SENDER_PRIOR_MODEL, 'high')
+    
+    assert counts(email_account) == {'urgent': 0, 'high': 1, 'medium': 0, 'low': 3, 'corrections': 1}
+
+def test_correcting_a_correction_moves_its_count(app, index, make_email, email_account):
+    email = classified(make_email, 'rules', 'low', RULES_MODEL)
+    index.record_correction(email, 'low', RULES_MODEL, 'high')
+    
+    index.record_correction(email, 'high', USER_CORRECTION_MODEL, 'urgent')
+    
+    assert counts(email_account) == {'urgent': 1, 'high': 0, 'medium': 0, 'low': 0, 'corrections': 2}
+
+def test_settled_prior_answers(app, index, make_email, email_account):
+    index.record_classifications([classified(make_email, f'ai-{n}', 'low', 'gpt-4o-mini') for n in range(3)])
+    
+    [prior] = index.classify_many([{
+        'email_account_id': email_account.id, 'sender_email': 'Estudiante@Example.com',
+        'subject': 'Consulta', 'body_preview': 'Texto del correo'
+    }])
+    
+    assert prior['classification_model'] == SENDER_PRIOR_MODEL
+    assert prior['urgency_category'] == 'low'
+
+def test_update_urgency_keeps_counts_of_prior_answers(app, make_email, email_account):
+    app.config.update(SENDER_PRIOR_MIN_SAMPLES=3)
+    SenderReputationIndex().record_classifications(
+        [classified(make_email, f'ai-{n}', 'low', 'gpt-4o-mini') for n in range(3)]
+    )
+    email = classified(make_email, 'prior', 'low', SENDER_PRIOR_MODEL)
+    token = create_access_token(identity=email_account.user_id)
+    
+    response = app.test_client().post(
+        f'/api/emails/{email.id}/update-urgency', json={'urgency_category': 'high'},
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    
+    assert response.status_code == 200
+    assert counts(email_account) == {'urgent': 0, 'high': 1, 'medium': 0, 'low': 3, 'corrections': 1}
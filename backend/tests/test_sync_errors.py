@@ -0,0 +1,54 @@
+"""Status codes of /sync and /sync-status when Graph or storing emails fails."""
+
+import pytest
+from flask_jwt_extended import create_access_token
+from app.models.email import Email
+from app.routes import emails as email_routes
+from conftest import graph_message
+
+@pytest.fixture
+def post(app, email_account):
+    client = app.test_client()
+    
+    def post(path, body=None):
+        token = create_access_token(identity=email_account.user_id)
+        return client.post(path, json=body or {}, headers={'Authorization': f'Bearer {token}'})
+    return post
+
+def test_sync_maps_throttling_to_503(graph, post):
+    graph.respond(429, {'error': {'code': 'TooManyRequests'}}, headers={'Retry-After': '600'})
+    
+    response = post('/api/emails/sync', {'mode': 'full'})
+    
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '600'
+
+@pytest.mark.parametrize('status_code, expected', [(401, 401), (403, 401), (500, 502)])
+def test_sync_maps_graph_errors(graph, post, status_code, expected):
+    for _ in range(5):
+        graph.respond(status_code, {'error': {'code': 'Error'}})
+    
+    assert post('/api/emails/sync', {'mode': 'full'}).status_code == expected
+
+def test_storage_failure_is_not_reported_as_graph_error(graph, post, monkeypatch):
+    graph.respond(body={'value': [graph_message('m1')]})
+    
+    def broken_ingest(*args, **kwargs):
+        raise RuntimeError('database is locked')
+    monkeypatch.setattr(email_routes, 'ingest_messages', broken_ingest)
+    
+    response = post('/api/emails/sync', {'mode': 'full'})
+    
+    assert response.status_code == 500
+    assert response.get_json()['error'] == 'Email synchronization failed'
+    assert Email.query.count() == 0
+
+def test_sync_status_storage_failure_returns_500(graph, post, email_account, monkeypatch):
+    email_account.set_delta_link('inbox', 'https://graph.microsoft.com/v1.0/me/mailFolders/inbox/messages/delta?$deltatoken=1')
+    graph.respond(body={'value': [graph_message('m1')], '@odata.deltaLink': 'https://graph/delta?$deltatoken=2'})
+    
+    def broken_ingest(*args, **kwargs):
+        raise RuntimeError('database is locked')
+    monkeypatch.setattr(email_routes, 'ingest_messages', broken_ingest)
+    
+    assert post('/api/emails/sync-status').status_code == 500
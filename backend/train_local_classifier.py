@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Train the Local Classifier
+Fits the hashed n-gram model on the classified emails and saves it to LOCAL_CLASSIFIER_PATH.
+
+Labels come from AI classifications (weighted by their confidence) and from
+urgencies corrected through /update-urgency. Every save is a new model
+version, which running processes pick up on their next classification.
+Between retrainings the classification worker keeps the model learning from
+new labels; --online runs one such update right away.
+
+Usage:
+    python train_local_classifier.py                # Train on every classified email
+    python train_local_classifier.py --limit 20000  # Only the most recently classified emails
+    python train_local_classifier.py --online       # Learn from the labels recorded since the last version
+"""
+
+import argparse
+import logging
+from app import create_app
+from app.services.local_classifier import train_local_classifier
+from app.services.online_learning import OnlineLearner
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description='Train the Email Manager IA local classifier')
+    parser.add_argument('--limit', type=int, help='Train on the N most recently classified emails')
+    parser.add_argument('--holdout', type=float, default=0.1, help='Share of emails held out to report coverage and precision')
+    parser.add_argument('--online', action='store_true', help='Update the saved model with new labels instead of retraining')
+    args = parser.parse_args()
+    
+    app = create_app()
+    
+    with app.app_context():
+        if args.online:
+            update = OnlineLearner(app.config).update()
+            logger.info(f"Online update: {update}" if update else "No online update (no model, too few new labels or another update running)")
+            return
+        
+        model = train_local_classifier(app.config, holdout=args.holdout, limit=args.limit)
+        if model is None:
+            return
+        
+        logger.info(f"Saved local classifier to {app.config['LOCAL_CLASSIFIER_PATH']}: {model.metadata}")
+
+if __name__ == '__main__':
+    main()
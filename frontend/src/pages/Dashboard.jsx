@@ -127,6 +127,48 @@ const Dashboard = () => {
     setStats(getEmailStats(emails));
   }, [emails]);
 
+  const mapReceivedEmail = (email) => ({
+    id: email.id,
+    subject: email.subject,
+    sender: email.sender,
+    preview: email.body_preview,
+    urgency: email.urgency_category,
+    urgency_category: email.urgency_category, // Asegurar que ambos estén sincronizados
+    priority: email.priority_level,
+    isRead: email.is_read,
+    receivedAt: email.received_at,
+    hasAttachments: email.has_attachments,
+    ai_confidence: email.ai_confidence || 0,
+    aiReason: email.ai_classification_reason || '',
+    emailType: 'received'
+  });
+
+  // Classification runs in the background worker: reload the received emails
+  // once the queued jobs are done (or after about a minute)
+  const refreshWhenClassified = async () => {
+    for (let attempt = 0; attempt < 20; attempt++) {
+      await new Promise(resolve => setTimeout(resolve, 3000));
+      try {
+        const jobsResponse = await emailAPI.getClassificationJobs();
+        const queue = jobsResponse.data.queue || {};
+        if (!queue.queued && !queue.leased) break;
+      } catch (error) {
+        console.warn('Could not check classification queue:', error);
+        return;
+      }
+    }
+
+    try {
+      const response = await emailAPI.getEmails();
+      if (response.data && response.data.emails) {
+        setEmails(response.data.emails.map(mapReceivedEmail));
+        console.log('Reloaded emails after background classification');
+      }
+    } catch (error) {
+      console.warn('Failed to reload classified emails:', error);
+    }
+  };
+
   const loadEmails = async () => {
     setIsLoading(true);
     try {
@@ -143,19 +185,22 @@ const Dashboard = () => {
       console.log('Syncing emails from Microsoft Graph...');
       const syncResponse = await emailAPI.syncEmails({ count: 50, classify: true });
       console.log('Email sync completed:', syncResponse.data);
+      let queuedCount = syncResponse.data.queued || 0;
 
       // Also sync email read/unread statuses
       console.log('Syncing email statuses...');
       const statusResponse = await emailAPI.syncEmailStatuses({ limit: 100 });
       console.log('Status sync completed:', statusResponse.data);
+      queuedCount += statusResponse.data.queued || 0;
 
       // Auto-classify pending emails
       console.log('Checking for pending emails to classify...');
       try {
         const classifyResponse = await emailAPI.autoClassifyEmails();
-        console.log('Auto-classification completed:', classifyResponse.data);
-        if (classifyResponse.data.classified > 0) {
-          console.log(`✅ Auto-classified ${classifyResponse.data.classified} emails`);
+        console.log('Auto-classification queued:', classifyResponse.data);
+        if (classifyResponse.data.queued > 0) {
+          console.log(`✅ Queued ${classifyResponse.data.queued} emails for classification`);
+          queuedCount += classifyResponse.data.queued;
         } else {
           console.log('ℹ️  No pending emails to classify');
         }
@@ -167,8 +212,9 @@ const Dashboard = () => {
       // Retry classification for any emails that hit rate limit (production only)
       try {
         const retryResponse = await emailAPI.retryClassification();
-        if (retryResponse.data.classified > 0) {
-          console.log(`🔄 Retry classified ${retryResponse.data.classified} emails`);
+        if (retryResponse.data.total_retry > 0) {
+          console.log(`🔄 Requeued ${retryResponse.data.total_retry} emails for classification`);
+          queuedCount += retryResponse.data.total_retry;
         }
       } catch (retryError) {
         console.log('No emails need retry classification');
@@ -183,23 +229,12 @@ const Dashboard = () => {
       const sentResponse = await emailAPI.getSentEmails({ per_page: 50 });
 
       if (response.data && response.data.emails) {
-        const apiEmails = response.data.emails.map(email => ({
-          id: email.id,
-          subject: email.subject,
-          sender: email.sender,
-          preview: email.body_preview,
-          urgency: email.urgency_category,
-          urgency_category: email.urgency_category, // Asegurar que ambos estén sincronizados
-          priority: email.priority_level,
-          isRead: email.is_read,
-          receivedAt: email.received_at,
-          hasAttachments: email.has_attachments,
-          ai_confidence: email.ai_confidence || 0,
-          aiReason: email.ai_classification_reason || '',
-          emailType: 'received'
-        }));
+        const apiEmails = response.data.emails.map(mapReceivedEmail);
         setEmails(apiEmails);
         console.log(`Successfully loaded ${apiEmails.length} real emails`);
+        if (queuedCount > 0) {
+          refreshWhenClassified();
+        }
       } else {
         console.warn('No emails returned from API, using mock data');
         setEmails(generateMockEmails());
@@ -297,9 +332,23 @@ const Dashboard = () => {
     );
   };
 
-  const handleReply = (email) => {
+  const handleReply = async (email) => {
     setSelectedEmail(email);
     setReplyModalOpen(true);
+
+    // Synced emails only carry a preview: load the full body (fetched from Microsoft on first open)
+    if (email.emailType !== 'received' || email.body_content) return;
+    try {
+      const response = await emailAPI.getEmail(email.id);
+      const detail = response.data?.email;
+      if (detail?.body_content) {
+        setSelectedEmail(current =>
+          current?.id === email.id ? { ...current, body_content: detail.body_content } : current
+        );
+      }
+    } catch (error) {
+      console.warn('Could not load email body, showing preview:', error);
+    }
   };
 
   const handleSendReply = async (emailId, replyBody) => {
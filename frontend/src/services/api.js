@@ -78,6 +78,7 @@ export const emailAPI = {
   getAccounts: () => api.get('/emails/accounts'),
   connectAccount: (data) => api.post('/emails/connect', data),
   getEmails: (params) => api.get('/emails/', { params }),
+  getEmail: (emailId) => api.get(`/emails/${emailId}`),
   getEmailsByUrgency: (urgency) => api.get(`/emails/urgency/${urgency}`),
   markEmailAsRead: (emailId) => api.post(`/emails/${emailId}/mark-read`),
   syncEmails: (data) => api.post('/emails/sync', data),
@@ -87,6 +88,7 @@ export const emailAPI = {
   getSentEmails: (params) => api.get('/emails/sent', { params }),
   autoClassifyEmails: () => api.post('/emails/auto-classify'),
   retryClassification: () => api.post('/emails/classify-retry'),
+  getClassificationJobs: () => api.get('/emails/jobs'),
 };
 
 export const microsoftAPI = {